@@ -0,0 +1,5 @@
+# Carga las variables de entorno desde el archivo `.env` una sola vez, antes de que
+# cualquier módulo de la aplicación lea su configuración con os.getenv.
+from dotenv import load_dotenv
+
+load_dotenv()
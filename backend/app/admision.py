@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+from fastapi.responses import JSONResponse
+
+from .auth import sujeto_del_token
+from .db import engine, engine_lectura, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# ADMISION_ACTIVA: 0 desactiva el control de admisión.
+# ADMISION_CONCURRENCIA: peticiones que se atienden a la vez (por defecto, las conexiones del pool).
+# ADMISION_RESERVA_ESCRITURAS: de esos lugares, cuántos quedan solo para POST/PUT/PATCH/DELETE;
+#   un pico de listados o reportes no puede dejar sin conexión a crear_factura.
+# ADMISION_LIMITES_RUTA: "prefijo=n,..." concurrencia máxima de las rutas pesadas (reportes, exportaciones).
+# ADMISION_COLA_MAXIMA: peticiones que pueden esperar lugar en cada límite; con más se responde 503 enseguida.
+# ADMISION_ESPERA_MAXIMA: segundos que una lectura espera lugar antes del 503 (una escritura, el doble).
+# ADMISION_COLA_POOL: con esta cantidad de pedidos esperando una conexión del pool, las lecturas
+#   reciben 503 sin entrar (las escrituras siguen entrando por su reserva).
+# ADMISION_TASA / ADMISION_RAFAGA: fichas por segundo y capacidad de la cubeta de cada usuario
+#   (o de cada IP, sin token válido). Sin fichas se responde 429.
+# ADMISION_COSTO_PESADA: fichas que consume una petición a una ruta con límite propio.
+# ADMISION_ALMACEN: ruta de un SQLite local donde guardar las cubetas para que las compartan
+#   los workers de la máquina; vacío = en memoria de cada proceso.
+ADMISION_ACTIVA = os.getenv("ADMISION_ACTIVA", "1") == "1"
+ADMISION_CONCURRENCIA = int(os.getenv("ADMISION_CONCURRENCIA", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+ADMISION_RESERVA_ESCRITURAS = int(os.getenv("ADMISION_RESERVA_ESCRITURAS", str(max(1, ADMISION_CONCURRENCIA // 4))))
+ADMISION_LIMITES_RUTA = os.getenv(
+    "ADMISION_LIMITES_RUTA",
+    "/exportar=2,/analitica=2,/facturas/reporte=2,/facturas/pdf/zip=2,/facturas/completas=4,"
+    "/productos/bulk=1,/clientes/bulk=1"
+)
+ADMISION_COLA_MAXIMA = int(os.getenv("ADMISION_COLA_MAXIMA", "50"))
+ADMISION_ESPERA_MAXIMA = float(os.getenv("ADMISION_ESPERA_MAXIMA", "2"))
+ADMISION_COLA_POOL = int(os.getenv("ADMISION_COLA_POOL", str(DB_POOL_SIZE)))
+ADMISION_TASA = float(os.getenv("ADMISION_TASA", "20"))
+ADMISION_RAFAGA = float(os.getenv("ADMISION_RAFAGA", "40"))
+ADMISION_COSTO_PESADA = float(os.getenv("ADMISION_COSTO_PESADA", "5"))
+ADMISION_ALMACEN = os.getenv("ADMISION_ALMACEN", "")
+
+METODOS_ESCRITURA = ("POST", "PUT", "PATCH", "DELETE")
+# Rutas que no pasan por el control: disponibilidad, métricas, documentación y el
+# stream de /cambios (una conexión larga que no ocupa el pool mientras espera).
+RUTAS_EXENTAS = ("/listo", "/metricas", "/metrics", "/cambios", "/docs", "/redoc", "/openapi.json")
+
+
+def _leer_limites(texto: str) -> dict[str, int]:
+    limites = {}
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        prefijo, _, cantidad = parte.partition("=")
+        limites[prefijo.strip()] = int(cantidad)
+    return limites
+
+
+class Limite:
+    """
+    Semáforo que cuenta quién espera: en vez de encolar sin fin, rechaza cuando
+    la cola está llena o cuando la espera supera el máximo.
+    """
+
+    def __init__(self, nombre: str, capacidad: int, cola_maxima: int = ADMISION_COLA_MAXIMA):
+        self.nombre = nombre
+        self.capacidad = max(1, capacidad)
+        self.cola_maxima = cola_maxima
+        self._semaforo: asyncio.Semaphore | None = None
+        self.en_curso = 0
+        self.esperando = 0
+
+    async def entrar(self, espera_maxima: float) -> str | None:
+        """None si consiguió lugar; si no, el motivo: "cola" (llena) o "espera" (venció)."""
+        # Se crea de forma perezosa, dentro del event loop que atiende las peticiones.
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.capacidad)
+        if self._semaforo.locked() and self.esperando >= self.cola_maxima:
+            return "cola"
+        self.esperando += 1
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), espera_maxima)
+        except asyncio.TimeoutError:
+            return "espera"
+        finally:
+            self.esperando -= 1
+        self.en_curso += 1
+        return None
+
+    def salir(self) -> None:
+        self.en_curso -= 1
+        self._semaforo.release()
+
+    def metricas(self) -> dict:
+        return {"capacidad": self.capacidad, "en_curso": self.en_curso, "esperando": self.esperando}
+
+
+# --- Cubetas de fichas (límite de tasa por usuario) ---
+
+class CubetasEnMemoria:
+    """Una cubeta por clave en un dict LRU; cada proceso lleva la suya."""
+
+    def __init__(self, tasa: float, capacidad: float, tamanio_maximo: int = 10000):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.tamanio_maximo = tamanio_maximo
+        self._cubetas: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def abrir(self) -> None:
+        pass
+
+    def cerrar(self) -> None:
+        pass
+
+    async def consumir(self, clave: str, costo: float) -> float:
+        """Descuenta `costo` fichas. Devuelve 0 si alcanzaron, o los segundos hasta que alcancen."""
+        ahora = time.monotonic()
+        fichas, antes = self._cubetas.get(clave, (self.capacidad, ahora))
+        fichas = min(self.capacidad, fichas + (ahora - antes) * self.tasa)
+        faltan = costo - fichas
+        self._cubetas[clave] = (fichas if faltan > 0 else fichas - costo, ahora)
+        self._cubetas.move_to_end(clave)
+        while len(self._cubetas) > self.tamanio_maximo:
+            self._cubetas.popitem(last=False)
+        return faltan / self.tasa if faltan > 0 else 0.0
+
+    def metricas(self) -> dict:
+        return {"almacen": "memoria", "cubetas": len(self._cubetas)}
+
+
+class CubetasSQLite:
+    """
+    Las mismas cubetas en un SQLite local (no en MySQL), para que los workers
+    de la máquina compartan el límite de cada usuario. Si el archivo no
+    responde, la petición se admite: el límite de tasa no debe tirar la API.
+    """
+
+    PURGAR_CADA = 1000  # consumos entre dos limpiezas de cubetas llenas
+
+    def __init__(self, ruta: str, tasa: float, capacidad: float):
+        self.ruta = ruta
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._conexion: sqlite3.Connection | None = None
+        self._lock = Lock()
+        self._consumos = 0
+        self.errores = 0
+
+    def abrir(self) -> None:
+        self._conexion = sqlite3.connect(self.ruta, timeout=1, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS cubetas (
+                clave TEXT PRIMARY KEY,
+                fichas REAL NOT NULL,
+                actualizado REAL NOT NULL
+            )
+        """)
+
+    def cerrar(self) -> None:
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+    def _consumir(self, clave: str, costo: float) -> float:
+        with self._lock:
+            # Reloj de pared: el monotónico no es comparable entre procesos.
+            ahora = time.time()
+            conexion = self._conexion
+            # BEGIN IMMEDIATE toma el lock de escritura: leer y descontar es atómico entre workers.
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                fila = conexion.execute("SELECT fichas, actualizado FROM cubetas WHERE clave = ?", (clave,)).fetchone()
+                fichas, antes = fila if fila else (self.capacidad, ahora)
+                fichas = min(self.capacidad, fichas + max(0.0, ahora - antes) * self.tasa)
+                faltan = costo - fichas
+                conexion.execute(
+                    "INSERT OR REPLACE INTO cubetas (clave, fichas, actualizado) VALUES (?, ?, ?)",
+                    (clave, fichas if faltan > 0 else fichas - costo, ahora)
+                )
+                self._consumos += 1
+                if self._consumos % self.PURGAR_CADA == 0:
+                    # Una cubeta que ya se habría llenado equivale a no tenerla.
+                    conexion.execute("DELETE FROM cubetas WHERE actualizado < ?", (ahora - self.capacidad / self.tasa,))
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+        return faltan / self.tasa if faltan > 0 else 0.0
+
+    async def consumir(self, clave: str, costo: float) -> float:
+        # sqlite3 es bloqueante: se ejecuta en un hilo para no frenar el event loop.
+        try:
+            return await asyncio.to_thread(self._consumir, clave, costo)
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló el almacén de cubetas %s; se admite la petición", self.ruta, exc_info=True)
+            return 0.0
+
+    def metricas(self) -> dict:
+        return {"almacen": "sqlite", "ruta": self.ruta, "errores": self.errores}
+
+
+# --- Control de admisión ---
+
+@dataclass
+class Rechazo:
+    estado: int  # 429 (el usuario superó su tasa) o 503 (el servidor está saturado)
+    motivo: str
+    detalle: str
+    reintentar: int  # segundos para la cabecera Retry-After
+
+    def respuesta(self) -> JSONResponse:
+        return JSONResponse(status_code=self.estado, content={"detail": self.detalle},
+                            headers={"Retry-After": str(self.reintentar)})
+
+
+class ControlAdmision:
+    """
+    Decide, antes de que la petición llegue al handler, si se atiende ahora,
+    espera un lugar o se rechaza:
+
+    1. Límite de tasa por usuario (cubeta de fichas): 429 con Retry-After.
+    2. Si el pool ya tiene una cola de pedidos de conexión, las lecturas se
+       rechazan con 503 sin llegar a pedir la suya.
+    3. Límites de concurrencia: uno por ruta pesada, uno para lecturas (menor
+       que el total, así queda una reserva para escrituras) y el total. Si no
+       hay lugar en ADMISION_ESPERA_MAXIMA segundos, 503.
+    La concurrencia es por proceso, como el pool que protege; las cubetas se
+    pueden compartir entre workers con ADMISION_ALMACEN.
+    """
+
+    def __init__(self, concurrencia: int = ADMISION_CONCURRENCIA, reserva: int = ADMISION_RESERVA_ESCRITURAS,
+                 limites_ruta: str = ADMISION_LIMITES_RUTA, almacen: str = ADMISION_ALMACEN):
+        self.total = Limite("total", concurrencia)
+        self.lecturas = Limite("lecturas", concurrencia - min(reserva, concurrencia - 1))
+        # De más largo a más corto: gana el prefijo más específico.
+        self.rutas = {
+            prefijo: Limite(prefijo, cantidad)
+            for prefijo, cantidad in sorted(_leer_limites(limites_ruta).items(), key=lambda p: -len(p[0]))
+        }
+        self.cubetas = (CubetasSQLite(almacen, ADMISION_TASA, ADMISION_RAFAGA) if almacen
+                        else CubetasEnMemoria(ADMISION_TASA, ADMISION_RAFAGA))
+        self.admitidas = 0
+        self.rechazos: Counter = Counter()
+
+    def abrir(self) -> None:
+        self.cubetas.abrir()
+
+    def cerrar(self) -> None:
+        self.cubetas.cerrar()
+
+    def _limite_ruta(self, ruta: str) -> Limite | None:
+        for prefijo, limite in self.rutas.items():
+            if ruta.startswith(prefijo):
+                return limite
+        return None
+
+    @staticmethod
+    def _pool_saturado() -> bool:
+        esperando = engine.pool.esperando
+        if engine_lectura is not engine:
+            esperando = max(esperando, engine_lectura.pool.esperando)
+        return esperando >= ADMISION_COLA_POOL
+
+    def _rechazar(self, estado: int, motivo: str, detalle: str, reintentar: float = 1) -> Rechazo:
+        self.rechazos[motivo] += 1
+        return Rechazo(estado, motivo, detalle, max(1, math.ceil(reintentar)))
+
+    async def admitir(self, metodo: str, ruta: str, clave: str) -> tuple[list[Limite], Rechazo | None]:
+        """Devuelve los límites tomados (a liberar con `liberar`) o el rechazo."""
+        escritura = metodo in METODOS_ESCRITURA
+        limite_ruta = self._limite_ruta(ruta)
+
+        # 1. Tasa del usuario. Las rutas pesadas consumen más fichas.
+        costo = min(ADMISION_COSTO_PESADA if limite_ruta else 1.0, ADMISION_RAFAGA)
+        espera = await self.cubetas.consumir(clave, costo)
+        if espera > 0:
+            return [], self._rechazar(429, "tasa", "Demasiadas peticiones; reintente más tarde", espera)
+
+        # 2. Pool con cola: una lectura más solo la alargaría.
+        if not escritura and self._pool_saturado():
+            return [], self._rechazar(503, "pool", "El servidor está saturado; reintente en unos segundos")
+
+        # 3. Lugares de concurrencia, del más específico al total.
+        limites = [l for l in (limite_ruta, None if escritura else self.lecturas, self.total) if l is not None]
+        espera_maxima = ADMISION_ESPERA_MAXIMA * (2 if escritura else 1)
+        tomados = []
+        for limite in limites:
+            motivo = await limite.entrar(espera_maxima)
+            if motivo is not None:
+                self.liberar(tomados)
+                return [], self._rechazar(503, motivo, "El servidor está saturado; reintente en unos segundos")
+            tomados.append(limite)
+        self.admitidas += 1
+        return tomados, None
+
+    @staticmethod
+    def liberar(tomados: list[Limite]) -> None:
+        for limite in reversed(tomados):
+            limite.salir()
+
+    def metricas(self) -> dict:
+        return {
+            "activa": ADMISION_ACTIVA,
+            "admitidas": self.admitidas,
+            "rechazos": dict(self.rechazos),
+            "concurrencia": {
+                "total": self.total.metricas(),
+                "lecturas": self.lecturas.metricas(),
+                **{prefijo: limite.metricas() for prefijo, limite in self.rutas.items()},
+            },
+            "tasa": {"fichas_por_segundo": ADMISION_TASA, "rafaga": ADMISION_RAFAGA, **self.cubetas.metricas()},
+        }
+
+
+control_admision = ControlAdmision()
+
+
+def _clave(scope) -> str:
+    # El mismo `sub` que usa get_current_user, validando la firma pero sin ir a la base.
+    for nombre, valor in scope.get("headers", []):
+        if nombre == b"authorization":
+            esquema, _, token = valor.decode("latin-1").partition(" ")
+            if esquema.lower() == "bearer":
+                sujeto = sujeto_del_token(token)
+                if sujeto:
+                    return f"usuario:{sujeto}"
+            break
+    cliente = scope.get("client")
+    return f"ip:{cliente[0] if cliente else 'desconocida'}"
+
+
+class MiddlewareAdmision:
+    """Aplica `control_admision` a cada petición HTTP que no esté en RUTAS_EXENTAS."""
+
+    def __init__(self, app, control: ControlAdmision = control_admision):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISION_ACTIVA or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        ruta = scope["path"]
+        if ruta == "/" or ruta.startswith(RUTAS_EXENTAS):
+            return await self.app(scope, receive, send)
+
+        tomados, rechazo = await self.control.admitir(scope["method"], ruta, _clave(scope))
+        if rechazo is not None:
+            return await rechazo.respuesta()(scope, receive, send)
+        # Los lugares se sostienen hasta terminar de enviar la respuesta (incluye los streams).
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.liberar(tomados)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+from datetime import date
+
+from sqlalchemy import select, delete, func, literal, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .db import AsyncSessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se reconcilian los agregados contra `detalle` (0 = nunca).
+AGREGADOS_RECONCILIAR_CADA = float(os.getenv("AGREGADOS_RECONCILIAR_CADA", "3600"))
+
+ventas = models.VentaDiariaCliente.__table__
+
+
+def _upsert_desde(db: AsyncSession, consulta):
+    """
+    INSERT ... SELECT que suma al total existente si la fila (cliente, día) ya existe.
+    Usa ON DUPLICATE KEY UPDATE en MySQL y ON CONFLICT en SQLite.
+    """
+    columnas = ["cliente_id", "dia", "total"]
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite_insert(ventas).from_select(columnas, consulta)
+        return stmt.on_conflict_do_update(
+            index_elements=["cliente_id", "dia"],
+            set_={"total": ventas.c.total + stmt.excluded.total}
+        )
+    stmt = mysql_insert(ventas).from_select(columnas, consulta)
+    return stmt.on_duplicate_key_update(total=ventas.c.total + stmt.inserted.total)
+
+
+def consulta_ventas_por_cliente(desde: date | None = None, hasta: date | None = None, top: int | None = None):
+    """Total comprado por cliente entre `desde` y `hasta` (inclusive), de mayor a menor."""
+    v, c = models.VentaDiariaCliente, models.Cliente
+    total_comprado = func.sum(v.total).label("total_comprado")
+    stmt = (
+        select(v.cliente_id, c.nombre, c.apellido, total_comprado)
+        .select_from(v)
+        .join(c, c.id == v.cliente_id)
+        # Agrupar por la columna de `v` hace que el plan recorra los totales por su
+        # clave primaria y busque cada cliente por id (agrupando por `c.id`, SQLite
+        # recorría todo `clientes` por uno de sus índices).
+        .group_by(v.cliente_id, c.nombre, c.apellido)
+        .order_by(total_comprado.desc())
+    )
+    if desde:
+        stmt = stmt.where(v.dia >= desde)
+    if hasta:
+        stmt = stmt.where(v.dia <= hasta)
+    if top:
+        stmt = stmt.limit(top)
+    return stmt
+
+
+async def sumar_venta(db: AsyncSession, factura_id: int, importe) -> None:
+    """
+    Suma `importe` al total diario del cliente de la factura.
+    Se ejecuta dentro de la transacción del llamador, junto con el INSERT en `detalle`.
+    """
+    consulta = select(
+        models.Factura.cliente_id,
+        func.date(models.Factura.fecha),
+        literal(importe, ventas.c.total.type)
+    ).where(models.Factura.id == factura_id)
+    await db.execute(_upsert_desde(db, consulta))
+
+
+async def restar_detalles(db: AsyncSession, condicion) -> None:
+    """
+    Descuenta de los totales diarios los ítems de `detalle` que cumplen `condicion`.
+    Se ejecuta antes del DELETE de esos ítems, en la misma transacción.
+    """
+    dia = func.date(models.Factura.fecha)
+    consulta = (
+        select(
+            models.Factura.cliente_id,
+            dia,
+            -func.sum(models.Detalle.cantidad * models.Detalle.precio)
+        )
+        .join(models.Detalle, models.Detalle.factura_id == models.Factura.id)
+        .where(condicion)
+        .group_by(models.Factura.cliente_id, dia)
+    )
+    await db.execute(_upsert_desde(db, consulta))
+
+
+async def reconciliar(session_factory=AsyncSessionLocal, desde: date | None = None) -> None:
+    """
+    Recalcula los totales diarios a partir de `detalle` (desde una fecha o completo)
+    para corregir cualquier desvío de la actualización incremental.
+    """
+    dia = func.date(models.Factura.fecha)
+    consulta = (
+        select(
+            models.Factura.cliente_id,
+            dia,
+            func.sum(models.Detalle.cantidad * models.Detalle.precio)
+        )
+        .join(models.Detalle, models.Detalle.factura_id == models.Factura.id)
+        .group_by(models.Factura.cliente_id, dia)
+    )
+    borrar = delete(ventas)
+    if desde is not None:
+        consulta = consulta.where(models.Factura.fecha >= desde)
+        borrar = borrar.where(ventas.c.dia >= desde)
+
+    async with session_factory() as db:
+        try:
+            await db.execute(borrar)
+            await db.execute(_upsert_desde(db, consulta))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def crear_tabla() -> bool:
+    """Crea la tabla de agregados si todavía no existe. Devuelve True si la creó."""
+    async with engine.begin() as conn:
+        existe = await conn.run_sync(lambda c: inspect(c).has_table(ventas.name))
+        if not existe:
+            await conn.run_sync(ventas.create)
+    return not existe
+
+
+async def tarea_reconciliacion() -> None:
+    """Tarea periódica: reconcilia los agregados cada AGREGADOS_RECONCILIAR_CADA segundos."""
+    while True:
+        await asyncio.sleep(AGREGADOS_RECONCILIAR_CADA)
+        try:
+            await reconciliar()
+        except Exception:
+            logger.exception("Error al reconciliar los agregados de ventas")
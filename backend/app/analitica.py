@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import chain
+
+from sqlalchemy import select, func, cast, Integer
+
+from . import models
+
+# numpy es opcional: sin él, los endpoints de /analitica responden 503.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# ANALITICA_LOTE: filas de `detalle` que se leen y convierten a arreglos por tanda.
+# ANALITICA_REFRESCO: segundos mínimos entre dos lecturas incrementales de filas nuevas.
+# ANALITICA_MARGEN: facturas recientes que se vuelven a leer en cada refresco, por si
+#   una transacción con un ID menor confirmó después que otra con un ID mayor.
+# ANALITICA_CACHE: resultados guardados (por combinación de agrupación y ventana de fechas).
+ANALITICA_LOTE = int(os.getenv("ANALITICA_LOTE", "100000"))
+ANALITICA_REFRESCO = float(os.getenv("ANALITICA_REFRESCO", "5"))
+ANALITICA_MARGEN = int(os.getenv("ANALITICA_MARGEN", "1000"))
+ANALITICA_CACHE = int(os.getenv("ANALITICA_CACHE", "256"))
+
+DIMENSIONES = ("total", "producto", "cliente", "creador")
+PERIODOS = ("total", "dia", "semana", "mes")
+
+# Columnas en memoria, en el orden en que las devuelve `consulta_detalle`.
+# Los importes van en centavos (enteros): las sumas son exactas.
+COLUMNAS = ("factura_id", "dia", "cliente", "creador", "producto", "cantidad", "importe")
+_TIPOS = {"importe": "int64", "factura_id": "int64"}  # el resto entra en int32
+
+EPOCA = date(1970, 1, 1)
+# Días entre el 0000-01-01 de TO_DAYS() de MySQL y el 1970-01-01.
+_TO_DAYS_EPOCA = 719528
+# Día juliano del 1970-01-01.
+_JULIANO_EPOCA = 2440587.5
+
+
+def consulta_detalle(dialecto: str, desde_factura: int = 0):
+    """Ítems con su día (días desde 1970), cliente, creador e importe en centavos; solo enteros."""
+    d, f = models.Detalle, models.Factura
+    if dialecto == "sqlite":
+        dia = cast(func.julianday(func.date(f.fecha)) - _JULIANO_EPOCA, Integer)
+    else:
+        dia = func.to_days(f.fecha) - _TO_DAYS_EPOCA
+    return (
+        select(
+            d.factura_id,
+            dia,
+            f.cliente_id,
+            func.coalesce(f.creado_por_usuario_id, 0),
+            d.producto_id,
+            d.cantidad,
+            d.cantidad * cast(func.round(d.precio * 100), Integer),
+        )
+        .join(f, f.id == d.factura_id)
+        .where(d.factura_id > desde_factura)
+        .order_by(d.factura_id)
+    )
+
+
+def _a_columnas(bloque) -> dict:
+    return {c: bloque[:, i].astype(_TIPOS.get(c, "int32")) for i, c in enumerate(COLUMNAS)}
+
+
+def _vacias() -> dict:
+    return {c: np.empty(0, dtype=_TIPOS.get(c, "int32")) for c in COLUMNAS}
+
+
+def _periodos(dias, periodo: str):
+    """Número de período de cada día y función que da la fecha en que empieza cada período."""
+    if periodo == "dia":
+        return dias.astype("int64"), lambda p: EPOCA + timedelta(days=int(p))
+    if periodo == "semana":
+        # El 1970-01-01 fue jueves: con +3 las semanas empiezan el lunes.
+        return (dias.astype("int64") + 3) // 7, lambda p: EPOCA + timedelta(days=int(p) * 7 - 3)
+    if periodo == "mes":
+        meses = dias.astype("datetime64[D]").astype("datetime64[M]").astype("int64")
+        return meses, lambda p: date(1970 + int(p) // 12, int(p) % 12 + 1, 1)
+    return np.zeros(len(dias), dtype="int64"), lambda p: None
+
+
+def _centavos(valor) -> Decimal:
+    return Decimal(int(round(valor))).scaleb(-2)
+
+
+def agrupar(columnas: dict, costos, por: str, periodo: str, desde: int | None = None,
+            hasta: int | None = None, top: int | None = None) -> list[dict]:
+    """
+    Unidades, líneas, ventas, costo y margen agrupados por período y dimensión,
+    con operaciones vectorizadas sobre las columnas. `desde`/`hasta` son días
+    desde 1970 (inclusive); `costos` es el precio de compra en centavos por ID
+    de producto. Con `top`, solo los N de mayor venta de cada período.
+    """
+    # 1. Ventana de fechas.
+    dias = columnas["dia"]
+    filtro = None
+    if desde is not None:
+        filtro = dias >= desde
+    if hasta is not None:
+        filtro = dias <= hasta if filtro is None else filtro & (dias <= hasta)
+    elegir = (lambda a: a[filtro]) if filtro is not None else (lambda a: a)
+    dias = elegir(dias)
+    if len(dias) == 0:
+        return []
+    cantidad = elegir(columnas["cantidad"]).astype("float64")
+    importe = elegir(columnas["importe"]).astype("float64")
+    producto = elegir(columnas["producto"])
+
+    # 2. Clave de grupo: período y dimensión combinados en un único entero.
+    numero_periodo, inicio_periodo = _periodos(dias, periodo)
+    base_periodo = int(numero_periodo.min())
+    dimension = elegir(columnas[por]).astype("int64") if por != "total" else np.zeros(len(dias), dtype="int64")
+    ancho = int(dimension.max()) + 1
+    clave = (numero_periodo - base_periodo) * ancho + dimension
+
+    # 3. Con claves densas alcanza con bincount (lineal); si no, se numeran con unique.
+    tamanio = int(clave.max()) + 1
+    if tamanio <= max(4 * len(clave), 1 << 20):
+        lineas = np.bincount(clave, minlength=tamanio)
+        grupos = np.flatnonzero(lineas)
+        indice, lineas = clave, lineas[grupos]
+        sumar = lambda pesos: np.bincount(indice, weights=pesos, minlength=tamanio)[grupos]
+    else:
+        grupos, indice = np.unique(clave, return_inverse=True)
+        lineas = np.bincount(indice)
+        sumar = lambda pesos: np.bincount(indice, weights=pesos, minlength=len(grupos))
+    unidades = sumar(cantidad)
+    ventas = sumar(importe)
+    costo = sumar(cantidad * costos[producto])
+
+    # 4. Orden: por período y, dentro de cada uno, de mayor a menor venta.
+    periodo_grupo = grupos // ancho
+    orden = np.lexsort((-ventas, periodo_grupo))
+    if top is not None:
+        ordenados = periodo_grupo[orden]
+        inicios = np.flatnonzero(np.r_[True, ordenados[1:] != ordenados[:-1]])
+        posicion = np.arange(len(orden)) - np.repeat(inicios, np.diff(np.r_[inicios, len(orden)]))
+        orden = orden[posicion < top]
+
+    filas = []
+    for i in orden.tolist():
+        # Escalares de Python: los de numpy no los serializa orjson.
+        venta, gasto = float(ventas[i]), float(costo[i])
+        inicio = inicio_periodo(periodo_grupo[i] + base_periodo)
+        filas.append({
+            "periodo": inicio.isoformat() if inicio else None,
+            "id": int(grupos[i] % ancho) if por != "total" else None,
+            "unidades": int(unidades[i]),
+            "lineas": int(lineas[i]),
+            "ventas": _centavos(venta),
+            "costo": _centavos(gasto),
+            "margen": _centavos(venta - gasto),
+            "margen_pct": round((venta - gasto) / venta * 100, 2) if venta else None,
+        })
+    return filas
+
+
+class VentasColumnares:
+    """
+    Copia en memoria de `detalle` (con día, cliente y creador de su factura) en
+    arreglos de numpy, para calcular los reportes de ventas sin recorrer la tabla.
+
+    - La primera consulta la carga completa, leyendo por tandas con un cursor del
+      lado del servidor (la memoria de la lectura no crece con la tabla).
+    - Después se leen solo las facturas nuevas (ID mayor al último visto), como
+      mucho cada ANALITICA_REFRESCO segundos.
+    - Los cambios sobre filas ya cargadas (ítems agregados a una factura ya leída,
+      ver `invalidar_factura()`; borrados) llaman a `invalidar()`: se recarga todo
+      en segundo plano mientras se siguen respondiendo los datos anteriores.
+    - El costo sale del precio de compra actual de cada producto (`detalle` no lo
+      guarda); se vuelve a leer con `invalidar_costos()`.
+    Los resultados se guardan por consulta; al llegar filas nuevas solo se
+    descartan los que incluyen los días de esas filas.
+    """
+
+    def __init__(self, tamanio_cache: int = ANALITICA_CACHE):
+        self._columnas: dict | None = None
+        self._costos = None
+        self._ultima_factura = 0
+        self._recientes = None  # IDs de factura ya cargados dentro del margen
+        self._invalidado = False
+        self._costos_invalidados = True
+        self._refrescado = 0.0
+        self._lock = asyncio.Lock()
+        self._recarga: asyncio.Task | None = None
+        self._resultados: OrderedDict = OrderedDict()
+        self._tamanio_cache = tamanio_cache
+        self.cargas_completas = 0
+        self.refrescos = 0
+        self.aciertos = 0
+        self.segundos_ultima_carga = 0.0
+
+    def invalidar(self) -> None:
+        """Cambiaron filas ya cargadas: la próxima consulta dispara una recarga completa."""
+        self._invalidado = True
+
+    def invalidar_factura(self, factura_id: int) -> None:
+        """
+        Se agregaron ítems a una factura. Solo hace falta recargar si ya estaba
+        cargada: si no, el refresco incremental la lee completa.
+        """
+        if self._lock.locked() or (self._recarga is not None and not self._recarga.done()):
+            # Hay una lectura en curso que pudo ver la factura a medias.
+            self._invalidado = True
+        elif self._columnas is not None and (factura_id <= self._ultima_factura - ANALITICA_MARGEN
+                                             or factura_id in self._recientes):
+            self._invalidado = True
+
+    def invalidar_costos(self) -> None:
+        self._costos_invalidados = True
+        self._resultados.clear()
+
+    # --- Lectura desde la base ---
+
+    @staticmethod
+    async def _leer(session_factory, desde_factura: int) -> dict:
+        bloques = []
+        async with session_factory() as db:
+            stmt = consulta_detalle(db.get_bind().dialect.name, desde_factura)
+            result = await db.stream(stmt.execution_options(yield_per=ANALITICA_LOTE))
+            async for tanda in result.partitions():
+                # Solo enteros: se copian directo a un arreglo sin pasar por objetos intermedios.
+                plano = np.fromiter(chain.from_iterable(tanda), dtype="int64", count=len(tanda) * len(COLUMNAS))
+                bloques.append(_a_columnas(plano.reshape(-1, len(COLUMNAS))))
+        if not bloques:
+            return _vacias()
+        return {c: np.concatenate([b[c] for b in bloques]) for c in COLUMNAS}
+
+    async def _leer_costos(self, session_factory) -> None:
+        p = models.Producto
+        async with session_factory() as db:
+            filas = (await db.execute(select(p.id, cast(func.round(p.precio_compra * 100), Integer)))).all()
+        costos = np.zeros(max((f[0] for f in filas), default=0) + 1, dtype="float64")
+        for id_, centavos in filas:
+            costos[id_] = centavos
+        self._costos = costos
+        self._costos_invalidados = False
+
+    def reemplazar(self, columnas: dict, costos=None) -> None:
+        """Reemplaza todos los datos (carga completa, o arreglos armados a mano en los benchmarks)."""
+        self._columnas = columnas
+        if costos is not None:
+            self._costos = costos
+            self._costos_invalidados = False
+        facturas = columnas["factura_id"]
+        self._ultima_factura = int(facturas.max()) if len(facturas) else 0
+        self._recientes = np.unique(facturas[facturas > self._ultima_factura - ANALITICA_MARGEN])
+        self._resultados.clear()
+
+    def _agregar(self, nuevas: dict) -> None:
+        # Las facturas del margen que ya estaban cargadas no se vuelven a sumar.
+        repetidas = np.isin(nuevas["factura_id"], self._recientes)
+        if repetidas.any():
+            nuevas = {c: a[~repetidas] for c, a in nuevas.items()}
+        if len(nuevas["dia"]) == 0:
+            return
+        self._columnas = {c: np.concatenate([self._columnas[c], nuevas[c]]) for c in COLUMNAS}
+        self._ultima_factura = max(self._ultima_factura, int(nuevas["factura_id"].max()))
+        recientes = np.concatenate([self._recientes, np.unique(nuevas["factura_id"])])
+        self._recientes = np.unique(recientes[recientes > self._ultima_factura - ANALITICA_MARGEN])
+        # Solo dejan de valer los resultados cuya ventana incluye los días nuevos.
+        primer_dia = int(nuevas["dia"].min())
+        for clave in [k for k in self._resultados if k[3] is None or k[3] >= primer_dia]:
+            del self._resultados[clave]
+        if int(nuevas["producto"].max()) >= len(self._costos):
+            self._costos_invalidados = True
+
+    async def _leer_todo(self, session_factory) -> tuple[dict, float]:
+        inicio = time.perf_counter()
+        self._invalidado = False
+        columnas = await self._leer(session_factory, 0)
+        await self._leer_costos(session_factory)
+        return columnas, inicio
+
+    def _instalar(self, columnas: dict, inicio: float) -> None:
+        self.reemplazar(columnas)
+        self._refrescado = time.monotonic()
+        self.cargas_completas += 1
+        self.segundos_ultima_carga = round(time.perf_counter() - inicio, 3)
+        logger.info("Analítica cargada: %d ítems en %.1f s", len(columnas["dia"]), self.segundos_ultima_carga)
+
+    async def cargar(self, session_factory) -> None:
+        self._instalar(*await self._leer_todo(session_factory))
+
+    async def refrescar(self, session_factory) -> None:
+        """Suma las filas de las facturas nuevas (y las del margen que todavía no estaban)."""
+        nuevas = await self._leer(session_factory, max(0, self._ultima_factura - ANALITICA_MARGEN))
+        self._agregar(nuevas)
+        self._refrescado = time.monotonic()
+        self.refrescos += 1
+
+    async def _recargar(self, session_factory) -> None:
+        try:
+            leido = await self._leer_todo(session_factory)
+            # Se reemplaza con el lock del refresco: si no, un refresco que leyó con
+            # los datos viejos sumaría sus filas otra vez sobre la carga nueva.
+            async with self._lock:
+                self._instalar(*leido)
+        except Exception:
+            self._invalidado = True
+            logger.exception("Falló la recarga de la analítica de ventas")
+
+    async def asegurar_actualizado(self, session_factory) -> None:
+        async with self._lock:
+            if self._columnas is None:
+                await self.cargar(session_factory)
+                return
+            if self._invalidado and (self._recarga is None or self._recarga.done()):
+                # Se recarga en segundo plano; mientras tanto se responde con lo cargado.
+                self._invalidado = False
+                self._recarga = asyncio.create_task(self._recargar(session_factory))
+            if time.monotonic() - self._refrescado >= ANALITICA_REFRESCO:
+                await self.refrescar(session_factory)
+            if self._costos_invalidados:
+                await self._leer_costos(session_factory)
+                self._resultados.clear()
+
+    # --- Consultas ---
+
+    def resumir(self, por: str, periodo: str, desde: date | None = None, hasta: date | None = None,
+                top: int | None = None) -> list[dict]:
+        desde_dia = (desde - EPOCA).days if desde else None
+        hasta_dia = (hasta - EPOCA).days if hasta else None
+        clave = (por, periodo, desde_dia, hasta_dia, top)
+        guardado = self._resultados.get(clave)
+        if guardado is not None:
+            self._resultados.move_to_end(clave)
+            self.aciertos += 1
+            return guardado
+        filas = agrupar(self._columnas, self._costos, por, periodo, desde_dia, hasta_dia, top)
+        self._resultados[clave] = filas
+        while len(self._resultados) > self._tamanio_cache:
+            self._resultados.popitem(last=False)
+        return filas
+
+    def metricas(self) -> dict:
+        filas = len(self._columnas["dia"]) if self._columnas is not None else 0
+        return {
+            "disponible": np is not None,
+            "filas": filas,
+            "memoria_mb": round(sum(a.nbytes for a in self._columnas.values()) / 2**20, 1) if filas else 0.0,
+            "ultima_factura": self._ultima_factura,
+            "cargas_completas": self.cargas_completas,
+            "segundos_ultima_carga": self.segundos_ultima_carga,
+            "refrescos": self.refrescos,
+            "resultados_en_cache": len(self._resultados),
+            "aciertos": self.aciertos,
+        }
+
+
+ventas = VentasColumnares()
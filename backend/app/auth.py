@@ -1,31 +1,55 @@
 import os
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 
-# --- 1. CAMBIO: Importamos argon2 directamente ---
-from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
-# --- (Quitamos 'passlib.context') ---
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select, event, inspect
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from . import models, schemas
 from .db import get_session
+# El PasswordHasher y el pool que ejecuta Argon2 fuera del event loop viven en hashing.py
+from .hashing import ph, pool_hash
+from .compartido import crear_cache
 
 # --- (Configuración de Seguridad - sin cambios) ---
-from dotenv import load_dotenv
-load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "unallavesecretamuysegura_pordefecto")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# --- 2. CAMBIO: Creamos una instancia de PasswordHasher ---
-ph = PasswordHasher()
+# --- Caché del usuario autenticado ---
+# AUTH_CACHE_TTL / AUTH_CACHE_TAMANIO: duración (segundos) y cantidad máxima de usuarios cacheados.
+# AUTH_CLAIMS_EN_TOKEN: si vale "1", el token lleva `uid` y `rol` firmados y
+# get_current_user no consulta la base (un cambio de rol recién aplica al renovar el token).
+# Con varios workers la caché está en el almacén compartido (app/compartido.py): la
+# invalidación de un usuario llega a todos.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_TAMANIO = int(os.getenv("AUTH_CACHE_TAMANIO", "1024"))
+AUTH_CLAIMS_EN_TOKEN = os.getenv("AUTH_CLAIMS_EN_TOKEN", "0") == "1"
+
+cache_usuarios = crear_cache("usuarios", tamanio_maximo=AUTH_CACHE_TAMANIO, ttl=AUTH_CACHE_TTL)
+
+@dataclass(frozen=True)
+class UsuarioActual:
+    """Datos del usuario autenticado que necesitan los handlers (sin sesión de ORM)."""
+    id: int
+    username: str
+    rol: str
+
+# Invalida la caché cuando un usuario se modifica o se elimina a través del ORM.
+@event.listens_for(models.Usuario, "after_update")
+@event.listens_for(models.Usuario, "after_delete")
+def _invalidar_usuario_cacheado(mapper, connection, target):
+    cache_usuarios.invalidar(target.username)
+    # Si cambió el username, la entrada cacheada está bajo el nombre anterior.
+    for anterior in inspect(target).attrs.username.history.deleted:
+        cache_usuarios.invalidar(anterior)
 
 router = APIRouter(
     tags=["Autenticación"]
@@ -49,9 +73,16 @@ def verify_password(plain_password, hashed_password):
 
 def get_password_hash(password):
     """Genera un hash de una contraseña usando Argon2."""
-    global ph
     return ph.hash(password)
 
+# Versiones asíncronas: Argon2 tarda decenas de ms de CPU, así que desde los
+# handlers async se ejecuta en el pool acotado para no bloquear el event loop.
+async def verify_password_async(plain_password, hashed_password):
+    return await pool_hash.verificar(hashed_password, plain_password)
+
+async def get_password_hash_async(password):
+    return await pool_hash.hashear(password)
+
 # --- (create_access_token - sin cambios) ---
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -64,11 +95,24 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# --- (get_current_user - sin cambios, usa nuestro nuevo verify_password) ---
+def consulta_usuario(username: str):
+    """SELECT de los datos del usuario autenticado (se precompila al iniciar)."""
+    return select(models.Usuario.id, models.Usuario.username, models.Usuario.rol).where(
+        models.Usuario.username == username
+    )
+
+def sujeto_del_token(token: str) -> str | None:
+    """Usuario (`sub`) de un token válido, sin consultar la base; None si no valida."""
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+# --- get_current_user: resuelve el usuario desde el token, la caché o la base ---
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_session)
-):
+) -> UsuarioActual:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -81,14 +125,25 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+
+    # 1. Si el token trae los datos firmados, no hace falta ir a la base.
+    if AUTH_CLAIMS_EN_TOKEN and "uid" in payload and "rol" in payload:
+        return UsuarioActual(id=payload["uid"], username=username, rol=payload["rol"])
+
+    # 2. Busca en la caché en memoria.
+    user = cache_usuarios.obtener(username)
+    if user is not None:
+        return user
     
-    query = select(models.Usuario).where(models.Usuario.username == username)
-    result = await db.execute(query)
-    user = result.scalars().first()
+    # 3. Si no está, consulta la base y lo guarda en la caché.
+    result = await db.execute(consulta_usuario(username))
+    fila = result.first()
     
-    if user is None:
+    if fila is None:
         raise credentials_exception
     
+    user = UsuarioActual(id=fila.id, username=fila.username, rol=fila.rol)
+    cache_usuarios.guardar(username, user)
     return user
 
 # --- (login_for_access_token - sin cambios, usa nuestro nuevo verify_password) ---
@@ -101,16 +156,29 @@ async def login_for_access_token(
     result = await db.execute(query)
     user = result.scalars().first()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Si el hash se generó con parámetros viejos, se regenera con los actuales
+    # aprovechando que tenemos la contraseña en texto plano.
+    if ph.check_needs_rehash(user.hashed_password):
+        user.hashed_password = await get_password_hash_async(form_data.password)
+        try:
+            await db.commit()
+        except SQLAlchemyError:
+            # No es crítico: se reintentará en el próximo login.
+            await db.rollback()
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    claims = {"sub": user.username}
+    if AUTH_CLAIMS_EN_TOKEN:
+        claims.update({"uid": user.id, "rol": user.rol})
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=claims, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
@@ -127,7 +195,7 @@ async def registrar_usuario(
     - **password**: Contraseña del usuario.
     """
     # Hashea la contraseña antes de guardarla
-    hashed_password = get_password_hash(usuario_data.password)
+    hashed_password = await get_password_hash_async(usuario_data.password)
     
     # Crea el nuevo usuario
     nuevo_usuario = models.Usuario(
@@ -142,4 +210,14 @@ async def registrar_usuario(
         return nuevo_usuario
     except IntegrityError:
         await db.rollback()
-        raise HTTPException(status_code=400, detail="El nombre de usuario ya existe.")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail="El nombre de usuario ya existe.")
+
+# Métricas del pool de Argon2 (cola, operaciones en curso, completadas).
+@router.get("/metricas/hash", summary="Métricas del pool de hashing")
+async def metricas_hash(current_user: models.Usuario = Depends(get_current_user)):
+    return pool_hash.metricas()
+
+# Métricas de la caché de usuarios autenticados (aciertos, fallos, desalojos).
+@router.get("/metricas/cache-usuarios", summary="Métricas de la caché de usuarios")
+async def metricas_cache_usuarios(current_user: models.Usuario = Depends(get_current_user)):
+    return cache_usuarios.metricas()
@@ -0,0 +1,148 @@
+import os
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from sqlalchemy import select, delete, tuple_
+
+from . import agregados, models
+from .busqueda import indice_productos, indice_clientes
+from .cache_respuestas import catalogo_productos, catalogo_clientes
+from .cambios import difusor
+from .analitica import ventas as analitica_ventas
+
+# --- Configuración (variables de entorno) ---
+# BORRADO_LOTE: filas que se borran por transacción. Cada lote se confirma por
+#   separado: los bloqueos duran poco y la memoria no crece con el historial.
+# BORRADO_MAX_SINCRONICO: con más ids que esto, el pedido se encola como trabajo
+#   aunque no se pida `en_segundo_plano`.
+BORRADO_LOTE = int(os.getenv("BORRADO_LOTE", "1000"))
+BORRADO_MAX_SINCRONICO = int(os.getenv("BORRADO_MAX_SINCRONICO", "1000"))
+
+d, f = models.Detalle, models.Factura
+
+
+@dataclass
+class ProgresoBorrado:
+    """Avance de un borrado masivo; se informa después de cada lote."""
+    pedidos: int
+    borrados: int = 0
+    items_borrados: int = 0
+    facturas_borradas: int = 0
+    lotes: int = 0
+    no_encontrados: list[int] = field(default_factory=list)
+
+    def como_dict(self) -> dict:
+        return {
+            "pedidos": self.pedidos,
+            "borrados": self.borrados,
+            "items_borrados": self.items_borrados,
+            "facturas_borradas": self.facturas_borradas,
+            "lotes": self.lotes,
+            "no_encontrados": self.no_encontrados,
+        }
+
+
+Informar = Callable[[dict], Awaitable[None]] | None
+
+
+def _grupos(ids: list[int]):
+    unicos = sorted(set(ids))
+    for i in range(0, len(unicos), BORRADO_LOTE):
+        yield unicos[i:i + BORRADO_LOTE]
+
+
+async def _existentes(db, modelo, grupo: list[int], progreso: ProgresoBorrado) -> list[int]:
+    existentes = (await db.execute(select(modelo.id).where(modelo.id.in_(grupo)))).scalars().all()
+    encontrados = set(existentes)
+    progreso.no_encontrados.extend(id_ for id_ in grupo if id_ not in encontrados)
+    return sorted(encontrados)
+
+
+async def borrar_productos(session_factory, ids: list[int], informar: Informar = None) -> ProgresoBorrado:
+    """
+    Borra productos con sus ítems de factura sin cargarlos como objetos ORM.
+
+    Por cada grupo de BORRADO_LOTE productos se borran los ítems de a BORRADO_LOTE
+    filas (descontándolos de los agregados de ventas) y, en la transacción del
+    último lote, los productos. Si se corta a la mitad, lo ya confirmado queda
+    borrado y coherente: repetir el pedido termina el trabajo.
+    """
+    progreso = ProgresoBorrado(pedidos=len(set(ids)))
+    for grupo in _grupos(ids):
+        async with session_factory() as db:
+            grupo = await _existentes(db, models.Producto, grupo, progreso)
+            while grupo:
+                # 1. Un lote de claves de ítems (solo dos enteros por fila).
+                claves = (await db.execute(
+                    select(d.factura_id, d.producto_id).where(d.producto_id.in_(grupo)).limit(BORRADO_LOTE)
+                )).all()
+                if claves:
+                    condicion = tuple_(d.factura_id, d.producto_id).in_([tuple(c) for c in claves])
+                    await agregados.restar_detalles(db, condicion)
+                    await db.execute(delete(d).where(condicion))
+                    progreso.items_borrados += len(claves)
+                # 2. Con el último lote de ítems se borran los productos del grupo.
+                if len(claves) < BORRADO_LOTE:
+                    await db.execute(delete(models.Producto).where(models.Producto.id.in_(grupo)))
+                await db.commit()
+                progreso.lotes += 1
+                if claves:
+                    # Recién confirmado: una recarga anterior al commit todavía vería esas filas.
+                    analitica_ventas.invalidar()
+                if len(claves) < BORRADO_LOTE:
+                    progreso.borrados += len(grupo)
+                    catalogo_productos.invalidar() # El listado cacheado ya no es válido.
+                    for id_ in grupo:
+                        indice_productos.quitar(id_)
+                    difusor.publicar("productos", "baja", {"ids": grupo})
+                    grupo = []
+                if informar:
+                    await informar(progreso.como_dict())
+    return progreso
+
+
+async def borrar_clientes(session_factory, ids: list[int], informar: Informar = None) -> ProgresoBorrado:
+    """
+    Borra clientes con sus facturas, los ítems de esas facturas y sus agregados.
+    Las facturas se borran de a BORRADO_LOTE por transacción (primero sus ítems);
+    con el último lote se borran los agregados y los clientes.
+    """
+    progreso = ProgresoBorrado(pedidos=len(set(ids)))
+    for grupo in _grupos(ids):
+        async with session_factory() as db:
+            grupo = await _existentes(db, models.Cliente, grupo, progreso)
+            while grupo:
+                # 1. Un lote de facturas del grupo, con sus ítems.
+                lote = (await db.execute(
+                    select(f.id, f.creado_por_usuario_id).where(f.cliente_id.in_(grupo)).limit(BORRADO_LOTE)
+                )).all()
+                facturas = [id_ for id_, _ in lote]
+                if facturas:
+                    items = await db.execute(delete(d).where(d.factura_id.in_(facturas)))
+                    await db.execute(delete(f).where(f.id.in_(facturas)))
+                    progreso.items_borrados += items.rowcount
+                    progreso.facturas_borradas += len(facturas)
+                # 2. Con el último lote, los totales diarios y los clientes.
+                if len(facturas) < BORRADO_LOTE:
+                    await db.execute(delete(agregados.ventas).where(agregados.ventas.c.cliente_id.in_(grupo)))
+                    await db.execute(delete(models.Cliente).where(models.Cliente.id.in_(grupo)))
+                await db.commit()
+                progreso.lotes += 1
+                if facturas:
+                    analitica_ventas.invalidar() # Se borraron filas de `detalle` ya cargadas.
+                    # Un evento por creador: cada usuario solo recibe las de sus facturas.
+                    por_creador: dict = {}
+                    for id_, creador in lote:
+                        por_creador.setdefault(creador, []).append(id_)
+                    for creador, ids_creador in por_creador.items():
+                        difusor.publicar("facturas", "baja", {"ids": ids_creador}, usuario_id=creador)
+                if len(facturas) < BORRADO_LOTE:
+                    progreso.borrados += len(grupo)
+                    catalogo_clientes.invalidar() # El listado cacheado ya no es válido.
+                    for id_ in grupo:
+                        indice_clientes.quitar(id_)
+                    difusor.publicar("clientes", "baja", {"ids": grupo})
+                    grupo = []
+                if informar:
+                    await informar(progreso.como_dict())
+    return progreso
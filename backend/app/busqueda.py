@@ -0,0 +1,325 @@
+import asyncio
+import heapq
+import logging
+import re
+import unicodedata
+from collections import Counter, deque
+from decimal import Decimal
+from itertools import islice
+
+from sqlalchemy import select
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Máximo de palabras del índice que se recorren para un prefijo corto (ej. "a").
+MAX_PALABRAS_POR_PREFIJO = 500
+# Similitud mínima (trigramas compartidos / trigramas de la unión) para aceptar un error de tipeo.
+SIMILITUD_MINIMA = 0.3
+# Máximo de palabras parecidas que se consideran por cada palabra de la búsqueda.
+MAX_PARECIDAS = 20
+# Documentos que se puntúan como máximo para la primera palabra: con palabras muy
+# comunes alcanza con los de las mejores coincidencias para armar un autocompletado.
+MAX_CANDIDATOS = 1000
+
+
+def normalizar(texto) -> str:
+    """Minúsculas y sin acentos: "Azúcar" y "azucar" son la misma palabra."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    return "".join(ch for ch in texto if not unicodedata.combining(ch))
+
+
+def palabras(texto) -> list[str]:
+    return re.findall(r"\w+", normalizar(texto))
+
+
+def trigramas(palabra: str) -> set[str]:
+    relleno = f"  {palabra} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class _Nodo:
+    __slots__ = ("hijos", "fin")
+
+    def __init__(self):
+        self.hijos: dict[str, "_Nodo"] = {}
+        self.fin = False
+
+
+class IndiceBusqueda:
+    """
+    Índice en memoria para autocompletar.
+
+    - Un trie de palabras resuelve los prefijos ("cafe" -> "cafetera").
+    - Un índice de trigramas sobre el vocabulario encuentra palabras parecidas
+      cuando no hay coincidencias exactas ni por prefijo ("cafetrea").
+    - Cada palabra apunta a los documentos que la contienen con el peso del campo
+      (el nombre pesa más que la descripción).
+
+    Se construye al iniciar y se mantiene con `agregar` / `quitar` desde los
+    handlers que modifican la tabla. Todas las operaciones son sincrónicas, así
+    que no se intercalan con otras corrutinas.
+    """
+
+    def __init__(self, nombre: str, campos: dict[str, int], salida: tuple[str, ...]):
+        self.nombre = nombre
+        self.campos = campos  # campo -> peso
+        self.salida = salida  # campos que se devuelven en cada resultado
+        self._vaciar()
+        self._cambios_pendientes: list | None = None
+
+    def _vaciar(self) -> None:
+        self._raiz = _Nodo()
+        self._documentos: dict[int, tuple[dict, dict[str, int], str]] = {}
+        self._postings: dict[str, dict[int, int]] = {}
+        self._trigramas: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._documentos)
+
+    # --- Altas y bajas ---
+
+    def agregar(self, fila) -> None:
+        """Agrega (o reemplaza) el documento de `fila` (objeto ORM o mapping con `id`)."""
+        if hasattr(fila, "keys"):
+            valores = {c: fila[c] for c in {"id", *self.campos, *self.salida}}
+        else:
+            valores = {c: getattr(fila, c) for c in {"id", *self.campos, *self.salida}}
+        if self._cambios_pendientes is not None:
+            self._cambios_pendientes.append(("agregar", valores))
+        self._agregar(valores)
+
+    def quitar(self, id_: int) -> None:
+        if self._cambios_pendientes is not None:
+            self._cambios_pendientes.append(("quitar", id_))
+        self._quitar(id_)
+
+    def _agregar(self, valores: dict) -> None:
+        id_ = valores["id"]
+        self._quitar(id_)
+        pesos: dict[str, int] = {}
+        for campo, peso in self.campos.items():
+            if valores[campo] is None:
+                continue
+            for palabra in palabras(valores[campo]):
+                pesos[palabra] = max(pesos.get(palabra, 0), peso)
+        for palabra, peso in pesos.items():
+            documentos = self._postings.get(palabra)
+            if documentos is None:
+                documentos = self._postings[palabra] = {}
+                self._insertar_palabra(palabra)
+            documentos[id_] = peso
+        texto = " ".join(normalizar(valores[c]) for c in self.campos if valores[c] is not None)
+        self._documentos[id_] = ({c: valores[c] for c in self.salida}, pesos, texto)
+
+    def _quitar(self, id_: int) -> None:
+        documento = self._documentos.pop(id_, None)
+        if documento is None:
+            return
+        for palabra in documento[1]:
+            documentos = self._postings[palabra]
+            documentos.pop(id_, None)
+            if not documentos:
+                del self._postings[palabra]
+                self._eliminar_palabra(palabra)
+
+    def _insertar_palabra(self, palabra: str) -> None:
+        nodo = self._raiz
+        for ch in palabra:
+            nodo = nodo.hijos.setdefault(ch, _Nodo())
+        nodo.fin = True
+        for trigrama in trigramas(palabra):
+            self._trigramas.setdefault(trigrama, set()).add(palabra)
+
+    def _eliminar_palabra(self, palabra: str) -> None:
+        camino = [self._raiz]
+        for ch in palabra:
+            camino.append(camino[-1].hijos[ch])
+        camino[-1].fin = False
+        # Poda las ramas que quedaron sin palabras.
+        for i in range(len(palabra), 0, -1):
+            nodo = camino[i]
+            if nodo.fin or nodo.hijos:
+                break
+            del camino[i - 1].hijos[palabra[i - 1]]
+        for trigrama in trigramas(palabra):
+            conjunto = self._trigramas.get(trigrama)
+            if conjunto is not None:
+                conjunto.discard(palabra)
+                if not conjunto:
+                    del self._trigramas[trigrama]
+
+    def reconstruir(self, filas) -> None:
+        """Reemplaza todo el contenido del índice."""
+        self._vaciar()
+        for fila in filas:
+            self.agregar(fila)
+
+    async def cargar(self, session_factory, modelo) -> None:
+        """
+        Carga el índice desde la base. Los cambios que llegan mientras se lee
+        (`agregar` / `quitar` desde los handlers) se vuelven a aplicar al final
+        para no perderlos.
+        """
+        self._cambios_pendientes = []
+        try:
+            columnas = [getattr(modelo, c) for c in {"id", *self.campos, *self.salida}]
+            async with session_factory() as db:
+                filas = (await db.execute(select(*columnas))).mappings().all()
+            pendientes = self._cambios_pendientes
+            self._cambios_pendientes = None
+            self.reconstruir(filas)
+            for operacion, dato in pendientes:
+                self._agregar(dato) if operacion == "agregar" else self._quitar(dato)
+        finally:
+            self._cambios_pendientes = None
+        logger.info("Índice de %s cargado: %d documentos, %d palabras", self.nombre, len(self), len(self._postings))
+
+    # --- Consultas ---
+
+    def _con_prefijo(self, prefijo: str) -> list[str]:
+        nodo = self._raiz
+        for ch in prefijo:
+            nodo = nodo.hijos.get(ch)
+            if nodo is None:
+                return []
+        # Recorrido por niveles: si se corta por el máximo, quedan las palabras más cortas.
+        encontradas, pendientes = [], deque([(nodo, prefijo)])
+        while pendientes and len(encontradas) < MAX_PALABRAS_POR_PREFIJO:
+            nodo, palabra = pendientes.popleft()
+            if nodo.fin:
+                encontradas.append(palabra)
+            pendientes.extend((hijo, palabra + ch) for ch, hijo in nodo.hijos.items())
+        return encontradas
+
+    def _parecidas(self, palabra: str) -> list[tuple[str, float]]:
+        propios = trigramas(palabra)
+        compartidos = Counter()
+        for trigrama in propios:
+            compartidos.update(self._trigramas.get(trigrama, ()))
+        parecidas = []
+        for candidata, comunes in compartidos.items():
+            # Qué parte de la búsqueda aparece en la candidata, penalizada por la
+            # diferencia de largo: una palabra corta que comparte el comienzo
+            # ("cafe") no le gana a la que tiene casi todos los trigramas ("cafetera").
+            largo = min(len(palabra), len(candidata)) / max(len(palabra), len(candidata))
+            similitud = comunes / len(propios) * largo
+            if similitud >= SIMILITUD_MINIMA:
+                parecidas.append((candidata, similitud))
+        return heapq.nlargest(MAX_PARECIDAS, parecidas, key=lambda par: par[1])
+
+    def _coincidencias(self, palabra: str) -> list[tuple[str, float]]:
+        """Palabras del índice que coinciden con una de la búsqueda, con su factor de puntaje."""
+        # 1. Palabra exacta y palabras que empiezan con ella (más corta = más parecida).
+        coincidencias = [
+            (candidata, 3.0 if candidata == palabra else 1.0 + len(palabra) / len(candidata))
+            for candidata in self._con_prefijo(palabra)
+        ]
+        # 2. Si no hubo nada, palabras parecidas (errores de tipeo).
+        if not coincidencias and len(palabra) >= 3:
+            coincidencias = self._parecidas(palabra)
+        return coincidencias
+
+    def _puntajes(self, coincidencias: list[tuple[str, float]], maximo: int | None = None) -> dict[int, float]:
+        """Puntaje de cada documento; con `maximo`, se corta al juntar esa cantidad."""
+        puntajes: dict[int, float] = {}
+        # Las mejores coincidencias primero (la palabra exacta, después los prefijos más cortos).
+        for candidata, factor in sorted(coincidencias, key=lambda par: -par[1]):
+            documentos = self._postings[candidata].items()
+            if maximo is not None:
+                documentos = islice(documentos, maximo - len(puntajes))
+            for id_, peso in documentos:
+                puntaje = peso * factor
+                if puntaje > puntajes.get(id_, 0):
+                    puntajes[id_] = puntaje
+            if maximo is not None and len(puntajes) >= maximo:
+                break
+        return puntajes
+
+    def buscar(self, texto: str, limite: int = 10) -> list[dict]:
+        """
+        Devuelve los `limite` documentos que mejor coinciden con `texto`.
+        Todas las palabras de la búsqueda tienen que coincidir (por palabra
+        exacta, prefijo o parecido); se ordena por puntaje total.
+        """
+        consulta = palabras(texto)
+        if not consulta:
+            return []
+        por_palabra = [self._coincidencias(palabra) for palabra in consulta]
+        if not all(por_palabra):
+            return []
+        # Se empieza por la palabra con menos documentos: las demás solo filtran ese conjunto.
+        frecuencia = [sum(len(self._postings[c]) for c, _ in coincidencias) for coincidencias in por_palabra]
+        orden = sorted(range(len(consulta)), key=frecuencia.__getitem__)
+
+        totales = self._puntajes(por_palabra[orden[0]], MAX_CANDIDATOS)
+        for i in orden[1:]:
+            coincidencias = por_palabra[i]
+            if len(totales) * len(coincidencias) < frecuencia[i]:
+                # Pocos candidatos: se consulta cada uno en lugar de recorrer los postings.
+                nuevos = {}
+                for id_, total in totales.items():
+                    mejor = max(self._postings[c].get(id_, 0) * factor for c, factor in coincidencias)
+                    if mejor:
+                        nuevos[id_] = total + mejor
+                totales = nuevos
+            else:
+                puntajes = self._puntajes(coincidencias)
+                totales = {id_: total + puntajes[id_] for id_, total in totales.items() if id_ in puntajes}
+            if not totales:
+                return []
+
+        # El texto que empieza con lo buscado va primero ("coca" antes que "agua con coca").
+        frase = " ".join(consulta)
+        documentos = self._documentos
+
+        def clave(id_):
+            texto_doc = documentos[id_][2]
+            return (-(totales[id_] + (2.0 if texto_doc.startswith(frase) else 0.0)), len(texto_doc), id_)
+
+        return [documentos[id_][0] for id_ in heapq.nsmallest(limite, totales, key=clave)]
+
+    def metricas(self) -> dict:
+        return {"documentos": len(self._documentos), "palabras": len(self._postings)}
+
+
+# Índices de autocompletado. Los mantienen al día los routers de productos y clientes.
+indice_productos = IndiceBusqueda(
+    "productos", campos={"nombre": 2, "descripcion": 1}, salida=("id", "nombre", "precio_venta")
+)
+indice_clientes = IndiceBusqueda(
+    "clientes", campos={"nombre": 2, "apellido": 2, "dni": 3}, salida=("id", "nombre", "apellido", "dni")
+)
+
+
+async def cargar_indices(session_factory) -> None:
+    await indice_productos.cargar(session_factory, models.Producto)
+    await indice_clientes.cargar(session_factory, models.Cliente)
+
+
+_recargas: set[asyncio.Task] = set()
+
+
+def aplicar_cambio(evento, session_factory) -> None:
+    """
+    Aplica a los índices un cambio hecho en otro worker (lo llama el difusor de
+    app/cambios.py con COMPARTIDO_ACTIVO). Los del propio worker ya los aplicó
+    el handler. `datos` viene como JSON: el precio vuelve a ser Decimal.
+    """
+    indices = {"productos": (indice_productos, models.Producto), "clientes": (indice_clientes, models.Cliente)}
+    if evento.recurso not in indices:
+        return
+    indice, modelo = indices[evento.recurso]
+    if evento.accion in ("alta", "modificacion"):
+        datos = evento.datos
+        if "precio_venta" in datos:
+            datos = {**datos, "precio_venta": Decimal(datos["precio_venta"])}
+        indice.agregar(datos)
+    elif evento.accion == "baja":
+        for id_ in evento.datos["ids"]:
+            indice.quitar(id_)
+    elif evento.accion == "recarga":
+        tarea = asyncio.create_task(indice.cargar(session_factory, modelo))
+        _recargas.add(tarea)
+        tarea.add_done_callback(_recargas.discard)
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class CacheTTL:
+    """
+    Caché en memoria con expiración por tiempo (TTL) y desalojo LRU.
+    Lleva contadores de aciertos/fallos para poder dimensionarla.
+    """
+
+    def __init__(self, tamanio_maximo: int = 1024, ttl: float = 60.0):
+        self.tamanio_maximo = tamanio_maximo
+        self.ttl = ttl
+        self._datos: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave):
+        """Devuelve el valor guardado o None si no existe o ya expiró."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor) -> None:
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamanio_maximo:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, clave) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def metricas(self) -> dict:
+        total = self.aciertos + self.fallos
+        return {
+            "tamanio": len(self._datos),
+            "tamanio_maximo": self.tamanio_maximo,
+            "ttl": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+        }
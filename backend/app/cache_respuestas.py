@@ -0,0 +1,133 @@
+import hashlib
+import secrets
+from typing import Any
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from . import schemas
+from .cache import CacheTTL
+from .compartido import COMPARTIDO_ACTIVO, CacheCompartida, almacen
+from .paginacion import CABECERA_CURSOR
+from .serializacion import filas_a_json
+
+# Las filas proyectadas (parámetro `campos`) no siguen un schema fijo.
+_filas_libres = TypeAdapter(list[dict[str, Any]])
+
+
+class CacheCatalogo:
+    """
+    Caché de respuestas ya serializadas para un listado que cambia poco.
+
+    Lleva un número de versión que los handlers de alta/baja/modificación
+    incrementan con `invalidar()`. El ETag se deriva de la versión, de la
+    query string y de un valor que cambia en cada arranque (la versión vuelve
+    a empezar en 0 y la base pudo cambiar mientras tanto), así que un `If-None-Match` vigente se responde con 304 sin
+    tocar la base ni volver a validar con Pydantic.
+
+    Con varios workers (COMPARTIDO_ACTIVO) la versión vive en el almacén
+    compartido, así que una modificación en un worker invalida a todos, y las
+    páginas serializadas también se guardan ahí: la arma un worker y la usan
+    los demás. La copia local sigue siendo válida porque su clave lleva la versión.
+    Si no se puede leer la versión compartida (`None`), se responde desde la base.
+    """
+
+    def __init__(self, nombre: str, schema, tamanio_maximo: int = 256):
+        self.nombre = nombre
+        self._version = 0
+        self._adaptador = TypeAdapter(list[schema])
+        # TTL largo: las entradas se descartan por versión, no por tiempo.
+        self._respuestas = CacheTTL(tamanio_maximo=tamanio_maximo, ttl=24 * 3600)
+        self._compartidas = (
+            CacheCompartida(f"catalogo_{nombre}", tamanio_maximo=tamanio_maximo, ttl=24 * 3600)
+            if COMPARTIDO_ACTIVO else None
+        )
+        self._arranque: str | None = None
+        self.no_modificadas = 0
+
+    @property
+    def arranque(self) -> str:
+        # Con varios workers tiene que ser el mismo en todos: la época del almacén,
+        # que cambia cada vez que app/servir.py lo reinicia.
+        if self._arranque is None:
+            self._arranque = almacen.epoca() if self._compartidas else secrets.token_hex(4)
+            if self._arranque is None:
+                # Falló el almacén: un valor propio de este worker (no da falsos 304) y se reintenta.
+                return secrets.token_hex(4)
+        return self._arranque
+
+    @property
+    def version(self) -> int | None:
+        return almacen.version(self.nombre) if self._compartidas else self._version
+
+    def invalidar(self) -> None:
+        if self._compartidas:
+            almacen.incrementar(self.nombre)
+            self._compartidas.limpiar()
+        else:
+            self._version += 1
+        self._respuestas.limpiar()
+
+    def _etag(self, request: Request, version: int) -> str:
+        consulta = hashlib.sha1(str(request.url.query).encode()).hexdigest()[:16]
+        return f'W/"{self.nombre}-{self.arranque}-{version}-{consulta}"'
+
+    def respuesta_cacheada(self, request: Request) -> Response | None:
+        """Devuelve un 304, la respuesta guardada, o None si hay que ir a la base."""
+        version = self.version
+        if version is None:
+            return None
+        etag = self._etag(request, version)
+        if request.headers.get("if-none-match") == etag:
+            self.no_modificadas += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        clave = (version, str(request.url.query))
+        guardada = self._respuestas.obtener(clave)
+        if guardada is None and self._compartidas:
+            guardada = self._compartidas.obtener(clave)
+            if guardada is not None:
+                self._respuestas.guardar(clave, guardada)
+        if guardada is None:
+            return None
+        cuerpo, siguiente = guardada
+        return self._respuesta(cuerpo, siguiente, etag)
+
+    def guardar(self, request: Request, version: int, filas, siguiente: str, proyectada: bool,
+                rapido: bool = False) -> Response:
+        """
+        Serializa la página una sola vez, la guarda y la devuelve con su ETag.
+        `version` es la que había antes de consultar la base: si hubo una
+        modificación mientras tanto, la respuesta no se guarda.
+        Con `rapido` las filas se escriben tal cual vienen de la base, sin validarlas.
+        """
+        if rapido:
+            cuerpo = filas_a_json(filas)
+        else:
+            adaptador = _filas_libres if proyectada else self._adaptador
+            cuerpo = adaptador.dump_json(adaptador.validate_python([dict(f) for f in filas]))
+        if version is None or version != self.version:
+            return self._respuesta(cuerpo, siguiente, None)
+        clave = (version, str(request.url.query))
+        self._respuestas.guardar(clave, (cuerpo, siguiente))
+        if self._compartidas:
+            self._compartidas.guardar(clave, (cuerpo, siguiente))
+        return self._respuesta(cuerpo, siguiente, self._etag(request, version))
+
+    @staticmethod
+    def _respuesta(cuerpo: bytes, siguiente: str, etag: str | None) -> Response:
+        headers = {CABECERA_CURSOR: siguiente, "Cache-Control": "no-cache"}
+        if etag:
+            headers["ETag"] = etag
+        return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+    def metricas(self) -> dict:
+        metricas = {"version": self.version, "no_modificadas": self.no_modificadas, **self._respuestas.metricas()}
+        if self._compartidas:
+            metricas["compartidas"] = self._compartidas.metricas()
+        return metricas
+
+
+# Catálogos cacheados. Los invalidan los handlers que los modifican
+# (el de productos también cada vez que cambia el stock).
+catalogo_clientes = CacheCatalogo("clientes", schemas.ClienteOut)
+catalogo_productos = CacheCatalogo("productos", schemas.ProductoOut)
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+from collections import deque
+
+from .compartido import COMPARTIDO_ACTIVO, almacen
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# CAMBIOS_BUFFER: eventos recientes que se guardan para que un cliente que se
+#   reconecta los reciba (reanudando desde el último número de secuencia visto).
+# CAMBIOS_COLA: eventos pendientes por suscriptor. Si un cliente lento la llena,
+#   se le envía `reiniciar` y se corta su conexión en lugar de frenar a los demás.
+# CAMBIOS_LATIDO: segundos sin eventos tras los que se envía un comentario para
+#   que los proxies no cierren la conexión.
+# CAMBIOS_DURACION_MAXIMA: segundos tras los que el servidor corta cada conexión; el
+#   cliente se reconecta con su último `seq` y no pierde eventos. Así ningún stream
+#   impide que uvicorn termine de cerrar conexiones al apagarse.
+# CAMBIOS_SONDEO: con varios workers (COMPARTIDO_ACTIVO), cada cuántos segundos cada uno
+#   lee del almacén compartido los cambios publicados por todos.
+CAMBIOS_BUFFER = int(os.getenv("CAMBIOS_BUFFER", "1000"))
+CAMBIOS_COLA = int(os.getenv("CAMBIOS_COLA", "256"))
+CAMBIOS_LATIDO = float(os.getenv("CAMBIOS_LATIDO", "15"))
+CAMBIOS_DURACION_MAXIMA = float(os.getenv("CAMBIOS_DURACION_MAXIMA", "300"))
+CAMBIOS_SONDEO = float(os.getenv("CAMBIOS_SONDEO", "0.1"))
+
+RECURSOS = ("clientes", "productos", "facturas")
+
+
+class Evento:
+    """Un cambio ya serializado como mensaje Server-Sent Events (se arma una sola vez)."""
+    __slots__ = ("seq", "recurso", "accion", "datos", "usuario_id", "sse")
+
+    def __init__(self, epoca: str, seq: int, recurso: str, accion: str, datos, usuario_id: int | None):
+        self.seq = seq
+        self.recurso = recurso
+        self.accion = accion
+        self.datos = datos
+        self.usuario_id = usuario_id  # si no es None, solo lo ven ese usuario y los admins
+        cuerpo = json.dumps({"seq": seq, "recurso": recurso, "accion": accion, "datos": datos})
+        self.sse = f"id: {epoca}-{seq}\nevent: cambio\ndata: {cuerpo}\n\n".encode()
+
+
+class Suscripcion:
+    def __init__(self, usuario_id: int, admin: bool, recursos: set[str]):
+        self.usuario_id = usuario_id
+        self.admin = admin
+        self.recursos = recursos
+        self.cola: asyncio.Queue[Evento | None] = asyncio.Queue(maxsize=CAMBIOS_COLA)
+        self.pendientes: list[Evento] = []  # eventos del buffer a repetir al conectarse
+        self.reiniciar = False  # el cliente perdió eventos: tiene que volver a pedir los listados
+        self.cerrada = False
+        self.ultimo = 0  # seq que el cliente ya vio (al reconectarse a un worker que va atrasado)
+
+    def ve(self, evento: Evento) -> bool:
+        if evento.recurso not in self.recursos or evento.seq <= self.ultimo:
+            return False
+        return evento.usuario_id is None or self.admin or evento.usuario_id == self.usuario_id
+
+
+class DifusorCambios:
+    """
+    Reparte los cambios de clientes, productos y facturas a los clientes conectados.
+
+    Los handlers llaman a `publicar` después del commit (es sincrónico: no espera a
+    nadie). Cada evento lleva un número de secuencia creciente, y su id SSE es
+    `<epoca>-<seq>`: la época cambia en cada arranque, así un id de otra época
+    se reconoce y no se confunde con un `seq` de la secuencia actual. Los
+    últimos `tamanio_buffer` se guardan para que un cliente que se reconecta con
+    `Last-Event-ID` reciba solo lo que se perdió. Si lo que pide ya salió del
+    buffer, o si no lee lo bastante rápido, recibe `reiniciar` y vuelve a pedir
+    los listados completos.
+
+    Con `compartido` (varios workers), `publicar` solo anota el cambio en el
+    almacén compartido, que asigna el seq; la tarea `sincronizar` de cada worker
+    lee de ahí los cambios de todos, en orden, y los reparte a sus suscriptores.
+    La época también es la del almacén, así un cliente puede reconectarse a
+    cualquier worker. Los `oyentes` reciben los cambios hechos en otros workers
+    (así se mantienen los índices de búsqueda de app/busqueda.py).
+    """
+
+    def __init__(self, tamanio_buffer: int, compartido: bool = False):
+        self.compartido = compartido
+        self.epoca = secrets.token_hex(4)
+        self.seq = 0
+        self._buffer: deque[Evento] = deque(maxlen=tamanio_buffer)
+        self._suscripciones: set[Suscripcion] = set()
+        self._oyentes: list = []
+        self.publicados = 0
+        self.desbordados = 0
+        self.perdidos = 0
+
+    def publicar(self, recurso: str, accion: str, datos: dict, usuario_id: int | None = None) -> None:
+        """`datos` ya tiene que ser JSON (ej. `model_dump(mode="json")`, igual que las respuestas)."""
+        if self.compartido:
+            if almacen.registrar_cambio(recurso, accion, json.dumps(datos), usuario_id, self._buffer.maxlen) is None:
+                # No quedó registrado: nadie lo va a recibir, así que todos vuelven a pedir los listados.
+                self._reiniciar_todos()
+            return
+        self.seq += 1
+        self._repartir(Evento(self.epoca, self.seq, recurso, accion, datos, usuario_id))
+
+    def _repartir(self, evento: Evento) -> None:
+        self.seq = evento.seq
+        self._buffer.append(evento)
+        self.publicados += 1
+        for suscripcion in list(self._suscripciones):
+            if not suscripcion.ve(evento):
+                continue
+            try:
+                suscripcion.cola.put_nowait(evento)
+            except asyncio.QueueFull:
+                # Cliente lento: se lo desconecta con `reiniciar` en lugar de acumular sin límite.
+                suscripcion.reiniciar = True
+                self._suscripciones.discard(suscripcion)
+                self.desbordados += 1
+
+    def _reiniciar_todos(self) -> None:
+        self.perdidos += 1
+        for suscripcion in list(self._suscripciones):
+            suscripcion.reiniciar = True
+            try:
+                suscripcion.cola.put_nowait(None)  # despierta al que está esperando
+            except asyncio.QueueFull:
+                pass
+        self._suscripciones.clear()
+
+    # --- Varios workers ---
+
+    def escuchar(self, oyente) -> None:
+        """Registra `oyente(evento)`, que se llama con cada cambio hecho en otro worker."""
+        self._oyentes.append(oyente)
+
+    def _leer_compartidos(self, avisar: bool = True) -> None:
+        filas = almacen.cambios_desde(self.seq, self._buffer.maxlen)
+        if not filas:
+            return
+        if avisar and filas[0][0] > self.seq + 1:
+            # Se purgaron del almacén antes de que este worker los leyera.
+            self._reiniciar_todos()
+        propio = os.getpid()
+        for seq, pid, recurso, accion, datos, usuario_id in filas:
+            evento = Evento(self.epoca, seq, recurso, accion, json.loads(datos), usuario_id)
+            self._repartir(evento)
+            if avisar and pid != propio:
+                for oyente in self._oyentes:
+                    try:
+                        oyente(evento)
+                    except Exception:
+                        logger.exception("Falló un oyente de cambios con el evento %d", seq)
+
+    def iniciar(self) -> None:
+        """Toma la época del almacén y carga al buffer lo ya registrado (sin avisar a los oyentes)."""
+        if self.compartido:
+            # Si no se puede leer, queda la propia: los clientes reciben `reiniciar` al cambiar de worker.
+            self.epoca = almacen.epoca() or self.epoca
+            self._leer_compartidos(avisar=False)
+
+    async def sincronizar(self, cada: float = CAMBIOS_SONDEO) -> None:
+        """Tarea de cada worker con `compartido`: reparte los cambios nuevos del almacén."""
+        while True:
+            await asyncio.sleep(cada)
+            try:
+                self._leer_compartidos()
+            except Exception:
+                logger.exception("Error al leer los cambios del almacén compartido")
+
+    def _seq_de(self, id_evento: str) -> int | None:
+        """El `seq` de un id `<epoca>-<seq>` de esta época; None si es de otra o no se entiende."""
+        epoca, _, seq = id_evento.partition("-")
+        if epoca != self.epoca or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def suscribir(self, usuario_id: int, admin: bool, recursos: set[str], desde: str | None) -> Suscripcion:
+        """
+        Registra un suscriptor. Con `desde` (id del último evento que vio el cliente)
+        se le repiten los eventos posteriores que siguen en el buffer.
+        """
+        suscripcion = Suscripcion(usuario_id, admin, recursos)
+        if desde:
+            seq = self._seq_de(desde)
+            primero = self._buffer[0].seq if self._buffer else self.seq + 1
+            if seq is not None and primero - 1 <= seq:
+                # Un `seq` mayor al propio es de otro worker que va adelantado: lo que
+                # falta llega con `sincronizar` y se saltea lo que el cliente ya vio.
+                suscripcion.ultimo = seq
+                suscripcion.pendientes = [e for e in self._buffer if suscripcion.ve(e)]
+            else:
+                # Ya salió del buffer, o es de otra época (otro arranque u otro worker).
+                suscripcion.reiniciar = True
+        if not suscripcion.reiniciar:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion) -> None:
+        self._suscripciones.discard(suscripcion)
+
+    def _reinicio(self) -> bytes:
+        datos = json.dumps({"epoca": self.epoca, "seq": self.seq})
+        return f"id: {self.epoca}-{self.seq}\nevent: reiniciar\ndata: {datos}\n\n".encode()
+
+    async def flujo_sse(self, suscripcion: Suscripcion, latido: float = CAMBIOS_LATIDO,
+                        duracion_maxima: float = CAMBIOS_DURACION_MAXIMA):
+        """Genera los mensajes SSE de una suscripción hasta que se corta, se cierra o vence."""
+        fin = asyncio.get_running_loop().time() + duracion_maxima
+        try:
+            yield b"retry: 3000\n\n"
+            for evento in suscripcion.pendientes:
+                yield evento.sse
+            suscripcion.pendientes = []
+            while True:
+                if suscripcion.reiniciar:
+                    yield self._reinicio()
+                    return
+                restante = fin - asyncio.get_running_loop().time()
+                if suscripcion.cerrada or restante <= 0:
+                    return
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), min(latido, restante))
+                except asyncio.TimeoutError:
+                    yield b": latido\n\n"
+                    continue
+                if evento is not None:
+                    yield evento.sse
+        finally:
+            self.desuscribir(suscripcion)
+
+    def cerrar(self) -> None:
+        """Termina todas las suscripciones (al apagar, para no esperar conexiones eternas)."""
+        for suscripcion in list(self._suscripciones):
+            suscripcion.cerrada = True
+            try:
+                suscripcion.cola.put_nowait(None)  # despierta al que está esperando
+            except asyncio.QueueFull:
+                pass
+        self._suscripciones.clear()
+
+    def metricas(self) -> dict:
+        return {
+            "epoca": self.epoca,
+            "seq": self.seq,
+            "suscriptores": len(self._suscripciones),
+            "en_buffer": len(self._buffer),
+            "publicados": self.publicados,
+            "desbordados": self.desbordados,
+            "perdidos": self.perdidos,
+            "compartido": self.compartido,
+        }
+
+
+difusor = DifusorCambios(CAMBIOS_BUFFER, compartido=COMPARTIDO_ACTIVO)
@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+
+from sqlalchemy import text
+from starlette.requests import Request
+
+from . import agregados, analitica, auth, busqueda, migraciones, pdf, stock
+from .admision import control_admision
+from .cambios import difusor
+from .compartido import almacen as almacen_compartido, es_principal
+from .db import (
+    engine, engine_lectura, AsyncSessionLocal, AsyncSessionLectura, DB_POOL_SIZE, DB_MAX_OVERFLOW
+)
+from .hashing import pool_hash
+from .paginacion import LIMITE_POR_DEFECTO
+from .routers import clientes, facturas, productos
+from .trabajos import cola as cola_trabajos
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# ARRANQUE_CALENTAR: 0 desactiva el calentamiento (pool, sentencias y catálogos), p. ej. para medirlo.
+# ARRANQUE_CONEXIONES: conexiones que se abren en cada pool al iniciar (por defecto, DB_POOL_SIZE).
+# ARRANQUE_PRECARGAR_CATALOGOS: deja cacheada la primera página de productos y clientes.
+# ARRANQUE_EN_SEGUNDO_PLANO: el calentamiento corre después de empezar a atender;
+#   mientras tanto /listo responde 503 (útil si el orquestador tiene un timeout de arranque corto).
+# ARRANQUE_PRECARGAR_ANALITICA: carga la copia columnar de ventas al iniciar (si no,
+#   la primera consulta a /analitica paga la carga). Requiere numpy.
+# APAGADO_DEMORA: segundos entre el SIGTERM y que uvicorn deje de aceptar conexiones;
+#   mientras tanto /listo responde 503 y el balanceador saca a la instancia de rotación.
+# APAGADO_ESPERA_MAXIMA: segundos que uvicorn espera las conexiones abiertas antes del
+#   apagado del lifespan (timeout_graceful_shutdown en app/servir.py).
+ARRANQUE_CALENTAR = os.getenv("ARRANQUE_CALENTAR", "1") == "1"
+ARRANQUE_CONEXIONES = min(int(os.getenv("ARRANQUE_CONEXIONES", str(DB_POOL_SIZE))), DB_POOL_SIZE + DB_MAX_OVERFLOW)
+ARRANQUE_PRECARGAR_CATALOGOS = os.getenv("ARRANQUE_PRECARGAR_CATALOGOS", "1") == "1"
+ARRANQUE_PRECARGAR_ANALITICA = os.getenv("ARRANQUE_PRECARGAR_ANALITICA", "0") == "1"
+ARRANQUE_EN_SEGUNDO_PLANO = os.getenv("ARRANQUE_EN_SEGUNDO_PLANO", "0") == "1"
+APAGADO_DEMORA = float(os.getenv("APAGADO_DEMORA", "5"))
+APAGADO_ESPERA_MAXIMA = float(os.getenv("APAGADO_ESPERA_MAXIMA", "30"))
+
+
+@dataclass
+class EstadoArranque:
+    """Fase de la aplicación y cuánto tardó cada paso del arranque (para /listo)."""
+    fase: str = "iniciando"  # iniciando -> calentando -> listo (o fallido) -> deteniendo
+    pasos_ms: dict[str, float] = field(default_factory=dict)
+    error: str | None = None
+    en_curso: int = 0  # peticiones HTTP que se están atendiendo
+
+    @property
+    def listo(self) -> bool:
+        return self.fase == "listo"
+
+    def como_dict(self) -> dict:
+        return {
+            "listo": self.listo,
+            "fase": self.fase,
+            "pasos_ms": self.pasos_ms,
+            "total_ms": round(sum(self.pasos_ms.values()), 1),
+            "peticiones_en_curso": self.en_curso,
+            "error": self.error,
+            "pid": os.getpid(),  # con varios workers, cuál respondió
+        }
+
+
+estado = EstadoArranque()
+
+
+class MiddlewarePeticionesEnCurso:
+    """Cuenta las peticiones HTTP en curso (se informan en /listo)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        estado.en_curso += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            estado.en_curso -= 1
+
+
+@asynccontextmanager
+async def _paso(nombre: str):
+    inicio = time.perf_counter()
+    yield
+    estado.pasos_ms[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+
+
+# --- Calentamiento ---
+
+async def precalentar_pool(motor, cantidad: int) -> None:
+    """Abre `cantidad` conexiones a la vez y las devuelve al pool ya establecidas."""
+    if cantidad <= 0:
+        return
+    async with AsyncExitStack() as pila:
+        # Se mantienen todas abiertas juntas: de a una, el pool reutilizaría siempre la misma.
+        conexiones = [await pila.enter_async_context(motor.connect()) for _ in range(cantidad)]
+        await asyncio.gather(*(conexion.execute(text("SELECT 1")) for conexion in conexiones))
+
+
+def sentencias_calientes() -> list[tuple]:
+    """
+    Sentencias de las rutas más usadas. Ejecutarlas una vez deja su SQL
+    compilado en la caché de SQLAlchemy; los parámetros no encuentran filas.
+    """
+    return [
+        (auth.consulta_usuario(""), {}),
+        (facturas.CABECERAS_FACTURAS, {"ids": [0]}),
+        (facturas.ITEMS_FACTURAS, {"ids": [0]}),
+        (stock.sentencia_descuento(0, 1), {}),
+    ]
+
+
+async def compilar_sentencias() -> None:
+    async with engine.connect() as conexion:
+        for sentencia, parametros in sentencias_calientes():
+            await conexion.execute(sentencia, parametros)
+        # Hay un UPDATE entre las sentencias: nada de esto se confirma.
+        await conexion.rollback()
+
+
+def _peticion_interna(ruta: str) -> Request:
+    # Petición mínima sin query string: la misma clave de caché que un GET sin parámetros.
+    return Request({"type": "http", "method": "GET", "scheme": "http", "server": ("arranque", 80),
+                    "path": ruta, "query_string": b"", "headers": []})
+
+
+async def precargar_catalogos() -> None:
+    """Arma y cachea la primera página de productos y clientes (también compila sus SELECT)."""
+    async with AsyncSessionLectura() as db:
+        await productos.listar_productos(
+            request=_peticion_interna("/productos/"), limite=LIMITE_POR_DEFECTO, cursor=None, nombre=None,
+            con_stock=False, campos=None, rapido=False, db=db, current_user=None
+        )
+        await clientes.listar_clientes(
+            request=_peticion_interna("/clientes/"), limite=LIMITE_POR_DEFECTO, cursor=None, nombre=None,
+            apellido=None, dni=None, campos=None, rapido=False, db=db
+        )
+
+
+async def calentar() -> None:
+    """Deja la aplicación lista para atender sin que las primeras peticiones paguen el arranque."""
+    estado.fase = "calentando"
+    try:
+        if ARRANQUE_CALENTAR:
+            async with _paso("pool"):
+                await precalentar_pool(engine, ARRANQUE_CONEXIONES)
+                if engine_lectura is not engine:
+                    await precalentar_pool(engine_lectura, ARRANQUE_CONEXIONES)
+            async with _paso("sentencias"):
+                await compilar_sentencias()
+            if ARRANQUE_PRECARGAR_CATALOGOS:
+                async with _paso("catalogos"):
+                    await precargar_catalogos()
+        # Los índices de búsqueda se cargan siempre: sin ellos /buscar no devuelve nada.
+        async with _paso("indices_busqueda"):
+            await busqueda.cargar_indices(AsyncSessionLocal)
+        if ARRANQUE_PRECARGAR_ANALITICA and analitica.np is not None:
+            async with _paso("analitica"):
+                await analitica.ventas.cargar(AsyncSessionLectura)
+        estado.fase = "listo"
+        logger.info("Aplicación lista en %.1f ms: %s", sum(estado.pasos_ms.values()), estado.pasos_ms)
+    except Exception as e:
+        # No se corta el arranque: /listo responde 503 con el error hasta que se reinicie.
+        estado.fase = "fallido"
+        estado.error = f"{type(e).__name__}: {e}"
+        logger.exception("Falló el calentamiento")
+
+
+# --- Varios workers ---
+
+def aplicar_cambio_remoto(evento) -> None:
+    """
+    Oyente del difusor de cambios (solo con COMPARTIDO_ACTIVO): lo que otro
+    worker modificó se aplica a los índices de búsqueda y a la copia de la
+    analítica de este, igual que lo hace el handler en el worker propio.
+    """
+    busqueda.aplicar_cambio(evento, AsyncSessionLocal)
+    if evento.recurso == "facturas" and evento.accion in ("modificacion", "baja"):
+        analitica.ventas.invalidar()
+    elif evento.recurso == "productos" and evento.accion == "baja":
+        analitica.ventas.invalidar()  # se borraron también sus ítems de factura
+    elif evento.recurso == "productos" and evento.accion in ("modificacion", "recarga"):
+        analitica.ventas.invalidar_costos()
+
+
+# --- Apagado ---
+
+# uvicorn corre el apagado del lifespan recién cuando ya dejó de aceptar conexiones
+# y cerró las abiertas: para entonces es tarde para avisar en /listo. Por eso la
+# señal se atiende antes que uvicorn.
+
+def _iniciar_apagado() -> None:
+    """Deja de figurar como lista y corta los streams de /cambios."""
+    if estado.fase != "deteniendo":
+        estado.fase = "deteniendo"
+        difusor.cerrar()
+
+
+def instalar_senales(loop: asyncio.AbstractEventLoop) -> dict:
+    """
+    Antepone un manejador propio a los de uvicorn para SIGINT y SIGTERM. Marca
+    la app como deteniéndose y, tras APAGADO_DEMORA segundos (solo con SIGTERM,
+    que es lo que manda el orquestador), restaura el manejador de uvicorn y le
+    reenvía la señal. Una segunda señal se reenvía en el acto. Devuelve los
+    manejadores anteriores para restaurarlos al terminar.
+    """
+    anteriores = {}
+    # signal.signal solo se puede usar desde el hilo principal (no, p. ej., con TestClient).
+    if threading.current_thread() is not threading.main_thread():
+        return anteriores
+
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        anterior = signal.getsignal(senal)
+        if anterior in (None, signal.SIG_IGN):
+            continue
+        anteriores[senal] = anterior
+
+        def reenviar(senal=senal, anterior=anterior):
+            signal.signal(senal, anterior)
+            signal.raise_signal(senal)
+
+        def manejador(numero, marco, senal=senal, reenviar=reenviar):
+            demora = APAGADO_DEMORA if senal == signal.SIGTERM and estado.fase != "deteniendo" else 0
+            loop.call_soon_threadsafe(_iniciar_apagado)
+            if demora > 0:
+                logger.info("Señal de apagado: se deja de aceptar conexiones en %.1f s", demora)
+                loop.call_soon_threadsafe(loop.call_later, demora, reenviar)
+            else:
+                loop.call_soon_threadsafe(reenviar)
+
+        signal.signal(senal, manejador)
+    return anteriores
+
+
+def restaurar_senales(anteriores: dict) -> None:
+    for senal, anterior in anteriores.items():
+        signal.signal(senal, anterior)
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    """
+    Arranque y apagado de la aplicación (lifespan de FastAPI).
+
+    Arranque: migraciones (opcional), tabla de agregados y su reconciliación
+    periódica, cola de trabajos y el calentamiento (pool, sentencias, catálogos
+    e índices de búsqueda). Apagado: al recibir la señal deja de figurar como
+    lista (ver instalar_senales); cuando uvicorn ya cerró las conexiones,
+    detiene las tareas y cierra los pools.
+    """
+    # 1. Lo imprescindible para atender.
+    if migraciones.DB_MIGRAR_AL_INICIAR:
+        async with _paso("migraciones"):
+            await migraciones.aplicar_migraciones()
+    async with _paso("agregados"):
+        if await agregados.crear_tabla():
+            # Tabla nueva: se llena por primera vez con el historial existente.
+            await agregados.reconciliar()
+    # Con varios workers, las tareas de mantenimiento corren en uno solo.
+    principal = es_principal()
+    tarea_reconciliacion = None
+    if agregados.AGREGADOS_RECONCILIAR_CADA > 0 and principal:
+        tarea_reconciliacion = asyncio.create_task(agregados.tarea_reconciliacion())
+    async with _paso("trabajos"):
+        await cola_trabajos.iniciar(recuperar=principal)
+    control_admision.abrir()
+    senales = instalar_senales(asyncio.get_running_loop())
+    # Con varios workers, /cambios y los índices siguen los cambios de todos (antes de cargarlos).
+    tarea_cambios = None
+    if difusor.compartido:
+        difusor.iniciar()
+        difusor.escuchar(aplicar_cambio_remoto)
+        tarea_cambios = asyncio.create_task(difusor.sincronizar())
+
+    # 2. El calentamiento, antes de atender o en segundo plano.
+    tarea_calentamiento = None
+    if ARRANQUE_EN_SEGUNDO_PLANO:
+        tarea_calentamiento = asyncio.create_task(calentar())
+    else:
+        await calentar()
+
+    try:
+        yield
+    finally:
+        # Sin señal (p. ej. con TestClient) se marca acá.
+        _iniciar_apagado()
+        restaurar_senales(senales)
+        for tarea in (tarea_calentamiento, tarea_reconciliacion, tarea_cambios):
+            if tarea and not tarea.done():
+                tarea.cancel()
+        # Los trabajos en curso quedan pendientes y se retoman en el próximo inicio.
+        await cola_trabajos.detener()
+        pdf.cerrar()
+        pool_hash.cerrar()
+        control_admision.cerrar()
+        almacen_compartido.cerrar()
+        await engine.dispose()
+        if engine_lectura is not engine:
+            await engine_lectura.dispose()
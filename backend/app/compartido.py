@@ -0,0 +1,355 @@
+import hashlib
+import logging
+import os
+import pickle
+import secrets
+import sqlite3
+import tempfile
+import time
+from threading import Lock
+
+from .cache import CacheTTL
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# WEB_WORKERS: procesos que atienden la API en esta máquina (lo define app/servir.py).
+# COMPARTIDO_ACTIVO: "1" guarda las versiones de los catálogos, sus páginas ya serializadas,
+#   los usuarios autenticados, las respuestas idempotentes y el registro de cambios de
+#   /cambios en un almacén que comparten los workers. Por defecto se activa con más de un worker.
+# COMPARTIDO_DIR: carpeta local del almacén; por defecto una por usuario, base de datos y
+#   puerto (SERVIR_PUERTO) en /dev/shm (memoria) si existe. Tiene que ser solo del usuario
+#   que corre la app: los valores se guardan con pickle.
+# COMPARTIDO_MMAP_MB: megas del archivo que SQLite lee por mmap, sin copiar a su caché de páginas.
+WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS", "1")))
+COMPARTIDO_ACTIVO = os.getenv("COMPARTIDO_ACTIVO", "1" if WEB_WORKERS > 1 else "0") == "1"
+# Identifica la instancia (usuario, base de datos y puerto) en los nombres de carpetas locales.
+INSTANCIA = hashlib.sha1("|".join((
+    str(os.getuid()) if hasattr(os, "getuid") else os.getenv("USERNAME", ""),
+    os.getenv("DATABASE_URL") or f"{os.getenv('MYSQL_HOST')}:{os.getenv('MYSQL_PORT')}/{os.getenv('MYSQL_DB')}",
+    os.getenv("SERVIR_PUERTO", ""),
+)).encode()).hexdigest()[:12]
+COMPARTIDO_DIR = os.getenv("COMPARTIDO_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), f"tp_final-{INSTANCIA}"
+)
+COMPARTIDO_MMAP_MB = int(os.getenv("COMPARTIDO_MMAP_MB", "256"))
+
+ARCHIVO_ALMACEN = "compartido.db"
+ARCHIVO_PRINCIPAL = "principal.lock"
+
+
+def preparar_carpeta(carpeta: str) -> None:
+    """
+    Crea la carpeta solo para el usuario actual y verifica que sea suya: el
+    almacén lee valores con pickle, y leer un pickle escrito por otro usuario es
+    ejecutar su código.
+    """
+    os.makedirs(carpeta, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return  # Windows: sin dueño ni permisos POSIX que verificar
+    info = os.stat(carpeta)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"La carpeta {carpeta} es de otro usuario (uid {info.st_uid})")
+    if info.st_mode & 0o077:
+        os.chmod(carpeta, 0o700)
+
+
+class AlmacenCompartido:
+    """
+    Base SQLite local (en memoria compartida si hay /dev/shm) con los datos de
+    lectura frecuente que tienen que ver todos los workers: una versión por
+    catálogo y entradas clave/valor con vencimiento.
+
+    A diferencia de AlmacenTrabajos, las consultas corren en el event loop: son
+    lecturas por mmap de un archivo en memoria y tardan microsegundos, menos
+    que pasarlas a un hilo. Cada proceso abre su propia conexión al usarla.
+    """
+
+    PURGAR_CADA = 500  # escrituras entre dos limpiezas de entradas vencidas
+
+    def __init__(self, carpeta: str):
+        self.ruta = os.path.join(carpeta, ARCHIVO_ALMACEN)
+        self._conexion: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        self._lock = Lock()
+        self._escrituras = 0
+        self.errores = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Una conexión heredada de otro proceso (fork) no se puede usar: se abre otra.
+        if self._conexion is None or self._pid != os.getpid():
+            preparar_carpeta(os.path.dirname(self.ruta))
+            conexion = sqlite3.connect(self.ruta, timeout=1, check_same_thread=False, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=OFF")  # se reconstruye solo: no hace falta durabilidad
+            conexion.execute(f"PRAGMA mmap_size={COMPARTIDO_MMAP_MB * 2**20}")
+            conexion.execute("CREATE TABLE IF NOT EXISTS versiones (nombre TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS entradas (
+                    espacio TEXT NOT NULL,
+                    clave TEXT NOT NULL,
+                    valor BLOB NOT NULL,
+                    expira REAL NOT NULL,
+                    PRIMARY KEY (espacio, clave)
+                )
+            """)
+            conexion.execute("CREATE INDEX IF NOT EXISTS ix_entradas_expira ON entradas (espacio, expira)")
+            # Registro de cambios para /cambios (app/cambios.py): el seq es el mismo en todos los workers.
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS cambios (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pid INTEGER NOT NULL,
+                    recurso TEXT NOT NULL,
+                    accion TEXT NOT NULL,
+                    datos TEXT NOT NULL,
+                    usuario_id INTEGER
+                )
+            """)
+            self._conexion, self._pid = conexion, os.getpid()
+        return self._conexion
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._conexion is not None and self._pid == os.getpid():
+                self._conexion.close()
+            self._conexion = None
+
+    # --- Versiones ---
+    # Si el almacén falla, `version` devuelve None y quien la usa lo trata como
+    # un fallo de caché (ni 304 ni respuesta guardada).
+
+    def version(self, nombre: str) -> int | None:
+        try:
+            with self._lock:
+                fila = self._conectar().execute("SELECT version FROM versiones WHERE nombre = ?", (nombre,)).fetchone()
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló la lectura de la versión de %s del almacén compartido", nombre, exc_info=True)
+            return None
+        return fila[0] if fila else 0
+
+    def incrementar(self, nombre: str) -> int | None:
+        try:
+            with self._lock:
+                return self._conectar().execute(
+                    "INSERT INTO versiones (nombre, version) VALUES (?, 1) "
+                    "ON CONFLICT (nombre) DO UPDATE SET version = version + 1 RETURNING version",
+                    (nombre,)
+                ).fetchone()[0]
+        except sqlite3.Error:
+            self.errores += 1
+            logger.error("No se pudo avanzar la versión de %s en el almacén compartido", nombre, exc_info=True)
+            return None
+
+    # --- Registro de cambios ---
+
+    def epoca(self) -> str | None:
+        """
+        Época del registro de cambios: la crea el primero que la pide y cambia con
+        reiniciar(). None si falló el almacén.
+        """
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                conexion.execute("INSERT OR IGNORE INTO versiones (nombre, version) VALUES ('cambios_epoca', ?)",
+                                 (secrets.randbits(31),))
+                fila = conexion.execute("SELECT version FROM versiones WHERE nombre = 'cambios_epoca'").fetchone()
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló la lectura de la época del almacén compartido", exc_info=True)
+            return None
+        return f"{fila[0]:08x}"
+
+    def registrar_cambio(self, recurso: str, accion: str, datos: str, usuario_id: int | None,
+                         conservar: int) -> int | None:
+        """Agrega un cambio (datos ya en JSON) y devuelve su seq; None si falló el almacén."""
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                seq = conexion.execute(
+                    "INSERT INTO cambios (pid, recurso, accion, datos, usuario_id) VALUES (?, ?, ?, ?, ?) RETURNING seq",
+                    (os.getpid(), recurso, accion, datos, usuario_id)
+                ).fetchone()[0]
+                self._escrituras += 1
+                if self._escrituras % self.PURGAR_CADA == 0:
+                    conexion.execute("DELETE FROM cambios WHERE seq <= ?", (seq - conservar,))
+                return seq
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló el registro de un cambio en el almacén compartido", exc_info=True)
+            return None
+
+    def cambios_desde(self, seq: int, limite: int) -> list[tuple] | None:
+        """Los cambios posteriores a `seq`, en orden: (seq, pid, recurso, accion, datos, usuario_id)."""
+        try:
+            with self._lock:
+                return self._conectar().execute(
+                    "SELECT seq, pid, recurso, accion, datos, usuario_id FROM cambios WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (seq, limite)
+                ).fetchall()
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló la lectura de cambios del almacén compartido", exc_info=True)
+            return None
+
+    # --- Entradas clave/valor ---
+    # Un error del almacén se trata como un fallo de caché: la petición va a la base.
+
+    def obtener(self, espacio: str, clave: str):
+        try:
+            with self._lock:
+                fila = self._conectar().execute(
+                    "SELECT valor FROM entradas WHERE espacio = ? AND clave = ? AND expira >= ?",
+                    (espacio, clave, time.time())
+                ).fetchone()
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló la lectura del almacén compartido", exc_info=True)
+            return None
+        return pickle.loads(fila[0]) if fila else None
+
+    def guardar(self, espacio: str, clave: str, valor, ttl: float, tamanio_maximo: int) -> None:
+        datos = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            with self._lock:
+                conexion = self._conectar()
+                # Reloj de pared: el monotónico no es comparable entre procesos.
+                ahora = time.time()
+                conexion.execute(
+                    "INSERT OR REPLACE INTO entradas (espacio, clave, valor, expira) VALUES (?, ?, ?, ?)",
+                    (espacio, clave, datos, ahora + ttl)
+                )
+                self._escrituras += 1
+                if self._escrituras % self.PURGAR_CADA == 0:
+                    self._purgar(conexion, espacio, ahora, tamanio_maximo)
+        except sqlite3.Error:
+            self.errores += 1
+            logger.warning("Falló la escritura en el almacén compartido", exc_info=True)
+
+    @staticmethod
+    def _purgar(conexion, espacio: str, ahora: float, tamanio_maximo: int) -> None:
+        conexion.execute("DELETE FROM entradas WHERE expira < ?", (ahora,))
+        # Si el espacio sigue excedido, se van las que vencen antes.
+        conexion.execute(
+            "DELETE FROM entradas WHERE espacio = ? AND clave IN ("
+            "SELECT clave FROM entradas WHERE espacio = ? ORDER BY expira DESC LIMIT -1 OFFSET ?)",
+            (espacio, espacio, tamanio_maximo)
+        )
+
+    def borrar(self, espacio: str, clave: str | None = None) -> None:
+        try:
+            with self._lock:
+                if clave is None:
+                    self._conectar().execute("DELETE FROM entradas WHERE espacio = ?", (espacio,))
+                else:
+                    self._conectar().execute("DELETE FROM entradas WHERE espacio = ? AND clave = ?", (espacio, clave))
+        except sqlite3.Error:
+            self.errores += 1
+            logger.error("Falló un borrado en el almacén compartido", exc_info=True)
+
+    def reiniciar(self) -> None:
+        """
+        Descarta las entradas y el registro de cambios, avanza todas las versiones
+        y elige otra época de cambios. Lo llama app/servir.py antes de lanzar los
+        workers: la base pudo cambiar mientras la app estaba detenida, y los ETag
+        y los ids de eventos de antes del reinicio dejan de coincidir.
+        """
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute("DELETE FROM entradas")
+            conexion.execute("DELETE FROM cambios")
+            conexion.execute("UPDATE versiones SET version = version + 1")
+            conexion.execute("INSERT OR REPLACE INTO versiones (nombre, version) VALUES ('cambios_epoca', ?)",
+                             (secrets.randbits(31),))
+
+    def contar(self, espacio: str) -> int | None:
+        try:
+            with self._lock:
+                return self._conectar().execute(
+                    "SELECT COUNT(*) FROM entradas WHERE espacio = ?", (espacio,)
+                ).fetchone()[0]
+        except sqlite3.Error:
+            self.errores += 1
+            return None
+
+
+almacen = AlmacenCompartido(COMPARTIDO_DIR)
+
+
+class CacheCompartida:
+    """
+    Misma interfaz que CacheTTL, con las entradas en el almacén compartido:
+    lo que guarda o invalida un worker lo ven todos. Las claves se guardan
+    por su repr() y los valores con pickle (el archivo es local, en una
+    carpeta a la que solo accede el usuario de la aplicación).
+    """
+
+    def __init__(self, espacio: str, tamanio_maximo: int = 1024, ttl: float = 60.0):
+        self.espacio = espacio
+        self.tamanio_maximo = tamanio_maximo
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        valor = almacen.obtener(self.espacio, repr(clave))
+        if valor is None:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return valor
+
+    def guardar(self, clave, valor) -> None:
+        almacen.guardar(self.espacio, repr(clave), valor, self.ttl, self.tamanio_maximo)
+
+    def invalidar(self, clave) -> None:
+        almacen.borrar(self.espacio, repr(clave))
+
+    def limpiar(self) -> None:
+        almacen.borrar(self.espacio)
+
+    def metricas(self) -> dict:
+        total = self.aciertos + self.fallos
+        return {
+            "compartida": True,
+            "tamanio": almacen.contar(self.espacio),
+            "tamanio_maximo": self.tamanio_maximo,
+            "ttl": self.ttl,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+        }
+
+
+def crear_cache(espacio: str, tamanio_maximo: int, ttl: float) -> CacheTTL | CacheCompartida:
+    """CacheCompartida con COMPARTIDO_ACTIVO; si no, una CacheTTL del proceso."""
+    if COMPARTIDO_ACTIVO:
+        return CacheCompartida(espacio, tamanio_maximo=tamanio_maximo, ttl=ttl)
+    return CacheTTL(tamanio_maximo=tamanio_maximo, ttl=ttl)
+
+
+_archivo_principal = None
+
+
+def es_principal() -> bool:
+    """
+    True en un solo worker de la máquina: el que tiene el lock de
+    `principal.lock`. Ahí corren las tareas que no deben repetirse por worker
+    (la reconciliación periódica de agregados, retomar trabajos interrumpidos).
+    El lock se libera al terminar el proceso; con un solo worker siempre es True.
+    """
+    global _archivo_principal
+    if WEB_WORKERS == 1:
+        return True
+    if _archivo_principal is not None:
+        return True
+    import fcntl  # solo POSIX; con un worker (p. ej. en Windows) no se llega acá
+    preparar_carpeta(COMPARTIDO_DIR)
+    archivo = open(os.path.join(COMPARTIDO_DIR, ARCHIVO_PRINCIPAL), "w")
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        archivo.close()
+        return False
+    _archivo_principal = archivo
+    return True
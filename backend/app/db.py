@@ -1,11 +1,16 @@
+import logging
 import os
-from dotenv import load_dotenv
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-# Carga las variables de entorno desde el archivo `.env` en el directorio raíz.
-load_dotenv()
+from .compartido import WEB_WORKERS
 
+logger = logging.getLogger(__name__)
+
+# Las variables de entorno (y el archivo `.env`) se cargan en app/__init__.py.
 # Obtiene las credenciales de la base de datos de las variables de entorno.
 DB_USER = os.getenv("MYSQL_USER")
 DB_PASS = os.getenv("MYSQL_PASSWORD")
@@ -13,11 +18,114 @@ DB_HOST = os.getenv("MYSQL_HOST")
 DB_PORT = os.getenv("MYSQL_PORT")
 DB_NAME = os.getenv("MYSQL_DB")
 
-# Crea la URL de conexión para MySQL asíncrono (aiomysql)
-DB_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}" # type: ignore
+# Crea la URL de conexión para MySQL asíncrono (aiomysql).
+# DATABASE_URL permite apuntar a otra base completa (p. ej. SQLite en los benchmarks).
+DB_URL = os.getenv("DATABASE_URL") or f"mysql+aiomysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}" # type: ignore
+
+# Réplica de solo lectura opcional. Si MYSQL_REPLICA_HOST no está definido,
+# las lecturas usan el mismo motor que las escrituras.
+DB_REPLICA_HOST = os.getenv("MYSQL_REPLICA_HOST")
+DB_REPLICA_PORT = os.getenv("MYSQL_REPLICA_PORT", DB_PORT)
+DB_REPLICA_URL = (
+    f"mysql+aiomysql://{DB_USER}:{DB_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}" # type: ignore
+    if DB_REPLICA_HOST else None
+)
+
+# --- Configuración del pool de conexiones (variables de entorno) ---
+def _env_bool(nombre: str, defecto: bool) -> bool:
+    return os.getenv(nombre, "1" if defecto else "0").lower() in ("1", "true", "si", "yes")
+
+DB_ECHO = _env_bool("DB_ECHO", False)                              # Log de cada sentencia SQL.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))                 # Conexiones permanentes.
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))          # Conexiones extra en picos.
+# Presupuesto de conexiones de toda la máquina (todos los workers). Si está definido,
+# reemplaza a DB_POOL_SIZE/DB_MAX_OVERFLOW: cada worker se queda con su parte, un
+# tercio permanentes y el resto de overflow. Con réplica, vale para cada servidor.
+DB_CONEXIONES_TOTALES = int(os.getenv("DB_CONEXIONES_TOTALES", "0"))  # 0 = sin presupuesto.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # Segundos antes de reciclar una conexión.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))        # Espera máxima por una conexión libre.
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)             # Verifica la conexión antes de usarla.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")) # 0 = sin límite.
+
+
+def repartir_conexiones(total: int, workers: int) -> tuple[int, int]:
+    """(pool_size, max_overflow) de cada worker para no pasar de `total` entre todos."""
+    if total < workers:
+        # Cada worker necesita al menos una conexión: el presupuesto no se puede respetar.
+        logger.warning(
+            "DB_CONEXIONES_TOTALES=%d es menor que la cantidad de workers (%d): se usará una "
+            "conexión por worker, %d en total. Conviene bajar WEB_WORKERS o subir el presupuesto.",
+            total, workers, workers,
+        )
+    por_worker = max(1, total // workers)
+    permanentes = max(1, por_worker // 3)
+    return permanentes, por_worker - permanentes
+
+
+if DB_CONEXIONES_TOTALES > 0:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW = repartir_conexiones(DB_CONEXIONES_TOTALES, WEB_WORKERS)
+
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """Pool de conexiones que mide cuánto se espera para obtener una conexión."""
 
-# Inicializa el motor de la base de datos asíncrono. `echo=True` habilita el log de SQL.
-engine = create_async_engine(DB_URL, echo=True, pool_pre_ping=True)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.esperando = 0  # pedidos de conexión que todavía no obtuvieron una
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        self.esperando += 1
+        try:
+            return super()._do_get()
+        finally:
+            self.esperando -= 1
+            espera = time.perf_counter() - inicio
+            self.esperas += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+
+    def metricas(self) -> dict:
+        return {
+            "tamanio": self.size(),
+            "en_uso": self.checkedout(),
+            "libres": self.checkedin(),
+            "overflow": self.overflow(),
+            "esperando": self.esperando,
+            "esperas": self.esperas,
+            "espera_promedio_ms": round(self.espera_total / self.esperas * 1000, 3) if self.esperas else 0.0,
+            "espera_maxima_ms": round(self.espera_maxima * 1000, 3),
+        }
+
+
+def crear_engine(url: str):
+    """Crea un motor asíncrono con la configuración de pool del entorno."""
+    nuevo_engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        poolclass=PoolMedido,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    if DB_STATEMENT_TIMEOUT_MS > 0 and nuevo_engine.dialect.name == "mysql":
+        # Límite de tiempo por sentencia (MySQL lo aplica a los SELECT).
+        @event.listens_for(nuevo_engine.sync_engine, "connect")
+        def _limitar_sentencias(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION max_execution_time = {DB_STATEMENT_TIMEOUT_MS}")
+            cursor.close()
+    return nuevo_engine
+
+
+# Inicializa el motor de la base de datos asíncrono (y el de la réplica, si existe).
+engine = crear_engine(DB_URL)
+engine_lectura = crear_engine(DB_REPLICA_URL) if DB_REPLICA_URL else engine
 
 # Configura una fábrica de sesiones asíncronas para interactuar con la base de datos.
 AsyncSessionLocal = sessionmaker(
@@ -26,7 +134,25 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+AsyncSessionLectura = sessionmaker(
+    bind=engine_lectura,
+    class_=AsyncSession,
+    expire_on_commit=False
+) if engine_lectura is not engine else AsyncSessionLocal
+
 # Función de dependencia de FastAPI que proporciona una sesión de base de datos por cada solicitud.
 async def get_session():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+# Igual que get_session, pero contra la réplica de lectura. Solo para rutas GET que no escriben.
+async def get_session_lectura():
+    async with AsyncSessionLectura() as session:
+        yield session
+
+def metricas_pool() -> dict:
+    """Estado de los pools de conexiones (principal y réplica)."""
+    metricas = {"principal": engine.pool.metricas()}
+    if engine_lectura is not engine:
+        metricas["replica"] = engine_lectura.pool.metricas()
+    return metricas
@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from . import models
+
+# Cantidad de filas que se traen del cursor del servidor en cada tanda.
+FILAS_POR_TANDA = 1000
+
+TIPOS_CONTENIDO = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+f, c, u, d, p = models.Factura, models.Cliente, models.Usuario, models.Detalle, models.Producto
+
+COLUMNAS_FACTURAS = ["id", "fecha", "cliente_id", "cliente_nombre", "cliente_apellido", "creador_username"]
+COLUMNAS_DETALLE = ["factura_id", "fecha", "producto_id", "producto_nombre", "cantidad", "precio", "importe"]
+
+
+def _filtrar(stmt, current_user, desde, hasta, creador_id):
+    # Mismas reglas que listar_facturas: un usuario normal solo exporta lo suyo.
+    if current_user.rol != 'admin':
+        stmt = stmt.where(f.creado_por_usuario_id == current_user.id)
+    elif creador_id is not None:
+        stmt = stmt.where(f.creado_por_usuario_id == creador_id)
+    if desde:
+        stmt = stmt.where(f.fecha >= desde)
+    if hasta:
+        stmt = stmt.where(f.fecha < hasta)
+    return stmt
+
+
+def consulta_facturas(current_user, desde=None, hasta=None, creador_id=None):
+    """Cabeceras de las facturas con los nombres del cliente y del creador (COLUMNAS_FACTURAS)."""
+    stmt = (
+        select(
+            f.id,
+            f.fecha,
+            f.cliente_id,
+            c.nombre.label("cliente_nombre"),
+            c.apellido.label("cliente_apellido"),
+            u.username.label("creador_username"),
+        )
+        .select_from(f)
+        .outerjoin(c, f.cliente_id == c.id)
+        .outerjoin(u, f.creado_por_usuario_id == u.id)
+        .order_by(f.fecha, f.id)
+    )
+    return _filtrar(stmt, current_user, desde, hasta, creador_id)
+
+
+def consulta_detalle(current_user, desde=None, hasta=None, creador_id=None):
+    """Ítems de las facturas con el nombre del producto y el importe (COLUMNAS_DETALLE)."""
+    stmt = (
+        select(
+            d.factura_id,
+            f.fecha,
+            d.producto_id,
+            p.nombre.label("producto_nombre"),
+            d.cantidad,
+            d.precio,
+            (d.cantidad * d.precio).label("importe"),
+        )
+        .select_from(d)
+        .join(f, f.id == d.factura_id)
+        .join(p, p.id == d.producto_id)
+        .order_by(d.factura_id, d.producto_id)
+    )
+    return _filtrar(stmt, current_user, desde, hasta, creador_id)
+
+
+def _a_json(valor):
+    # Conversión de los tipos que json no sabe serializar.
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+async def _tandas(session_factory, stmt):
+    """
+    Recorre el resultado con un cursor del lado del servidor (AsyncSession.stream),
+    de a FILAS_POR_TANDA filas, así la memoria no depende del total de filas.
+    La sesión se abre acá porque la respuesta se sigue enviando después de que
+    termina el handler.
+    """
+    async with session_factory() as db:
+        result = await db.stream(stmt.execution_options(yield_per=FILAS_POR_TANDA))
+        async for tanda in result.mappings().partitions():
+            yield tanda
+
+
+async def generar_csv(session_factory, stmt, columnas: list[str]):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    yield buffer.getvalue()
+    async for tanda in _tandas(session_factory, stmt):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows([fila[c] for c in columnas] for fila in tanda)
+        yield buffer.getvalue()
+
+
+async def generar_ndjson(session_factory, stmt, columnas: list[str]):
+    async for tanda in _tandas(session_factory, stmt):
+        yield "".join(
+            json.dumps({c: fila[c] for c in columnas}, default=_a_json) + "\n"
+            for fila in tanda
+        )
+
+
+def generar(formato: str, session_factory, stmt, columnas: list[str]):
+    """Devuelve el generador asíncrono para el formato pedido ("csv" o "ndjson")."""
+    if formato == "csv":
+        return generar_csv(session_factory, stmt, columnas)
+    return generar_ndjson(session_factory, stmt, columnas)
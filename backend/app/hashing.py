@@ -0,0 +1,108 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError, InvalidHashError, VerificationError
+
+from .compartido import WEB_WORKERS
+
+# Instancia única de PasswordHasher (también la usan los procesos del pool).
+ph = PasswordHasher()
+
+# --- Configuración del pool (variables de entorno) ---
+# HASH_EJECUTOR: "thread" (por defecto, argon2-cffi libera el GIL) o "process".
+# HASH_WORKERS: cantidad de hilos/procesos del pool (por defecto, los núcleos repartidos entre los workers web).
+# HASH_MAX_CONCURRENCIA: máximo de operaciones Argon2 en curso; el resto espera en cola.
+HASH_EJECUTOR = os.getenv("HASH_EJECUTOR", "thread")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) // WEB_WORKERS)))))
+HASH_MAX_CONCURRENCIA = int(os.getenv("HASH_MAX_CONCURRENCIA", str(HASH_WORKERS)))
+
+
+# Funciones de nivel de módulo para que puedan serializarse hacia un ProcessPoolExecutor.
+def _verificar(hashed_password: str, plain_password: str) -> bool:
+    try:
+        return ph.verify(hashed_password, plain_password)
+    except (VerifyMismatchError, VerificationError, InvalidHashError):
+        return False
+
+
+def _hashear(password: str) -> str:
+    return ph.hash(password)
+
+
+class PoolHash:
+    """
+    Ejecuta Argon2 fuera del event loop en un pool acotado.
+    Un semáforo limita las operaciones en curso y lleva métricas de la cola.
+    """
+
+    def __init__(self, ejecutor: str = HASH_EJECUTOR, workers: int = HASH_WORKERS,
+                 max_concurrencia: int = HASH_MAX_CONCURRENCIA):
+        self.tipo = ejecutor
+        self.workers = workers
+        self.max_concurrencia = max_concurrencia
+        self._ejecutor: Executor | None = None
+        self._semaforo: asyncio.Semaphore | None = None
+        # Métricas
+        self.en_cola = 0
+        self.en_curso = 0
+        self.max_en_cola = 0
+        self.completadas = 0
+
+    def _obtener_ejecutor(self) -> Executor:
+        # Se crea de forma perezosa para no levantar procesos al importar el módulo.
+        if self._ejecutor is None:
+            if self.tipo == "process":
+                self._ejecutor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._ejecutor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="argon2")
+        return self._ejecutor
+
+    async def _ejecutar(self, funcion, *args):
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+        self.en_cola += 1
+        self.max_en_cola = max(self.max_en_cola, self.en_cola)
+        esperando = True
+        try:
+            async with self._semaforo:
+                self.en_cola -= 1
+                esperando = False
+                self.en_curso += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._obtener_ejecutor(), funcion, *args)
+                finally:
+                    self.en_curso -= 1
+                    self.completadas += 1
+        finally:
+            # Si se cancela mientras espera en la cola, se descuenta igual.
+            if esperando:
+                self.en_cola -= 1
+
+    async def verificar(self, hashed_password: str, plain_password: str) -> bool:
+        return await self._ejecutar(_verificar, hashed_password, plain_password)
+
+    async def hashear(self, password: str) -> str:
+        return await self._ejecutar(_hashear, password)
+
+    def metricas(self) -> dict:
+        return {
+            "ejecutor": self.tipo,
+            "workers": self.workers,
+            "max_concurrencia": self.max_concurrencia,
+            "en_cola": self.en_cola,
+            "en_curso": self.en_curso,
+            "max_en_cola": self.max_en_cola,
+            "completadas": self.completadas,
+        }
+
+    def cerrar(self):
+        if self._ejecutor is not None:
+            self._ejecutor.shutdown(wait=True)
+            self._ejecutor = None
+
+
+# Pool compartido por los endpoints de autenticación.
+pool_hash = PoolHash()
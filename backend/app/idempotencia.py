@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from .compartido import crear_cache
+
+# Cabecera con la que el cliente identifica una operación para poder reintentarla.
+CABECERA_IDEMPOTENCIA = "Idempotency-Key"
+# Cabecera que marca una respuesta repetida (no se volvió a ejecutar la operación).
+CABECERA_REPETIDA = "Idempotent-Replayed"
+
+# --- Configuración (variables de entorno) ---
+# IDEMPOTENCIA_TTL: segundos que se recuerda la respuesta de cada clave.
+# IDEMPOTENCIA_TAMANIO: cantidad máxima de claves recordadas (las más viejas se descartan).
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", str(24 * 3600)))
+IDEMPOTENCIA_TAMANIO = int(os.getenv("IDEMPOTENCIA_TAMANIO", "10000"))
+
+LARGO_MAXIMO_CLAVE = 255
+
+# Errores transitorios (conflicto de concurrencia, límite de tasa, servicio
+# saturado): no son el resultado final de la operación, el reintento la vuelve a ejecutar.
+ESTADOS_TRANSITORIOS = frozenset({409, 429, 503})
+
+
+class RegistroIdempotencia:
+    """
+    Recuerda la respuesta de cada operación identificada con `Idempotency-Key`.
+
+    - Si la clave ya se usó, devuelve la respuesta guardada sin tocar la base.
+    - Si llega la misma clave mientras la primera petición todavía corre, la
+      segunda espera a la primera y devuelve su resultado (una sola escritura).
+    - Si la clave se reutiliza con otro cuerpo, responde 422.
+    Solo se guardan las respuestas exitosas y los errores 4xx definitivos: ante
+    un 5xx, un error transitorio (ESTADOS_TRANSITORIOS) o si la primera petición
+    se corta, el reintento vuelve a ejecutar la operación.
+    Con varios workers las respuestas guardadas se comparten; la espera de una
+    petición igual en curso solo agrupa las que llegan al mismo worker.
+    """
+
+    def __init__(self, tamanio_maximo: int, ttl: float):
+        self._respuestas = crear_cache("idempotencia", tamanio_maximo=tamanio_maximo, ttl=ttl)
+        self._en_curso: dict[tuple, asyncio.Future] = {}
+        self.repetidas = 0
+        self.agrupadas = 0
+
+    @staticmethod
+    def _huella(datos) -> str:
+        return hashlib.sha256(json.dumps(jsonable_encoder(datos), sort_keys=True).encode()).hexdigest()
+
+    def _repetir(self, guardada: tuple, huella: str) -> JSONResponse:
+        huella_original, status_code, contenido = guardada
+        if huella_original != huella:
+            raise HTTPException(
+                status_code=422, detail=f"La {CABECERA_IDEMPOTENCIA} ya se usó con otro cuerpo"
+            )
+        self.repetidas += 1
+        return JSONResponse(status_code=status_code, content=contenido, headers={CABECERA_REPETIDA: "true"})
+
+    async def ejecutar(self, clave: str | None, alcance: tuple, datos, status_code: int, operacion):
+        """
+        Ejecuta `operacion()` (una corrutina sin argumentos) una sola vez por clave.
+        `alcance` separa las claves por endpoint y recurso; `datos` es el cuerpo
+        de la petición, para detectar una clave reutilizada con otro contenido.
+        Sin clave, simplemente ejecuta la operación.
+        """
+        if clave is None:
+            return await operacion()
+        if not clave or len(clave) > LARGO_MAXIMO_CLAVE:
+            raise HTTPException(
+                status_code=400, detail=f"{CABECERA_IDEMPOTENCIA} debe tener entre 1 y {LARGO_MAXIMO_CLAVE} caracteres"
+            )
+        id_ = (*alcance, clave)
+        huella = self._huella(datos)
+
+        # 1. Respuesta ya guardada, o una petición igual en curso a la que esperar.
+        while True:
+            guardada = self._respuestas.obtener(id_)
+            if guardada is not None:
+                return self._repetir(guardada, huella)
+            futuro = self._en_curso.get(id_)
+            if futuro is None:
+                break
+            self.agrupadas += 1
+            await asyncio.wait([futuro])
+            if not futuro.cancelled():
+                return self._repetir(futuro.result(), huella)
+            # La primera falló sin dejar respuesta: se vuelve a intentar.
+
+        # 2. Esta petición ejecuta la operación; las repetidas esperan en `futuro`.
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[id_] = futuro
+        try:
+            try:
+                contenido = await operacion()
+                guardada = (huella, status_code, jsonable_encoder(contenido))
+            except HTTPException as e:
+                if e.status_code >= 500 or e.status_code in ESTADOS_TRANSITORIOS:
+                    raise
+                guardada = (huella, e.status_code, {"detail": e.detail})
+            self._respuestas.guardar(id_, guardada)
+            futuro.set_result(guardada)
+        finally:
+            if not futuro.done():
+                futuro.cancel()
+            del self._en_curso[id_]
+        return JSONResponse(status_code=guardada[1], content=guardada[2])
+
+    def metricas(self) -> dict:
+        return {
+            "repetidas": self.repetidas,
+            "agrupadas": self.agrupadas,
+            "en_curso": len(self._en_curso),
+            **self._respuestas.metricas(),
+        }
+
+
+registro_idempotencia = RegistroIdempotencia(IDEMPOTENCIA_TAMANIO, IDEMPOTENCIA_TTL)
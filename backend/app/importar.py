@@ -0,0 +1,181 @@
+import csv
+import json
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Filas que se validan y escriben juntas en un único INSERT multi-fila.
+TAMANIO_LOTE = 1000
+# Máximo de errores que se devuelven detallados (el total se cuenta igual).
+MAX_ERRORES_INFORMADOS = 1000
+# Bytes máximos de una línea: sin salto de línea, el cuerpo entero quedaría en memoria.
+MAX_BYTES_POR_LINEA = 64 * 1024
+
+
+def formato_de(request: Request, formato: str | None) -> str:
+    """Determina el formato del cuerpo: parámetro explícito o Content-Type."""
+    if formato:
+        return formato
+    tipo = request.headers.get("content-type", "")
+    if "ndjson" in tipo or "jsonl" in tipo:
+        return "ndjson"
+    if "csv" in tipo:
+        return "csv"
+    raise HTTPException(status_code=415, detail="Formato no soportado: use text/csv o application/x-ndjson")
+
+
+def _decodificar(linea) -> str:
+    if len(linea) > MAX_BYTES_POR_LINEA:
+        raise HTTPException(status_code=413, detail=f"Hay una línea de más de {MAX_BYTES_POR_LINEA} bytes")
+    try:
+        return linea.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El cuerpo no está codificado en UTF-8")
+
+
+async def _lineas(request: Request):
+    """
+    Recorre el cuerpo de la petición línea por línea, sin cargarlo entero en memoria.
+    Los trozos se acumulan en un bytearray y se recorren con un desplazamiento: lo ya
+    leído se descarta una vez por trozo, sin copiar el resto en cada línea.
+    """
+    pendiente = bytearray()
+    async for trozo in request.stream():
+        pendiente += trozo
+        inicio = 0
+        while (fin := pendiente.find(b"\n", inicio)) >= 0:
+            yield _decodificar(pendiente[inicio:fin])
+            inicio = fin + 1
+        del pendiente[:inicio]
+        if len(pendiente) > MAX_BYTES_POR_LINEA:
+            _decodificar(pendiente)  # lanza 413
+    if pendiente:
+        yield _decodificar(pendiente)
+
+
+async def lotes_de_filas(request: Request, formato: str):
+    """
+    Devuelve lotes de (número de fila, dict) de a TAMANIO_LOTE filas.
+    En CSV la primera línea es la cabecera con los nombres de los campos.
+    """
+    cabecera = None
+    lote = []
+    numero = 0
+    async for linea in _lineas(request):
+        if not linea.strip():
+            continue
+        if formato == "csv" and cabecera is None:
+            cabecera = next(csv.reader([linea]))
+            continue
+        numero += 1
+        try:
+            if formato == "csv":
+                fila = dict(zip(cabecera, next(csv.reader([linea]))))
+                # En CSV un campo vacío es un valor ausente (p. ej. dirección opcional).
+                fila = {k: v for k, v in fila.items() if v != ""}
+            else:
+                fila = json.loads(linea)
+        except (json.JSONDecodeError, csv.Error) as e:
+            fila = e
+        lote.append((numero, fila))
+        if len(lote) >= TAMANIO_LOTE:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def sentencia_upsert(db: AsyncSession, tabla, filas: list[dict], clave: str):
+    """
+    INSERT multi-fila que actualiza las columnas no clave si la fila ya existe
+    (ON DUPLICATE KEY UPDATE en MySQL, ON CONFLICT en SQLite).
+    """
+    columnas = [c for c in filas[0] if c != clave]
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite_insert(tabla).values(filas)
+        return stmt.on_conflict_do_update(
+            index_elements=[clave], set_={c: stmt.excluded[c] for c in columnas}
+        )
+    stmt = mysql_insert(tabla).values(filas)
+    return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in columnas})
+
+
+class ResultadoImportacion:
+    """Acumula el resultado de una importación con memoria acotada."""
+
+    def __init__(self):
+        self.procesadas = 0
+        self.guardadas = 0
+        self.cantidad_errores = 0
+        self.errores: list[dict] = []
+        # Si el cuerpo es inválido a mitad de camino (línea demasiado larga, no UTF-8):
+        # el error a devolver una vez que el handler invalidó lo ya guardado.
+        self.corte: HTTPException | None = None
+
+    def error(self, fila: int, mensaje: str) -> None:
+        self.cantidad_errores += 1
+        if len(self.errores) < MAX_ERRORES_INFORMADOS:
+            self.errores.append({"fila": fila, "error": mensaje})
+
+    def como_dict(self) -> dict:
+        return {
+            "procesadas": self.procesadas,
+            "guardadas": self.guardadas,
+            "cantidad_errores": self.cantidad_errores,
+            "errores": self.errores,
+        }
+
+
+async def importar(request: Request, formato: str, db: AsyncSession, tabla,
+                   schema: type[BaseModel], clave: str) -> ResultadoImportacion:
+    """
+    Valida las filas por lotes con `schema` y las escribe con un upsert por lote.
+    Si un lote falla en la base, se reintenta fila por fila para aislar los
+    errores sin abortar el resto de la importación.
+    """
+    resultado = ResultadoImportacion()
+    try:
+        await _importar_lotes(resultado, request, formato, db, tabla, schema, clave)
+    except HTTPException as e:
+        resultado.corte = HTTPException(
+            status_code=e.status_code,
+            detail=f"{e.detail}. Se guardaron {resultado.guardadas} filas antes del error."
+        )
+    return resultado
+
+
+async def _importar_lotes(resultado: ResultadoImportacion, request: Request, formato: str, db: AsyncSession,
+                          tabla, schema: type[BaseModel], clave: str) -> None:
+    async for lote in lotes_de_filas(request, formato):
+        validas: list[tuple[int, dict]] = []
+        for numero, fila in lote:
+            resultado.procesadas += 1
+            if isinstance(fila, Exception):
+                resultado.error(numero, f"Fila mal formada: {fila}")
+                continue
+            try:
+                validas.append((numero, schema.model_validate(fila).model_dump()))
+            except ValidationError as e:
+                errores = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                resultado.error(numero, errores)
+        if not validas:
+            continue
+
+        try:
+            await db.execute(sentencia_upsert(db, tabla, [f for _, f in validas], clave))
+            await db.commit()
+            resultado.guardadas += len(validas)
+        except SQLAlchemyError:
+            await db.rollback()
+            for numero, fila in validas:
+                try:
+                    await db.execute(sentencia_upsert(db, tabla, [fila], clave))
+                    await db.commit()
+                    resultado.guardadas += 1
+                except SQLAlchemyError as e:
+                    await db.rollback()
+                    resultado.error(numero, f"Error de base de datos: {e.orig if hasattr(e, 'orig') else e}")
@@ -0,0 +1,179 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from threading import Lock
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# INSTRUMENTACION_MAX_CONSULTAS: más consultas que esto en una petición se reporta como posible N+1.
+# INSTRUMENTACION_CONSULTA_LENTA_MS: las sentencias más lentas que esto se registran en el log.
+INSTRUMENTACION_MAX_CONSULTAS = int(os.getenv("INSTRUMENTACION_MAX_CONSULTAS", "20"))
+INSTRUMENTACION_CONSULTA_LENTA_MS = float(os.getenv("INSTRUMENTACION_CONSULTA_LENTA_MS", "200"))
+
+# Límites de los buckets del histograma de latencia (segundos).
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+@dataclass
+class MedicionPeticion:
+    """Lo que se acumula durante una petición."""
+    consultas: int = 0
+    tiempo_db: float = 0.0
+    consulta_mas_lenta: float = 0.0
+    sql_mas_lenta: str = ""
+
+
+# Medición de la petición en curso. Los eventos de SQLAlchemy corren en el mismo
+# contexto que el handler, así que pueden sumar a este objeto.
+_medicion: ContextVar[MedicionPeticion | None] = ContextVar("medicion", default=None)
+
+
+@dataclass
+class _MetricasRuta:
+    peticiones: int = 0
+    segundos: float = 0.0
+    consultas: int = 0
+    segundos_db: float = 0.0
+    n_mas_uno: int = 0
+    buckets: list[int] | None = None
+
+
+class RegistroMetricas:
+    """Acumula las métricas por ruta y las exporta en formato de texto de Prometheus."""
+
+    def __init__(self):
+        self._rutas: dict[tuple[str, str, int], _MetricasRuta] = {}
+        self._lock = Lock()
+
+    def registrar(self, metodo: str, ruta: str, estado: int, segundos: float, medicion: MedicionPeticion):
+        with self._lock:
+            m = self._rutas.get((metodo, ruta, estado))
+            if m is None:
+                m = self._rutas[(metodo, ruta, estado)] = _MetricasRuta(buckets=[0] * len(BUCKETS))
+            m.peticiones += 1
+            m.segundos += segundos
+            m.consultas += medicion.consultas
+            m.segundos_db += medicion.tiempo_db
+            if medicion.consultas > INSTRUMENTACION_MAX_CONSULTAS:
+                m.n_mas_uno += 1
+            for i, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    m.buckets[i] += 1
+
+    def exportar(self, extras: list[str] = ()) -> str:
+        lineas = [
+            "# TYPE http_peticiones_segundos histogram",
+            "# TYPE http_peticiones_consultas_sql_total counter",
+            "# TYPE http_peticiones_segundos_db_total counter",
+            "# TYPE http_peticiones_n_mas_uno_total counter",
+        ]
+        with self._lock:
+            for (metodo, ruta, estado), m in sorted(self._rutas.items()):
+                etiquetas = f'metodo="{metodo}",ruta="{ruta}",estado="{estado}"'
+                for limite, cantidad in zip(BUCKETS, m.buckets):
+                    lineas.append(f'http_peticiones_segundos_bucket{{{etiquetas},le="{limite}"}} {cantidad}')
+                lineas.append(f'http_peticiones_segundos_bucket{{{etiquetas},le="+Inf"}} {m.peticiones}')
+                lineas.append(f"http_peticiones_segundos_sum{{{etiquetas}}} {m.segundos:.6f}")
+                lineas.append(f"http_peticiones_segundos_count{{{etiquetas}}} {m.peticiones}")
+                lineas.append(f"http_peticiones_consultas_sql_total{{{etiquetas}}} {m.consultas}")
+                lineas.append(f"http_peticiones_segundos_db_total{{{etiquetas}}} {m.segundos_db:.6f}")
+                lineas.append(f"http_peticiones_n_mas_uno_total{{{etiquetas}}} {m.n_mas_uno}")
+        lineas.extend(extras)
+        return "\n".join(lineas) + "\n"
+
+
+registro = RegistroMetricas()
+
+
+# --- Hooks de SQLAlchemy ---
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consulta", []).append(time.perf_counter())
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    duracion = time.perf_counter() - conn.info["inicio_consulta"].pop()
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.consultas += 1
+        medicion.tiempo_db += duracion
+        if duracion > medicion.consulta_mas_lenta:
+            medicion.consulta_mas_lenta = duracion
+            medicion.sql_mas_lenta = statement
+    if duracion * 1000 > INSTRUMENTACION_CONSULTA_LENTA_MS:
+        logger.warning("Consulta lenta (%.1f ms): %s", duracion * 1000, statement[:500])
+
+
+def instrumentar_engine(engine) -> None:
+    """Registra los hooks de tiempo en un motor asíncrono."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _antes)
+    event.listen(engine.sync_engine, "after_cursor_execute", _despues)
+
+
+# --- Middleware ASGI ---
+
+def _ruta(app, scope) -> str:
+    # Usa la plantilla de la ruta ("/facturas/{factura_id}/detalle"), no la URL concreta,
+    # para que las métricas no tengan una serie por cada ID.
+    # No todas las rutas tienen `path` (ej. un Mount sin plantilla): se usa la URL.
+    ruta = scope.get("route")
+    if ruta is not None:
+        return getattr(ruta, "path", None) or scope["path"]
+    for ruta in app.router.routes:
+        coincidencia, _ = ruta.matches(scope)
+        if coincidencia == Match.FULL:
+            return getattr(ruta, "path", None) or scope["path"]
+    return "sin_ruta"
+
+
+class MiddlewareInstrumentacion:
+    """
+    Mide cada petición: latencia total, cantidad de sentencias SQL, tiempo en la
+    base y la sentencia más lenta. Lo informa en la cabecera `Server-Timing` y lo
+    acumula en `registro` para el endpoint de métricas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        medicion = MedicionPeticion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                total_ms = (time.perf_counter() - inicio) * 1000
+                server_timing = (
+                    f'app;dur={total_ms:.2f}, '
+                    f'db;dur={medicion.tiempo_db * 1000:.2f};desc="{medicion.consultas} consultas", '
+                    f'sql-lenta;dur={medicion.consulta_mas_lenta * 1000:.2f}'
+                )
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [(b"server-timing", server_timing.encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _medicion.reset(token)
+            segundos = time.perf_counter() - inicio
+            ruta = _ruta(scope["app"], scope) if "app" in scope else scope["path"]
+            registro.registrar(scope["method"], ruta, estado, segundos, medicion)
+            if medicion.consultas > INSTRUMENTACION_MAX_CONSULTAS:
+                logger.warning(
+                    "Posible N+1: %s %s ejecutó %d consultas (máximo %d). Más lenta: %s",
+                    scope["method"], ruta, medicion.consultas, INSTRUMENTACION_MAX_CONSULTAS,
+                    medicion.sql_mas_lenta[:200]
+                )
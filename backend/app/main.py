@@ -1,22 +1,41 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 # --- 1. CORRECCIÓN DE IMPORTACIONES ---
-from .routers import clientes, productos, facturas
+from .routers import clientes, productos, facturas, exportaciones, trabajos, cambios, analitica
 from . import auth
 from . import models
-from .db import engine
+from . import busqueda
+from . import ciclo_vida
+from .trabajos import cola as cola_trabajos
+from .db import engine, engine_lectura, metricas_pool
+from .paginacion import CABECERA_CURSOR
+from .idempotencia import registro_idempotencia, CABECERA_REPETIDA
+from .cache_respuestas import catalogo_clientes, catalogo_productos
+from .cambios import difusor
+from .analitica import ventas as analitica_ventas
+from .instrumentacion import MiddlewareInstrumentacion, instrumentar_engine, registro
+from .admision import MiddlewareAdmision, control_admision
     
 
-# Esta línea (comentada) se usa para que SQLAlchemy cree las tablas
-# en la base de datos basándose en los modelos definidos en `models.py`
-# al iniciar la aplicación. Es útil para desarrollo inicial.
+# El esquema ahora se versiona con Alembic (backend/migrations): `alembic upgrade head`
+# o DB_MIGRAR_AL_INICIAR=1. Esta línea (comentada) sigue sirviendo para un
+# desarrollo rápido sin migraciones.
 # models.Base.metadata.create_all(bind=engine)
 
+# El arranque (migraciones, agregados, cola de trabajos, calentamiento) y el
+# apagado ordenado están en app/ciclo_vida.py.
 app = FastAPI(
     title="TP Final – API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=ciclo_vida.ciclo_de_vida
 )
+# Control de admisión: límite de tasa por usuario y de concurrencia por ruta, con
+# lugares reservados para escrituras. Se agrega primero para que quede dentro de
+# CORS (el navegador puede leer los 429/503) y de la instrumentación (se miden).
+app.add_middleware(MiddlewareAdmision)
+
 # Configuración de CORS (Cross-Origin Resource Sharing)
 # Permite que el frontend (ej. una aplicación React en localhost:5173)
 # pueda hacer solicitudes a esta API.
@@ -32,13 +51,98 @@ app.add_middleware(
     allow_credentials=True,    # Permite el envío de cookies y cabeceras de autenticación
     allow_methods=["*"],         # Permite todos los métodos HTTP (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],         # Permite todos los encabezados HTTP
+    expose_headers=[CABECERA_CURSOR, "ETag", CABECERA_REPETIDA, "Retry-After"], # Cursor de paginación, ETag, respuestas repetidas y reintentos
 )
 
+# Medición de cada petición (latencia, consultas SQL, Server-Timing) y hooks en los motores.
+app.add_middleware(MiddlewareInstrumentacion)
+# Cuenta las peticiones en curso para informarlas en /listo (al apagar, las espera uvicorn).
+app.add_middleware(ciclo_vida.MiddlewarePeticionesEnCurso)
+instrumentar_engine(engine)
+if engine_lectura is not engine:
+    instrumentar_engine(engine_lectura)
+
 # --- 2. CORRECCIÓN DEL INCLUDE ---
 app.include_router(auth.router)
 app.include_router(clientes.router)
 app.include_router(productos.router)
 app.include_router(facturas.router)
+app.include_router(exportaciones.router)
+app.include_router(trabajos.router)
+app.include_router(cambios.router)
+app.include_router(analitica.router)
+
+# Disponibilidad para el balanceador / orquestador: 503 mientras arranca, si el
+# calentamiento falló o cuando se está apagando.
+@app.get("/listo")
+async def listo():
+    return JSONResponse(status_code=200 if ciclo_vida.estado.listo else 503, content=ciclo_vida.estado.como_dict())
+
+# Métricas del pool de conexiones: conexiones en uso y tiempo de espera por una conexión.
+@app.get("/metricas/pool")
+async def metricas_pool_conexiones():
+    return metricas_pool()
+
+# Métricas de la caché de listados (versión, respuestas 304, aciertos).
+@app.get("/metricas/catalogos")
+async def metricas_catalogos():
+    return {
+        "clientes": catalogo_clientes.metricas(),
+        "productos": catalogo_productos.metricas(),
+    }
+
+# Peticiones repetidas o agrupadas por Idempotency-Key.
+@app.get("/metricas/idempotencia")
+async def metricas_idempotencia():
+    return registro_idempotencia.metricas()
+
+# Tamaño de los índices de búsqueda.
+@app.get("/metricas/busqueda")
+async def metricas_busqueda():
+    return {
+        "productos": busqueda.indice_productos.metricas(),
+        "clientes": busqueda.indice_clientes.metricas(),
+    }
+
+# Suscriptores conectados a /cambios y eventos publicados.
+@app.get("/metricas/cambios")
+async def metricas_cambios():
+    return difusor.metricas()
+
+# Filas y memoria de la copia columnar de ventas (app/analitica.py).
+@app.get("/metricas/analitica")
+async def metricas_analitica():
+    return analitica_ventas.metricas()
+
+# Peticiones admitidas, rechazos por motivo y ocupación de cada límite de concurrencia.
+@app.get("/metricas/admision")
+async def metricas_admision():
+    return control_admision.metricas()
+
+# Métricas de la cola de trabajos en segundo plano.
+@app.get("/metricas/trabajos")
+async def metricas_trabajos():
+    return cola_trabajos.metricas()
+
+# Métricas en formato de texto de Prometheus (por ruta y del pool de conexiones).
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas_prometheus():
+    # Cada métrica va con su `# TYPE` y todas sus series juntas, como pide el formato.
+    pools = metricas_pool()
+    extras = ["# TYPE db_pool_conexiones gauge"]
+    for nombre, datos in pools.items():
+        extras.append(f'db_pool_conexiones{{pool="{nombre}",estado="en_uso"}} {datos["en_uso"]}')
+        extras.append(f'db_pool_conexiones{{pool="{nombre}",estado="libres"}} {datos["libres"]}')
+    extras.append("# TYPE db_pool_espera_maxima_ms gauge")
+    for nombre, datos in pools.items():
+        extras.append(f'db_pool_espera_maxima_ms{{pool="{nombre}"}} {datos["espera_maxima_ms"]}')
+    extras.append("# TYPE db_pool_esperando gauge")
+    for nombre, datos in pools.items():
+        extras.append(f'db_pool_esperando{{pool="{nombre}"}} {datos["esperando"]}')
+    extras.append("# TYPE admision_rechazos_total counter")
+    for motivo, cantidad in control_admision.rechazos.items():
+        extras.append(f'admision_rechazos_total{{motivo="{motivo}"}} {cantidad}')
+    return registro.exportar(extras)
 
 # Ruta raíz de bienvenida
 @app.get("/")
@@ -0,0 +1,25 @@
+import asyncio
+import os
+
+from alembic import command
+from alembic.config import Config
+
+# DB_MIGRAR_AL_INICIAR: si vale "1", la app aplica las migraciones pendientes al arrancar.
+# En una base creada a mano hay que marcarla primero con `alembic stamp 0001_esquema_inicial`.
+DB_MIGRAR_AL_INICIAR = os.getenv("DB_MIGRAR_AL_INICIAR", "0") == "1"
+
+RUTA_ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic.ini")
+
+
+def configuracion() -> Config:
+    config = Config(RUTA_ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(RUTA_ALEMBIC_INI), "migrations"))
+    # La app ya tiene su propia configuración de logging.
+    config.attributes["configurar_logs"] = False
+    return config
+
+
+async def aplicar_migraciones() -> None:
+    """Lleva el esquema a la última versión (alembic upgrade head)."""
+    # env.py usa asyncio.run(), así que se ejecuta en un hilo aparte del event loop.
+    await asyncio.to_thread(command.upgrade, configuracion(), "head")
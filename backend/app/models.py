@@ -1,5 +1,5 @@
 from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Numeric, ForeignKey, Index
 from datetime import datetime
 
 # `Base` es la clase declarativa de SQLAlchemy de la que heredarán todos nuestros modelos.
@@ -18,6 +18,12 @@ class Cliente(Base):
     # Relación: Un cliente puede tener muchas facturas
     facturas = relationship('Factura', back_populates='cliente', cascade="all, delete-orphan")
 
+    # Índices para los filtros por prefijo de nombre/apellido del listado.
+    __table_args__ = (
+        Index('ix_clientes_nombre', 'nombre'),
+        Index('ix_clientes_apellido', 'apellido'),
+    )
+
 class Producto(Base):
     __tablename__ = 'productos'
     
@@ -49,6 +55,16 @@ class Factura(Base):
     # Una factura fue creada por un usuario
     creador = relationship('Usuario', back_populates='facturas_creadas')
 
+    # Índices para las consultas más frecuentes:
+    # - listado de un usuario normal: WHERE creado_por_usuario_id = ? ORDER BY fecha DESC
+    # - listado del admin y paginación por clave: ORDER BY fecha DESC, id DESC
+    # - JOIN y filtro por cliente
+    __table_args__ = (
+        Index('ix_factura_usuario_fecha', 'creado_por_usuario_id', 'fecha'),
+        Index('ix_factura_fecha_id', 'fecha', 'id'),
+        Index('ix_factura_cliente_id', 'cliente_id'),
+    )
+
 class Detalle(Base):
     __tablename__ = 'detalle'
     
@@ -65,6 +81,12 @@ class Detalle(Base):
     # Relación: Cada detalle se refiere a un producto específico.
     producto = relationship('Producto', back_populates='detalles')
 
+    # La PK (factura_id, producto_id) cubre las búsquedas por factura; este índice
+    # cubre las búsquedas por producto (borrado en cascada, ventas por producto).
+    __table_args__ = (
+        Index('ix_detalle_producto_id', 'producto_id'),
+    )
+
 class Usuario(Base):
     __tablename__ = 'usuarios'
     
@@ -76,4 +98,17 @@ class Usuario(Base):
     rol = Column(String(10), nullable=False, default='usuario') # 'usuario' o 'admin'
     # --- 2. NUEVA RELACIÓN ---
     # Un usuario puede crear muchas facturas
-    facturas_creadas = relationship('Factura', back_populates='creador')
\ No newline at end of file
+    facturas_creadas = relationship('Factura', back_populates='creador')
+class VentaDiariaCliente(Base):
+    __tablename__ = 'ventas_diarias_cliente'
+
+    # Total vendido por cliente y por día. Se mantiene incrementalmente al agregar
+    # ítems a una factura y se reconcilia periódicamente contra `detalle`.
+    cliente_id = Column(Integer, ForeignKey('clientes.id', ondelete='CASCADE'), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+
+    # Para el reporte filtrado por rango de fechas.
+    __table_args__ = (
+        Index('ix_ventas_diarias_dia', 'dia'),
+    )
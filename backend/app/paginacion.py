@@ -0,0 +1,94 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from .serializacion import filas_a_json, respuesta_json
+
+# Cabecera en la que se devuelve el cursor de la página siguiente (vacía si no hay más).
+CABECERA_CURSOR = "X-Siguiente-Cursor"
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+
+def codificar_cursor(valores: dict) -> str:
+    """Convierte la clave de la última fila en un cursor opaco (base64 de un JSON)."""
+    datos = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in valores.items()}
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode()
+
+
+def decodificar_cursor(cursor: str, campos_fecha: tuple[str, ...] = (), campos_enteros: tuple[str, ...] = ("id",)) -> dict:
+    """
+    Decodifica un cursor generado por `codificar_cursor` y verifica su forma: un
+    objeto con `campos_enteros` enteros y `campos_fecha` fechas ISO. Lanza 400 si
+    es inválido, así el handler puede usar los campos sin más controles.
+    """
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(datos, dict):
+            raise ValueError(cursor)
+        for campo in campos_enteros:
+            # bool es subclase de int, pero `true` no es un id.
+            if not isinstance(datos[campo], int) or isinstance(datos[campo], bool):
+                raise ValueError(cursor)
+        for campo in campos_fecha:
+            datos[campo] = datetime.fromisoformat(datos[campo])
+        return datos
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def columnas_proyectadas(columnas: dict, campos: str | None, obligatorios: tuple[str, ...] = ("id",)) -> list:
+    """
+    Devuelve las columnas a seleccionar según el parámetro `campos` (separados por coma).
+    Los campos `obligatorios` se incluyen siempre porque forman la clave del cursor.
+    """
+    if not campos:
+        return list(columnas.values())
+    pedidos = [c.strip() for c in campos.split(",") if c.strip()]
+    desconocidos = [c for c in pedidos if c not in columnas]
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {desconocidos}")
+    for campo in reversed(obligatorios):
+        if campo not in pedidos:
+            pedidos.insert(0, campo)
+    return [columnas[c] for c in pedidos]
+
+
+def recortar_pagina(filas, limite: int, clave) -> tuple[list, str]:
+    """
+    Recorta el resultado (que se pidió con `limite + 1` filas) y devuelve las filas
+    de la página junto con el cursor de la siguiente ("" si no hay más).
+    `clave` recibe una fila y devuelve el dict con el que se arma el cursor.
+    """
+    filas = list(filas)
+    siguiente = ""
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(clave(filas[-1]))
+    return filas, siguiente
+
+
+def armar_pagina(filas, limite: int, clave, response: Response, proyectada: bool, rapido: bool = False):
+    """
+    Recorta la página, publica el cursor de la siguiente en la cabecera y
+    devuelve el cuerpo de la respuesta.
+    Con `rapido` devuelve los bytes ya serializados, sin pasar por el response_model.
+    """
+    filas, siguiente = recortar_pagina(filas, limite, clave)
+
+    if rapido:
+        return respuesta_json(filas_a_json(filas), {CABECERA_CURSOR: siguiente})
+
+    if proyectada:
+        # Con proyección el cuerpo no respeta el response_model, se devuelve tal cual.
+        return JSONResponse(
+            content=jsonable_encoder([dict(f) for f in filas]),
+            headers={CABECERA_CURSOR: siguiente}
+        )
+    response.headers[CABECERA_CURSOR] = siguiente
+    return filas
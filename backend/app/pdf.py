@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from threading import Lock
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# --- Configuración (variables de entorno) ---
+# PDF_WORKERS: procesos que renderizan PDFs fuera del event loop.
+# PDF_CACHE_MB: tamaño máximo de la caché de PDFs.
+# PDF_CACHE_DIR: si se define, la caché se guarda en disco en ese directorio en vez de en memoria.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_CACHE_MB = float(os.getenv("PDF_CACHE_MB", "64"))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR")
+
+# Se incluye en la huella para invalidar la caché si cambia el diseño del PDF.
+VERSION_PLANTILLA = "1"
+
+f, c, u, d, p = models.Factura, models.Cliente, models.Usuario, models.Detalle, models.Producto
+
+
+# --- Datos de la factura ---
+
+async def datos_facturas(db: AsyncSession, ids: list[int]) -> dict[int, dict]:
+    """
+    Trae cabecera e ítems de varias facturas con dos consultas (sin N+1).
+    Los ítems son los mismos que devuelve `detalle_factura`.
+    """
+    if not ids:
+        return {}
+    cabeceras = await db.execute(
+        select(
+            f.id, f.fecha, c.nombre, c.apellido, c.dni, u.username.label("creador")
+        )
+        .select_from(f)
+        .outerjoin(c, c.id == f.cliente_id)
+        .outerjoin(u, u.id == f.creado_por_usuario_id)
+        .where(f.id.in_(ids))
+    )
+    datos = {
+        fila.id: {
+            "id": fila.id,
+            "fecha": fila.fecha.strftime("%d/%m/%Y %H:%M"),
+            "cliente": f"{fila.nombre or ''} {fila.apellido or ''}".strip(),
+            "dni": fila.dni,
+            "creador": fila.creador,
+            "items": [],
+        }
+        for fila in cabeceras.all()
+    }
+    items = await db.execute(
+        select(d.factura_id, d.producto_id, p.nombre, d.cantidad, d.precio)
+        .join(p, p.id == d.producto_id)
+        .where(d.factura_id.in_(ids))
+        .order_by(d.factura_id, d.producto_id)
+    )
+    for fila in items.all():
+        datos[fila.factura_id]["items"].append({
+            "producto_id": fila.producto_id,
+            "nombre": fila.nombre,
+            "cantidad": fila.cantidad,
+            "precio": str(fila.precio),
+        })
+    return datos
+
+
+def huella(datos: dict) -> str:
+    """Hash del contenido de la factura: si cambia algún ítem, cambia la huella."""
+    contenido = json.dumps(datos, sort_keys=True, default=str)
+    return hashlib.sha256((VERSION_PLANTILLA + contenido).encode()).hexdigest()
+
+
+# --- Renderizado (PDF 1.4 mínimo, sin dependencias externas) ---
+
+LINEAS_POR_PAGINA = 40
+
+
+def _texto(x: float, y: float, tamanio: int, texto: str, negrita: bool = False) -> bytes:
+    escapado = texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    fuente = "/F2" if negrita else "/F1"
+    return f"BT {fuente} {tamanio} Tf {x} {y} Td (".encode() + \
+        escapado.encode("cp1252", errors="replace") + b") Tj ET\n"
+
+
+def _fila(y: float, columnas: list[str], negrita: bool = False) -> bytes:
+    return b"".join(
+        _texto(x, y, 10, texto, negrita) for x, texto in zip((50, 330, 400, 480), columnas)
+    )
+
+
+def renderizar(datos: dict) -> bytes:
+    """Genera el PDF de una factura. Es una función pura para poder correr en otro proceso."""
+    total = Decimal("0")
+    filas = []
+    for item in datos["items"]:
+        precio = Decimal(item["precio"])
+        importe = precio * item["cantidad"]
+        total += importe
+        filas.append([item["nombre"][:45], str(item["cantidad"]), f"${precio:.2f}", f"${importe:.2f}"])
+
+    paginas = []
+    for inicio in range(0, max(len(filas), 1), LINEAS_POR_PAGINA):
+        contenido = _texto(50, 790, 18, f"Factura #{datos['id']}", negrita=True)
+        contenido += _texto(50, 765, 11, f"Fecha: {datos['fecha']}")
+        contenido += _texto(50, 750, 11, f"Cliente: {datos['cliente']} (DNI: {datos['dni']})")
+        contenido += _texto(50, 735, 11, f"Emitida por: {datos['creador'] or '-'}")
+        contenido += _fila(700, ["Producto", "Cant.", "Precio", "Importe"], negrita=True)
+        y = 680
+        for fila in filas[inicio:inicio + LINEAS_POR_PAGINA]:
+            contenido += _fila(y, fila)
+            y -= 15
+        if inicio + LINEAS_POR_PAGINA >= len(filas):
+            contenido += _texto(400, y - 15, 12, f"Total: ${total:.2f}", negrita=True)
+        paginas.append(contenido)
+
+    # Objetos: 1 catálogo, 2 páginas, 3-4 fuentes, luego (página, contenido) por cada hoja.
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    hojas = []
+    for contenido in paginas:
+        num_pagina = len(objetos) + 1
+        hojas.append(f"{num_pagina} 0 R")
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {num_pagina + 1} 0 R >>".encode()
+        )
+        objetos.append(f"<< /Length {len(contenido)} >>\nstream\n".encode() + contenido + b"endstream")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(hojas)}] /Count {len(hojas)} >>".encode()
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for i, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(salida))
+        salida += f"{i} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for posicion in posiciones:
+        salida += f"{posicion:010d} 00000 n \n".encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    return bytes(salida)
+
+
+# --- Caché direccionada por contenido ---
+
+class CachePDF:
+    """
+    Caché LRU de PDFs indexada por la huella del contenido, acotada en bytes.
+    Guarda los PDFs en memoria o, si se indica un directorio, en disco. En disco,
+    al abrirla se vuelven a indexar los archivos que dejó la ejecución anterior
+    (del más viejo al más nuevo) y se desaloja lo que pase del tamaño máximo.
+    """
+
+    def __init__(self, tamanio_maximo: int, directorio: str | None = None):
+        self.tamanio_maximo = tamanio_maximo
+        self.directorio = directorio
+        self._entradas: OrderedDict[str, bytes | int] = OrderedDict() # huella -> PDF (o tamaño si está en disco)
+        self._por_factura: dict[int, str] = {}                         # factura_id -> última huella
+        self._ocupado = 0
+        self._lock = Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            self._indexar_directorio()
+
+    def _indexar_directorio(self) -> None:
+        archivos = []
+        ahora = time.time()
+        for entrada in os.scandir(self.directorio):
+            try:
+                info = entrada.stat()
+                if entrada.name.endswith(".pdf"):
+                    archivos.append((info.st_mtime, entrada.name[:-len(".pdf")], info.st_size))
+                elif entrada.name.endswith(".parcial") and ahora - info.st_mtime > 60:
+                    # Escritura que quedó a medias en una ejecución anterior (otro worker
+                    # puede estar escribiendo las recientes en el mismo directorio).
+                    os.remove(entrada.path)
+            except FileNotFoundError:
+                pass  # otro worker lo desalojó mientras se recorría
+        for _, clave, tamanio in sorted(archivos):
+            self._entradas[clave] = tamanio
+            self._ocupado += tamanio
+        self._desalojar()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.pdf")
+
+    def obtener(self, clave: str) -> bytes | None:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+        if isinstance(entrada, bytes):
+            return entrada
+        try:
+            with open(self._ruta(clave), "rb") as archivo:
+                return archivo.read()
+        except FileNotFoundError:
+            self._quitar(clave)
+            return None
+
+    def guardar(self, factura_id: int, clave: str, contenido: bytes) -> None:
+        if self.directorio:
+            # Se escribe aparte y se renombra: un corte a mitad de camino no deja un PDF roto.
+            parcial = f"{self._ruta(clave)}.{os.getpid()}.parcial"
+            with open(parcial, "wb") as archivo:
+                archivo.write(contenido)
+            os.replace(parcial, self._ruta(clave))
+        with self._lock:
+            anterior = self._por_factura.get(factura_id)
+            self._por_factura[factura_id] = clave
+            if clave not in self._entradas:
+                self._entradas[clave] = len(contenido) if self.directorio else contenido
+                self._ocupado += len(contenido)
+        if anterior and anterior != clave:
+            self._quitar(anterior)
+        self._desalojar()
+
+    def invalidar_factura(self, factura_id: int) -> None:
+        """Descarta el PDF de una factura cuya lista de ítems cambió."""
+        with self._lock:
+            clave = self._por_factura.pop(factura_id, None)
+        if clave:
+            self._quitar(clave)
+
+    def _quitar(self, clave: str) -> None:
+        with self._lock:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is None:
+                return
+            self._ocupado -= entrada if isinstance(entrada, int) else len(entrada)
+        if self.directorio:
+            try:
+                os.remove(self._ruta(clave))
+            except FileNotFoundError:
+                pass
+
+    def _desalojar(self) -> None:
+        while True:
+            with self._lock:
+                if self._ocupado <= self.tamanio_maximo or not self._entradas:
+                    return
+                clave = next(iter(self._entradas))
+            self._quitar(clave)
+
+    def metricas(self) -> dict:
+        return {
+            "entradas": len(self._entradas),
+            "bytes": self._ocupado,
+            "bytes_maximo": self.tamanio_maximo,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+        }
+
+
+cache_pdf = CachePDF(int(PDF_CACHE_MB * 1024 * 1024), PDF_CACHE_DIR)
+_ejecutor: ProcessPoolExecutor | None = None
+
+
+def _obtener_ejecutor() -> ProcessPoolExecutor:
+    # Se crea de forma perezosa para no levantar procesos al importar el módulo.
+    global _ejecutor
+    if _ejecutor is None:
+        _ejecutor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _ejecutor
+
+
+async def pdf_factura(datos: dict) -> bytes:
+    """Devuelve el PDF desde la caché o lo renderiza en el pool de procesos."""
+    clave = huella(datos)
+    contenido = cache_pdf.obtener(clave)
+    if contenido is None:
+        loop = asyncio.get_running_loop()
+        contenido = await loop.run_in_executor(_obtener_ejecutor(), renderizar, datos)
+        cache_pdf.guardar(datos["id"], clave, contenido)
+    return contenido
+
+
+def cerrar() -> None:
+    global _ejecutor
+    if _ejecutor is not None:
+        _ejecutor.shutdown(wait=True)
+        _ejecutor = None
@@ -0,0 +1,70 @@
+from datetime import date
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+
+from ..db import AsyncSessionLectura
+from .. import models, schemas
+from .. import auth
+from .. import analitica
+from ..serializacion import filas_a_json, respuesta_json
+
+router = APIRouter(
+    prefix="/analitica",
+    tags=["Analítica"]
+)
+
+# Nombre que se muestra para cada dimensión.
+_NOMBRES = {
+    "producto": (models.Producto.id, models.Producto.nombre),
+    "cliente": (models.Cliente.id, models.Cliente.nombre + " " + models.Cliente.apellido),
+    "creador": (models.Usuario.id, models.Usuario.username),
+}
+
+def _disponible():
+    if analitica.np is None:
+        raise HTTPException(status_code=503, detail="La analítica necesita numpy instalado en el servidor")
+
+# Ventas agrupadas por período (día, semana, mes) y por producto, cliente o creador.
+@router.get("/ventas", response_model=list[schemas.VentasAnaliticaOut])
+async def ventas(
+    por: Literal["total", "producto", "cliente", "creador"] = "total",
+    periodo: Literal["total", "dia", "semana", "mes"] = "total",
+    desde: Optional[date] = None, # Día inicial (inclusive).
+    hasta: Optional[date] = None, # Día final (inclusive).
+    top: Optional[int] = Query(None, ge=1), # Solo los N de mayor venta de cada período.
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Se calcula en memoria sobre una copia columnar de `detalle` (app/analitica.py),
+    sin consultas de agregación a la base. Las facturas nuevas se incorporan en
+    pocos segundos; el margen usa el precio de compra actual de cada producto.
+    """
+    _disponible()
+    # 1. Incorpora las filas nuevas (la primera vez, carga todo).
+    await analitica.ventas.asegurar_actualizado(AsyncSessionLectura)
+    # 2. Agrupa (o devuelve el resultado guardado para la misma consulta).
+    filas = analitica.ventas.resumir(por, periodo, desde, hasta, top)
+
+    # 3. Nombres solo de los IDs que aparecen en el resultado.
+    if por != "total" and filas:
+        columna_id, columna_nombre = _NOMBRES[por]
+        ids = {fila["id"] for fila in filas}
+        async with AsyncSessionLectura() as db:
+            nombres = dict((await db.execute(
+                select(columna_id, columna_nombre).where(columna_id.in_(ids))
+            )).all())
+        filas = [{**fila, "nombre": nombres.get(fila["id"])} for fila in filas]
+    return respuesta_json(filas_a_json(filas))
+
+# Fuerza una recarga completa de la copia en memoria (solo admin).
+@router.post("/recargar", status_code=202)
+async def recargar(
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    if current_user.rol != 'admin':
+        raise HTTPException(status_code=403, detail="Solo un administrador puede recargar la analítica")
+    _disponible()
+    analitica.ventas.invalidar()
+    analitica.ventas.invalidar_costos()
+    return {"mensaje": "La analítica se recarga en segundo plano"}
@@ -0,0 +1,49 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from .. import models
+from .. import auth
+from ..cambios import difusor, RECURSOS
+
+router = APIRouter(
+    prefix="/cambios",
+    tags=["Cambios"]
+)
+
+# Flujo de cambios (Server-Sent Events) para que el frontend no vuelva a pedir los listados completos.
+@router.get("/")
+async def flujo_cambios(
+    recursos: Optional[str] = None, # Ej: "productos,clientes". Por defecto, todos.
+    desde: Optional[str] = None, # Id del último evento recibido (también se acepta la cabecera Last-Event-ID).
+    last_event_id: Optional[str] = Header(None),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Cada mensaje tiene id `<epoca>-<seq>` y cada `cambio` trae `seq`, `recurso` (clientes, productos, facturas),
+    `accion` y `datos`:
+    - **alta** / **modificacion**: la fila como la devuelve el listado.
+    - **baja**: `{"ids": [...]}`.
+    - **stock** (productos): `{"items": [{"id", "cambio"}]}` con la diferencia de stock.
+    - **recarga**: hubo una importación masiva; hay que volver a pedir ese listado.
+    Un mensaje `reiniciar` indica que se perdieron cambios (reconexión tardía o
+    cliente lento, o un id de otra época porque el servidor se reinició): hay que
+    volver a pedir los listados y reconectar desde su id.
+    Un usuario normal solo recibe las facturas propias. El servidor corta la
+    conexión cada CAMBIOS_DURACION_MAXIMA segundos: el cliente se reconecta con
+    `Last-Event-ID` (o `desde`) y recibe lo que se publicó mientras tanto.
+    """
+    pedidos = set(recursos.split(",")) if recursos else set(RECURSOS)
+    desconocidos = pedidos - set(RECURSOS)
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Recursos desconocidos: {sorted(desconocidos)}")
+
+    suscripcion = difusor.suscribir(
+        current_user.id, current_user.rol == 'admin', pedidos, desde if desde is not None else last_event_id
+    )
+    return StreamingResponse(
+        difusor.flujo_sse(suscripcion),
+        media_type="text/event-stream",
+        # Sin caché ni buffering en proxies (nginx) para que cada evento llegue enseguida.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,9 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, insert, update, delete
+from sqlalchemy import select, insert, update
 
-from ..db import get_session
+from ..db import get_session, AsyncSessionLocal
 from .. import models, schemas
+from .. import auth
+from ..paginacion import (
+    LIMITE_POR_DEFECTO, LIMITE_MAXIMO, columnas_proyectadas, decodificar_cursor, recortar_pagina
+)
+from ..cache_respuestas import catalogo_clientes
+from ..importar import importar, formato_de
+from ..busqueda import indice_clientes
+from ..serializacion import filas_a_json, respuesta_json
+from ..borrado import borrar_clientes, BORRADO_MAX_SINCRONICO
+from ..trabajos import cola
+from ..cambios import difusor
 
 router = APIRouter(
     prefix="/clientes",
@@ -24,19 +36,102 @@ async def crear_cliente(
     
     # 3. Confirma la transacción para guardar los cambios en la base de datos.
     await db.commit()
+    catalogo_clientes.invalidar() # El listado cacheado ya no es válido.
     
     # 4. Actualiza el objeto `nuevo_cliente` con los datos generados por la base de datos (ej. el ID).
     await db.refresh(nuevo_cliente)
+    indice_clientes.agregar(nuevo_cliente)
+    difusor.publicar("clientes", "alta", schemas.ClienteOut.model_validate(nuevo_cliente).model_dump(mode="json"))
     
     return nuevo_cliente
 
-# Endpoint para obtener una lista de todos los clientes.
+# Endpoint para importar clientes (upsert por DNI) desde un CSV o NDJSON enviado en streaming.
+@router.post("/bulk", response_model=schemas.ResultadoImportacionOut)
+async def importar_clientes(
+    request: Request,
+    formato: Optional[Literal["csv", "ndjson"]] = None, # Si no se indica, se deduce del Content-Type.
+    db: AsyncSession = Depends(get_session)
+):
+    """
+    Valida las filas por lotes con `ClienteCreate` y las guarda con INSERT ... ON DUPLICATE
+    KEY UPDATE sobre `dni`. Las filas con errores se informan sin abortar el resto.
+    """
+    resultado = await importar(
+        request, formato_de(request, formato), db, models.Cliente.__table__, schemas.ClienteCreate, "dni"
+    )
+    if resultado.guardadas:
+        catalogo_clientes.invalidar() # El listado cacheado ya no es válido.
+        # El upsert no devuelve qué filas cambió: se recarga el índice de búsqueda completo.
+        await indice_clientes.cargar(AsyncSessionLocal, models.Cliente)
+        # No se sabe qué filas cambiaron: los clientes vuelven a pedir el listado.
+        difusor.publicar("clientes", "recarga", {})
+    if resultado.corte:
+        raise resultado.corte
+    return resultado.como_dict()
+
+# Endpoint para borrar muchos clientes (con sus facturas) en una sola petición.
+# Solo admin: borra el historial de facturas. Si se encola, el trabajo queda a su nombre.
+@router.post("/borrar", response_model=schemas.ResultadoBorradoOut | schemas.TrabajoOut)
+async def borrar_varios_clientes(
+    data: schemas.BorradoCreate,
+    response: Response,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    if current_user.rol != 'admin':
+        raise HTTPException(status_code=403, detail="Solo un administrador puede borrar clientes en bloque")
+    # 1. Muchos ids (o pedido explícito): se encola y se responde 202 con el trabajo.
+    if data.en_segundo_plano or len(data.ids) > BORRADO_MAX_SINCRONICO:
+        response.status_code = 202
+        return await cola.enviar("borrar_clientes", schemas.ParametrosBorrado(ids=data.ids), 5, current_user)
+    # 2. Si no, se borra por lotes y se devuelve el resultado.
+    return (await borrar_clientes(AsyncSessionLocal, data.ids)).como_dict()
+
+# Endpoint para obtener una lista paginada de clientes.
 @router.get("/", response_model=list[schemas.ClienteOut])
-async def listar_clientes(db: AsyncSession = Depends(get_session)):
-    stmt = select(models.Cliente)
+async def listar_clientes(
+    request: Request,
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None, # Valor de la cabecera X-Siguiente-Cursor de la página anterior.
+    nombre: Optional[str] = None, # Prefijo del nombre.
+    apellido: Optional[str] = None, # Prefijo del apellido.
+    dni: Optional[int] = None,
+    campos: Optional[str] = None, # Ej: "id,nombre,apellido"
+    rapido: bool = False, # Respuesta serializada directo desde las filas (ver app/serializacion.py).
+    db: AsyncSession = Depends(get_session)
+):
+    # 1. Arma la consulta solo con las columnas pedidas.
+    # Si el catálogo no cambió, responde 304 o la página ya serializada sin ir a la base.
+    cacheada = catalogo_clientes.respuesta_cacheada(request)
+    if cacheada is not None:
+        return cacheada
+    version = catalogo_clientes.version
+
+    columnas = columnas_proyectadas(dict(models.Cliente.__table__.c), campos)
+    stmt = select(*columnas).order_by(models.Cliente.id).limit(limite + 1)
+
+    # 2. Filtros del lado del servidor.
+    if nombre:
+        stmt = stmt.where(models.Cliente.nombre.startswith(nombre, autoescape=True))
+    if apellido:
+        stmt = stmt.where(models.Cliente.apellido.startswith(apellido, autoescape=True))
+    if dni is not None:
+        stmt = stmt.where(models.Cliente.dni == dni)
+
+    # 3. Paginación por clave (keyset): continúa después del último id devuelto.
+    if cursor:
+        stmt = stmt.where(models.Cliente.id > decodificar_cursor(cursor)["id"])
+
     result = await db.execute(stmt)
-    clientes = result.scalars().all() 
-    return clientes
+    filas, siguiente = recortar_pagina(result.mappings().all(), limite, lambda fila: {"id": fila["id"]})
+    return catalogo_clientes.guardar(request, version, filas, siguiente, proyectada=bool(campos), rapido=rapido)
+
+# Endpoint de autocompletado de clientes por nombre, apellido o DNI (índice en memoria).
+@router.get("/buscar", response_model=list[schemas.ClienteBusquedaOut])
+async def buscar_clientes(
+    q: str = Query(..., min_length=1), # Ej: "gonz", "perez juan", "3012"
+    limite: int = Query(10, ge=1, le=50)
+):
+    return respuesta_json(filas_a_json(indice_clientes.buscar(q, limite)))
 
 # Endpoint para actualizar la información de un cliente existente.
 @router.put("/{cliente_id}", response_model=schemas.ClienteOut)
@@ -59,24 +154,32 @@ async def actualizar_cliente(
 
     # 4. Confirma la transacción para guardar los cambios.
     await db.commit()
+    catalogo_clientes.invalidar() # El listado cacheado ya no es válido.
     
     # 5. Actualiza el objeto `cliente_db` para reflejar los cambios persistidos.
     await db.refresh(cliente_db)
+    indice_clientes.agregar(cliente_db)
+    difusor.publicar("clientes", "modificacion", schemas.ClienteOut.model_validate(cliente_db).model_dump(mode="json"))
     
     return cliente_db
 
 # Endpoint para eliminar un cliente por su ID.
 @router.delete("/{cliente_id}", status_code=204)
 async def eliminar_cliente(
-    cliente_id: int, 
-    db: AsyncSession = Depends(get_session)
+    cliente_id: int,
+    db: AsyncSession = Depends(get_session),
+    current_user: models.Usuario = Depends(auth.get_current_user)
 ):
-    stmt = delete(models.Cliente).where(models.Cliente.id == cliente_id)
-    result = await db.execute(stmt)
-    # `rowcount` indica cuántas filas fueron afectadas por la operación DELETE.
-    if result.rowcount == 0:
+    # Un cliente con facturas solo lo puede borrar un admin: se borra su historial.
+    if current_user.rol != 'admin':
+        tiene_facturas = (await db.execute(
+            select(models.Factura.id).where(models.Factura.cliente_id == cliente_id).limit(1)
+        )).first()
+        if tiene_facturas:
+            raise HTTPException(status_code=403, detail="Solo un administrador puede borrar un cliente con facturas")
+    # Borra sus facturas (con los ítems) por lotes y después el cliente; también
+    # invalida el catálogo cacheado y lo quita del índice de búsqueda.
+    progreso = await borrar_clientes(AsyncSessionLocal, [cliente_id])
+    if progreso.no_encontrados:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
-        
-    # Confirma la eliminación en la base de datos.
-    await db.commit()
     return
\ No newline at end of file
@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from ..db import AsyncSessionLectura
+from .. import models
+from .. import auth
+from ..exportar import (
+    generar, TIPOS_CONTENIDO, consulta_facturas, consulta_detalle, COLUMNAS_FACTURAS, COLUMNAS_DETALLE
+)
+
+router = APIRouter(
+    prefix="/exportar",
+    tags=["Exportaciones"]
+)
+
+
+def _respuesta(formato: str, stmt, columnas: list[str], nombre: str) -> StreamingResponse:
+    return StreamingResponse(
+        generar(formato, AsyncSessionLectura, stmt, columnas),
+        media_type=TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    )
+
+
+# Exporta las cabeceras de las facturas en CSV o NDJSON, sin cargarlas todas en memoria.
+# Para exportaciones muy grandes conviene encolarlas en /trabajos (tipo "exportar_facturas").
+@router.get("/facturas")
+async def exportar_facturas(
+    formato: Literal["csv", "ndjson"] = "csv",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    creador_id: Optional[int] = None,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    stmt = consulta_facturas(current_user, desde, hasta, creador_id)
+    return _respuesta(formato, stmt, COLUMNAS_FACTURAS, "facturas")
+
+
+# Exporta los ítems (detalle) de las facturas en CSV o NDJSON.
+@router.get("/detalle")
+async def exportar_detalle(
+    formato: Literal["csv", "ndjson"] = "csv",
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    creador_id: Optional[int] = None,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    stmt = consulta_detalle(current_user, desde, hasta, creador_id)
+    return _respuesta(formato, stmt, COLUMNAS_DETALLE, "detalle")
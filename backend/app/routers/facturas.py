@@ -1,14 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+import io
+import zipfile
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, insert, update
-from datetime import datetime
+from sqlalchemy import select, text, insert, update, case, and_, or_, bindparam
+from datetime import datetime, date
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
+from decimal import Decimal
+from pydantic import TypeAdapter
 
 # Importaciones relativas
-from ..db import get_session
+from ..db import get_session, get_session_lectura, AsyncSessionLectura
 from .. import models, schemas
 # 1. IMPORTA EL ARCHIVO DE AUTH
 from .. import auth
+from .. import stock
+from .. import agregados
+from .. import pdf
+from .. import analitica
+from ..cache_respuestas import catalogo_productos
+from ..cambios import difusor
+from ..idempotencia import registro_idempotencia, CABECERA_IDEMPOTENCIA
+from ..paginacion import (
+    LIMITE_POR_DEFECTO, LIMITE_MAXIMO, columnas_proyectadas, decodificar_cursor, armar_pagina
+)
 
 # Creamos el router para Facturas
 router = APIRouter(
@@ -16,10 +34,26 @@ router = APIRouter(
     tags=["Facturas"]
 )
 
+# Cambios que se envían a /cambios: solo los datos que muestran los listados.
+def _publicar_factura(factura: models.Factura, current_user) -> None:
+    difusor.publicar("facturas", "alta", {
+        "id": factura.id,
+        "fecha": factura.fecha.isoformat(),
+        "cliente_id": factura.cliente_id,
+        "creador_username": current_user.username,
+    }, usuario_id=current_user.id)
+
+def _publicar_stock(vendidos: dict[int, int]) -> None:
+    difusor.publicar("productos", "stock", {
+        "items": [{"id": pid, "cambio": -cantidad} for pid, cantidad in vendidos.items()]
+    })
+
 # Endpoint para crear una nueva factura.
 @router.post("/", response_model=schemas.FacturaIdOut)
 async def crear_factura(
     data: schemas.FacturaCreate, # Requiere el ID del cliente.
+    # Con la misma clave, un reintento devuelve la factura ya creada en lugar de crear otra.
+    idempotency_key: Optional[str] = Header(None, alias=CABECERA_IDEMPOTENCIA),
     db: AsyncSession = Depends(get_session),
     # 2. USA LA FUNCIÓN REAL y DESCOMENTA la línea
     current_user: models.Usuario = Depends(auth.get_current_user) 
@@ -29,6 +63,12 @@ async def crear_factura(
     Este método ahora usa una inserción directa con SQLAlchemy para mayor
     claridad y un manejo de errores robusto.
     """
+    return await registro_idempotencia.ejecutar(
+        idempotency_key, ("crear_factura", current_user.id), data.model_dump(), 200,
+        lambda: _crear_factura(data, db, current_user)
+    )
+
+async def _crear_factura(data: schemas.FacturaCreate, db: AsyncSession, current_user):
     try:
         # 1. Instancia un objeto `Factura` con los datos proporcionados.
         nueva_factura = models.Factura(
@@ -40,94 +80,346 @@ async def crear_factura(
         db.add(nueva_factura)
         await db.commit()
         await db.refresh(nueva_factura)
+        _publicar_factura(nueva_factura, current_user)
         
         return {"factura_id": nueva_factura.id}
     except SQLAlchemyError as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error al crear la factura: {e}")
 
+# Endpoint para crear una factura con todos sus ítems de una sola vez.
+@router.post("/completa", response_model=schemas.FacturaIdOut, status_code=201)
+async def crear_factura_completa(
+    data: schemas.FacturaCompletaCreate, # Requiere el ID del cliente y la lista de ítems.
+    idempotency_key: Optional[str] = Header(None, alias=CABECERA_IDEMPOTENCIA),
+    db: AsyncSession = Depends(get_session),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Crea la cabecera de la factura y todos sus ítems en una única transacción.
+    Lee todos los productos en una consulta, inserta los detalles en un solo
+    executemany y descuenta el stock con una única sentencia UPDATE.
+    """
+    return await registro_idempotencia.ejecutar(
+        idempotency_key, ("crear_factura_completa", current_user.id), data.model_dump(), 201,
+        lambda: _crear_factura_completa(data, db, current_user)
+    )
+
+async def _crear_factura_completa(data: schemas.FacturaCompletaCreate, db: AsyncSession, current_user):
+    if not data.items:
+        raise HTTPException(status_code=400, detail="La factura debe tener al menos un ítem")
+
+    # 1. Agrupa las cantidades por producto (la PK de `detalle` es factura_id + producto_id).
+    cantidades: dict[int, int] = {}
+    for item in data.items:
+        cantidades[item.producto_id] = cantidades.get(item.producto_id, 0) + item.cantidad
+
+    # 2. Busca todos los productos referenciados en una sola consulta.
+    result = await db.execute(
+        select(models.Producto.id, models.Producto.stock, models.Producto.precio_venta)
+        .where(models.Producto.id.in_(cantidades.keys()))
+    )
+    productos = {fila.id: fila for fila in result.all()}
+
+    faltantes = [pid for pid in cantidades if pid not in productos]
+    if faltantes:
+        raise HTTPException(status_code=404, detail=f"Productos no encontrados: {faltantes}")
+
+    sin_stock = [pid for pid, cant in cantidades.items() if productos[pid].stock < cant]
+    if sin_stock:
+        raise HTTPException(status_code=400, detail=f"Stock insuficiente para los productos: {sin_stock}")
+
+    ahora = datetime.utcnow()
+    try:
+        # 3. Inserta la cabecera y obtiene el ID sin confirmar la transacción.
+        nueva_factura = models.Factura(
+            cliente_id=data.cliente_id,
+            fecha=ahora,
+            creado_por_usuario_id=current_user.id
+        )
+        db.add(nueva_factura)
+        await db.flush()
+
+        # 4. Inserta todos los detalles con un único executemany.
+        await db.execute(
+            insert(models.Detalle),
+            [
+                {
+                    "factura_id": nueva_factura.id,
+                    "producto_id": pid,
+                    "cantidad": cant,
+                    "precio": productos[pid].precio_venta,
+                    "created": ahora,
+                }
+                for pid, cant in cantidades.items()
+            ]
+        )
+
+        # 5. Descuenta el stock de todos los productos con una sola sentencia (CASE por id).
+        #    La condición `stock >= cantidad` evita sobrevender si otra compra ganó la carrera.
+        cantidad_pedida = case(cantidades, value=models.Producto.id)
+        result = await db.execute(
+            update(models.Producto)
+            .where(
+                models.Producto.id.in_(cantidades.keys()),
+                models.Producto.stock >= cantidad_pedida
+            )
+            .values(stock=models.Producto.stock - cantidad_pedida)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(cantidades):
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Stock insuficiente")
+
+        # 6. Suma el total de la factura al agregado diario del cliente.
+        total = sum(productos[pid].precio_venta * cant for pid, cant in cantidades.items())
+        await agregados.sumar_venta(db, nueva_factura.id, total)
+
+        # 7. Un único commit para toda la factura.
+        await db.commit()
+        catalogo_productos.invalidar() # Cambió el stock de los productos.
+    except SQLAlchemyError as e:
+        await db.rollback() # Si algo falla no queda ni la cabecera ni los ítems.
+        raise HTTPException(status_code=500, detail=f"Error al crear la factura: {e}")
+
+    _publicar_factura(nueva_factura, current_user)
+    _publicar_stock(cantidades)
+    return {"factura_id": nueva_factura.id}
+
 # --- LÓGICA DE LISTAR FACTURAS (ADMIN vs USUARIO) ---
-@router.get("/", response_model=list[schemas.FacturaConNombresOut]) # <-- 1. CAMBIO AQUÍ
+# Columnas que se pueden pedir con el parámetro `campos`.
+f, c, u = models.Factura, models.Cliente, models.Usuario
+COLUMNAS_LISTA_FACTURAS = {
+    "id": f.id,
+    "fecha": f.fecha,
+    "cliente_nombre": c.nombre.label("cliente_nombre"),
+    "cliente_apellido": c.apellido.label("cliente_apellido"),
+    "creador_username": u.username.label("creador_username"),
+}
+
+@router.get("/", response_model=list[schemas.FacturaConNombresOut])
 async def listar_facturas(
+    response: Response,
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None, # Valor de la cabecera X-Siguiente-Cursor de la página anterior.
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    cliente_id: Optional[int] = None,
+    creador_id: Optional[int] = None, # Solo lo respeta un admin.
+    cliente_nombre: Optional[str] = None, # Prefijo del nombre del cliente.
+    campos: Optional[str] = None, # Ej: "id,fecha,cliente_nombre"
+    rapido: bool = False, # Respuesta serializada directo desde las filas (ver app/serializacion.py).
     db: AsyncSession = Depends(get_session),
-    # 4. USA LA FUNCIÓN REAL aquí también
     current_user: models.Usuario = Depends(auth.get_current_user)
 ):
-    # 2. CAMBIO: Usamos SQL puro (text()) para hacer los JOINs
-    query_sql = """
-        SELECT 
-            f.id, 
-            f.fecha, 
-            c.nombre as cliente_nombre, 
-            c.apellido as cliente_apellido,
-            u.username as creador_username
-        FROM factura f
-        LEFT JOIN clientes c ON f.cliente_id = c.id
-        LEFT JOIN usuarios u ON f.creado_por_usuario_id = u.id
-    """
-    
-    # 3. La lógica de roles (admin ve todo, usuario ve solo lo suyo)
-    if current_user.rol == 'admin':
-        query = text(query_sql + " ORDER BY f.fecha DESC")
-        result = await db.execute(query)
-    else:
-        # Añadimos el WHERE para el usuario normal
-        query_sql += " WHERE f.creado_por_usuario_id = :user_id ORDER BY f.fecha DESC"
-        query = text(query_sql)
-        result = await db.execute(query, {"user_id": current_user.id})
-        
-    facturas = result.mappings().all()
-    
-    return facturas
+    # 1. SELECT con los JOINs, solo con las columnas pedidas y ordenado por (fecha, id).
+    columnas = columnas_proyectadas(COLUMNAS_LISTA_FACTURAS, campos, obligatorios=("id", "fecha"))
+    stmt = (
+        select(*columnas)
+        .select_from(f)
+        .outerjoin(c, f.cliente_id == c.id)
+        .outerjoin(u, f.creado_por_usuario_id == u.id)
+        .order_by(f.fecha.desc(), f.id.desc())
+        .limit(limite + 1)
+    )
+
+    # 2. La lógica de roles (admin ve todo, usuario ve solo lo suyo)
+    if current_user.rol != 'admin':
+        stmt = stmt.where(f.creado_por_usuario_id == current_user.id)
+    elif creador_id is not None:
+        stmt = stmt.where(f.creado_por_usuario_id == creador_id)
+
+    # 3. Filtros del lado del servidor.
+    if desde:
+        stmt = stmt.where(f.fecha >= desde)
+    if hasta:
+        stmt = stmt.where(f.fecha < hasta)
+    if cliente_id is not None:
+        stmt = stmt.where(f.cliente_id == cliente_id)
+    if cliente_nombre:
+        stmt = stmt.where(c.nombre.startswith(cliente_nombre, autoescape=True))
+
+    # 4. Paginación por clave (keyset) sobre (fecha DESC, id DESC).
+    if cursor:
+        ultimo = decodificar_cursor(cursor, campos_fecha=("fecha",))
+        stmt = stmt.where(or_(
+            f.fecha < ultimo["fecha"],
+            and_(f.fecha == ultimo["fecha"], f.id < ultimo["id"])
+        ))
+
+    result = await db.execute(stmt)
+    return armar_pagina(
+        result.mappings().all(),
+        limite,
+        lambda fila: {"fecha": fila["fecha"], "id": fila["id"]},
+        response,
+        proyectada=bool(campos),
+        rapido=rapido
+    )
+
 
+def _sentencia_sumar_item(db: AsyncSession, valores: dict):
+    """
+    INSERT del ítem que, si el producto ya está en la factura, suma la cantidad
+    a la fila existente (ON DUPLICATE KEY UPDATE en MySQL, ON CONFLICT en SQLite)
+    en lugar de fallar por la PK (factura_id, producto_id). El precio original se mantiene.
+    """
+    d = models.Detalle.__table__
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite_insert(d).values(**valores)
+        return stmt.on_conflict_do_update(
+            index_elements=["factura_id", "producto_id"],
+            set_={"cantidad": d.c.cantidad + stmt.excluded.cantidad}
+        )
+    stmt = mysql_insert(d).values(**valores)
+    return stmt.on_duplicate_key_update(cantidad=d.c.cantidad + stmt.inserted.cantidad)
 
 # Endpoint para agregar un ítem a una factura existente.
 @router.post("/{factura_id}/items", status_code=201)
 async def agregar_item_factura(
     factura_id: int,
     item: schemas.DetalleCreate, # Necesita producto_id y cantidad
+    # Un reintento con la misma clave no vuelve a descontar stock ni a sumar el ítem.
+    idempotency_key: Optional[str] = Header(None, alias=CABECERA_IDEMPOTENCIA),
     db: AsyncSession = Depends(get_session)
 ):
-    # 1. Buscar el producto para obtener su precio y stock
-    result = await db.execute(select(models.Producto).where(models.Producto.id == item.producto_id))
-    producto = result.scalars().first()
+    return await registro_idempotencia.ejecutar(
+        idempotency_key, ("agregar_item", factura_id), item.model_dump(), 201,
+        lambda: _agregar_item(factura_id, item, db)
+    )
+
+async def _agregar_item(factura_id: int, item: schemas.DetalleCreate, db: AsyncSession):
+    # 1. Buscar el producto para obtener su precio
+    result = await db.execute(
+        select(models.Producto.precio_venta).where(models.Producto.id == item.producto_id)
+    )
+    precio = result.scalar_one_or_none()
     
-    if not producto:
+    if precio is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
         
-    # Verifica si hay suficiente stock del producto.
-    if producto.stock < item.cantidad:
+    # 2. Reserva el stock con un UPDATE condicional (atómico, sin leer y luego escribir).
+    try:
+        await stock.reservador.reservar(item.producto_id, item.cantidad)
+    except stock.StockInsuficiente:
         raise HTTPException(status_code=400, detail="Stock insuficiente")
+    except stock.ContencionStock:
+        raise HTTPException(status_code=409, detail="El producto está siendo modificado, intente nuevamente")
+    catalogo_productos.invalidar() # Cambió el stock del producto.
         
-    # 2. Prepara la sentencia para insertar el detalle de la factura.
-    detalle_stmt = insert(models.Detalle).values(
-        factura_id=factura_id,
-        producto_id=item.producto_id,
-        cantidad=item.cantidad,
-        precio=producto.precio_venta, # Usamos el precio guardado del producto
-        created=datetime.utcnow()
-    )
+    # 3. Prepara la sentencia para insertar el detalle de la factura (o sumar la cantidad si ya está).
+    detalle_stmt = _sentencia_sumar_item(db, {
+        "factura_id": factura_id,
+        "producto_id": item.producto_id,
+        "cantidad": item.cantidad,
+        "precio": precio, # Usamos el precio guardado del producto
+        "created": datetime.utcnow(),
+    })
     
-    # 3. Prepara la sentencia para actualizar el stock del producto.
-    stock_stmt = update(models.Producto).where(
-        models.Producto.id == item.producto_id
-    ).values(
-        stock = models.Producto.stock - item.cantidad
-    )
-    
-    # Ejecuta ambas operaciones (insertar detalle y actualizar stock) dentro de una transacción.
+    # Inserta el detalle (y actualiza el agregado de ventas); si falla, devuelve al stock la cantidad reservada.
     try:
+        # Si el producto ya estaba en la factura, el importe se calcula con su precio original.
+        result = await db.execute(
+            select(models.Detalle.precio)
+            .where(models.Detalle.factura_id == factura_id, models.Detalle.producto_id == item.producto_id)
+        )
+        precio_item = result.scalar_one_or_none() or precio
         await db.execute(detalle_stmt)
-        await db.execute(stock_stmt)
+        await agregados.sumar_venta(db, factura_id, precio_item * item.cantidad)
         await db.commit()
     except SQLAlchemyError as e:
         await db.rollback() # Si ocurre un error, se revierte toda la transacción.
+        await stock.reservador.liberar(item.producto_id, item.cantidad)
+        catalogo_productos.invalidar()
         raise HTTPException(status_code=500, detail=f"Error de base de datos al agregar item: {str(e)}")
     
+    # La factura cambió: el PDF cacheado ya no sirve, ni la copia de ventas de la
+    # analítica si ya la tenía cargada.
+    pdf.cache_pdf.invalidar_factura(factura_id)
+    analitica.ventas.invalidar_factura(factura_id)
+    _publicar_stock({item.producto_id: item.cantidad})
+    propietario = (await db.execute(
+        select(models.Factura.creado_por_usuario_id).where(models.Factura.id == factura_id)
+    )).scalar_one_or_none()
+    difusor.publicar("facturas", "modificacion", {"id": factura_id}, usuario_id=propietario)
     return {"mensaje": "Item agregado correctamente"}
+
+# Endpoint para descargar el PDF de una factura (cacheado por contenido).
+@router.get("/{factura_id}/pdf/")
+async def pdf_factura(
+    factura_id: int,
+    db: AsyncSession = Depends(get_session_lectura),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    datos = (await pdf.datos_facturas(db, [factura_id])).get(factura_id)
+    if datos is None:
+        raise HTTPException(status_code=404, detail="Factura no encontrada")
+    if current_user.rol != 'admin' and datos["creador"] != current_user.username:
+        raise HTTPException(status_code=403, detail="No tiene permiso para ver esta factura")
+
+    contenido = await pdf.pdf_factura(datos)
+    return Response(
+        content=contenido,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="factura_{factura_id}.pdf"'}
+    )
+
+class _SalidaZip(io.RawIOBase):
+    # Destino no seekable para zipfile: acumula lo escrito hasta que se envía.
+    def __init__(self):
+        self.partes: list[bytes] = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self) -> bytes:
+        contenido = b"".join(self.partes)
+        self.partes.clear()
+        return contenido
+
+# Endpoint para descargar en un .zip los PDFs de todas las facturas de un rango de fechas.
+@router.get("/pdf/zip")
+async def pdf_facturas_zip(
+    desde: datetime,
+    hasta: datetime,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    stmt = select(f.id).where(f.fecha >= desde, f.fecha < hasta).order_by(f.id).limit(100)
+    if current_user.rol != 'admin':
+        stmt = stmt.where(f.creado_por_usuario_id == current_user.id)
+
+    async def generar_zip():
+        # La sesión se abre acá porque el zip se sigue enviando después de que termina el handler.
+        salida = _SalidaZip()
+        with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+            async with AsyncSessionLectura() as db:
+                ultimo_id = 0
+                while True:
+                    # Recorre las facturas de a 100 por clave (id), con memoria constante.
+                    ids = (await db.scalars(stmt.where(f.id > ultimo_id))).all()
+                    if not ids:
+                        break
+                    ultimo_id = ids[-1]
+                    lote = await pdf.datos_facturas(db, list(ids))
+                    for factura_id in ids:
+                        contenido = await pdf.pdf_factura(lote[factura_id])
+                        archivo_zip.writestr(f"factura_{factura_id}.pdf", contenido)
+                        yield salida.vaciar()
+        yield salida.vaciar()
+
+    return StreamingResponse(
+        generar_zip(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="facturas.zip"'}
+    )
+
 # Endpoint para obtener el detalle de una factura específica, incluyendo información del producto.
 @router.get("/{factura_id}/detalle")
-async def detalle_factura(factura_id: int, db: AsyncSession = Depends(get_session)) -> list[schemas.DetalleFacturaItemOut]:
+async def detalle_factura(factura_id: int, db: AsyncSession = Depends(get_session_lectura)) -> list[schemas.DetalleFacturaItemOut]:
     query = text("""
         SELECT d.producto_id, p.nombre, d.cantidad, d.precio, (d.cantidad * d.precio) AS importe
         FROM detalle d
@@ -143,23 +435,118 @@ async def detalle_factura(factura_id: int, db: AsyncSession = Depends(get_sessio
         
     return items
 
+# --- Factura completa (cabecera + cliente + creador + ítems + total) ---
+# Sentencias armadas una sola vez con un parámetro "expanding": el compilado
+# queda en la caché de SQLAlchemy y se reutiliza para cualquier lista de IDs.
+_ids = bindparam("ids", expanding=True)
+d, p = models.Detalle, models.Producto
+CABECERAS_FACTURAS = (
+    select(
+        f.id, f.fecha, f.creado_por_usuario_id,
+        c.id.label("cliente_id"), c.nombre, c.apellido, c.dni,
+        u.username.label("creador_username"),
+    )
+    .select_from(f)
+    .outerjoin(c, c.id == f.cliente_id)
+    .outerjoin(u, u.id == f.creado_por_usuario_id)
+    .where(f.id.in_(_ids))
+)
+ITEMS_FACTURAS = (
+    select(
+        d.factura_id, d.producto_id, p.nombre, d.cantidad, d.precio,
+        (d.cantidad * d.precio).label("importe"),
+    )
+    .join(p, p.id == d.producto_id)
+    .where(d.factura_id.in_(_ids))
+    .order_by(d.factura_id, d.producto_id)
+)
+MAX_FACTURAS_POR_LOTE = 100
+_lista_facturas_detalladas = TypeAdapter(list[schemas.FacturaDetalladaOut])
+
+async def _facturas_detalladas(db: AsyncSession, ids: list[int], current_user) -> list[schemas.FacturaDetalladaOut]:
+    """Arma las facturas pedidas con dos consultas en total, sin importar cuántas sean."""
+    # 1. Cabeceras (con cliente y creador). Un usuario normal solo ve las suyas.
+    result = await db.execute(CABECERAS_FACTURAS, {"ids": ids})
+    cabeceras = [
+        fila for fila in result.all()
+        if current_user.rol == 'admin' or fila.creado_por_usuario_id == current_user.id
+    ]
+    if not cabeceras:
+        return []
+
+    # 2. Ítems de todas esas facturas en una sola consulta.
+    items: dict[int, list] = {fila.id: [] for fila in cabeceras}
+    result = await db.execute(ITEMS_FACTURAS, {"ids": list(items)})
+    for fila in result.mappings().all():
+        items[fila["factura_id"]].append(fila)
+
+    facturas = {}
+    for fila in cabeceras:
+        facturas[fila.id] = schemas.FacturaDetalladaOut(
+            id=fila.id,
+            fecha=fila.fecha,
+            cliente=schemas.ClienteResumenOut(
+                id=fila.cliente_id, nombre=fila.nombre, apellido=fila.apellido, dni=fila.dni
+            ) if fila.cliente_id is not None else None,
+            creador_username=fila.creador_username,
+            items=[schemas.DetalleFacturaItemOut.model_validate(dict(i)) for i in items[fila.id]],
+            total=sum((i["importe"] for i in items[fila.id]), Decimal("0")),
+        )
+    # Respeta el orden en que se pidieron los IDs.
+    return [facturas[i] for i in ids if i in facturas]
+
+# Endpoint que devuelve una factura completa en una sola petición.
+@router.get("/{factura_id}/completa", response_model=schemas.FacturaDetalladaOut)
+async def factura_completa(
+    factura_id: int,
+    db: AsyncSession = Depends(get_session_lectura),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    facturas = await _facturas_detalladas(db, [factura_id], current_user)
+    if not facturas:
+        raise HTTPException(status_code=404, detail="Factura no encontrada")
+    return Response(content=facturas[0].model_dump_json(), media_type="application/json")
+
+# Endpoint para traer varias facturas completas de una vez (ej. ?ids=1,2,3), para expandir filas del listado.
+@router.get("/completas", response_model=list[schemas.FacturaDetalladaOut])
+async def facturas_completas(
+    ids: str,
+    db: AsyncSession = Depends(get_session_lectura),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    try:
+        lista_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="`ids` debe ser una lista de números separados por coma")
+    if not lista_ids or len(lista_ids) > MAX_FACTURAS_POR_LOTE:
+        raise HTTPException(status_code=400, detail=f"Se pueden pedir entre 1 y {MAX_FACTURAS_POR_LOTE} facturas")
+
+    facturas = await _facturas_detalladas(db, lista_ids, current_user)
+    return Response(content=_lista_facturas_detalladas.dump_json(facturas), media_type="application/json")
+
 # Endpoint para generar un reporte de ventas agrupado por cliente.
+# Se responde desde los totales diarios precalculados (ventas_diarias_cliente),
+# sin recorrer las filas de `detalle`.
 @router.get("/reporte/ventas-por-cliente", response_model=list[schemas.ReporteVentasClienteOut])
-async def reporte_ventas_cliente(db: AsyncSession = Depends(get_session)):
-    query = text("""
-        SELECT 
-            c.id AS cliente_id,
-            c.nombre,
-            c.apellido,
-            SUM(d.cantidad * d.precio) AS total_comprado
-        FROM factura f
-        INNER JOIN clientes c ON c.id = f.cliente_id
-        INNER JOIN detalle d ON d.factura_id = f.id
-        GROUP BY c.id, c.nombre, c.apellido
-        ORDER BY total_comprado DESC
-    """)
-    
-    result = await db.execute(query)
+async def reporte_ventas_cliente(
+    desde: Optional[date] = None, # Día inicial (inclusive).
+    hasta: Optional[date] = None, # Día final (inclusive).
+    top: Optional[int] = Query(None, ge=1), # Solo los N clientes que más compraron.
+    db: AsyncSession = Depends(get_session_lectura)
+):
+    # Para rangos grandes o reportes pesados conviene encolarlo en /trabajos.
+    result = await db.execute(agregados.consulta_ventas_por_cliente(desde, hasta, top))
     reporte = result.mappings().all()
     
-    return reporte
\ No newline at end of file
+    return reporte
+
+# Endpoint para recalcular los agregados de ventas a partir de `detalle` (solo admin).
+@router.post("/reporte/reconciliar")
+async def reconciliar_reporte(
+    desde: Optional[date] = None,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    if current_user.rol != 'admin':
+        raise HTTPException(status_code=403, detail="Solo un administrador puede reconciliar el reporte")
+    await agregados.reconciliar(desde=desde)
+    return {"mensaje": "Agregados de ventas reconciliados"}
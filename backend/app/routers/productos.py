@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, insert, update, delete
 
-from ..db import get_session
+from ..db import get_session, AsyncSessionLocal
 from .. import models, schemas
 from .. import auth
+from ..paginacion import (
+    LIMITE_POR_DEFECTO, LIMITE_MAXIMO, columnas_proyectadas, decodificar_cursor, recortar_pagina
+)
+from ..cache_respuestas import catalogo_productos
+from ..importar import importar, formato_de
+from ..busqueda import indice_productos
+from ..serializacion import filas_a_json, respuesta_json
+from ..borrado import borrar_productos, BORRADO_MAX_SINCRONICO
+from ..trabajos import cola
+from ..cambios import difusor
+from ..analitica import ventas as analitica_ventas
 router = APIRouter(
     prefix="/productos",
     tags=["Productos"]
@@ -22,21 +34,111 @@ async def crear_producto(
     db.add(nuevo_producto)
     # Confirma la transacción para guardar los cambios.
     await db.commit()
+    catalogo_productos.invalidar() # El listado cacheado ya no es válido.
     # Actualiza el objeto `nuevo_producto` para obtener el ID asignado por la base de datos.
     await db.refresh(nuevo_producto)
+    indice_productos.agregar(nuevo_producto)
+    difusor.publicar("productos", "alta", schemas.ProductoOut.model_validate(nuevo_producto).model_dump(mode="json"))
     return nuevo_producto
 
+# Endpoint para importar productos (upsert por nombre) desde un CSV o NDJSON enviado en streaming.
+@router.post("/bulk", response_model=schemas.ResultadoImportacionOut)
+async def importar_productos(
+    request: Request,
+    formato: Optional[Literal["csv", "ndjson"]] = None, # Si no se indica, se deduce del Content-Type.
+    db: AsyncSession = Depends(get_session),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Valida las filas por lotes con `ProductoCreate` y las guarda con INSERT ... ON DUPLICATE
+    KEY UPDATE sobre `nombre`. Las filas con errores se informan sin abortar el resto.
+    """
+    resultado = await importar(
+        request, formato_de(request, formato), db, models.Producto.__table__, schemas.ProductoCreate, "nombre"
+    )
+    if resultado.guardadas:
+        catalogo_productos.invalidar() # El listado cacheado ya no es válido.
+        # El upsert no devuelve qué filas cambió: se recarga el índice de búsqueda completo.
+        await indice_productos.cargar(AsyncSessionLocal, models.Producto)
+        # No se sabe qué filas cambiaron: los clientes vuelven a pedir el listado.
+        difusor.publicar("productos", "recarga", {})
+        analitica_ventas.invalidar_costos() # Pudo cambiar el precio de compra.
+    if resultado.corte:
+        raise resultado.corte
+    return resultado.como_dict()
+
+# Endpoint para borrar muchos productos (con sus ítems de factura) en una sola petición.
+@router.post("/borrar", response_model=schemas.ResultadoBorradoOut | schemas.TrabajoOut)
+async def borrar_varios_productos(
+    data: schemas.BorradoCreate,
+    response: Response,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Borra por lotes con DELETE de conjunto, sin cargar los ítems en memoria.
+    Devuelve cuántos se borraron y qué ids no existían. Con `en_segundo_plano`
+    (o más de BORRADO_MAX_SINCRONICO ids) encola un trabajo y responde 202:
+    el avance se consulta en GET /trabajos/{id}. Solo admin: borra ítems de facturas.
+    """
+    if current_user.rol != 'admin':
+        raise HTTPException(status_code=403, detail="Solo un administrador puede borrar productos en bloque")
+    if data.en_segundo_plano or len(data.ids) > BORRADO_MAX_SINCRONICO:
+        response.status_code = 202
+        return await cola.enviar("borrar_productos", schemas.ParametrosBorrado(ids=data.ids), 5, current_user)
+    return (await borrar_productos(AsyncSessionLocal, data.ids)).como_dict()
+
 @router.get("/", response_model=list[schemas.ProductoOut])
 async def listar_productos(
+    request: Request,
+    limite: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    cursor: Optional[str] = None,
+    nombre: Optional[str] = None,
+    con_stock: bool = False,
+    campos: Optional[str] = None,
+    rapido: bool = False,
     db: AsyncSession = Depends(get_session),
     current_user: models.Usuario = Depends(auth.get_current_user)
 ):
     """
-    Devuelve una lista de todos los productos.
+    Devuelve una página de productos ordenada por ID.
+    - **cursor**: valor de la cabecera `X-Siguiente-Cursor` de la página anterior.
+    - **nombre**: filtra por prefijo del nombre.
+    - **con_stock**: devuelve solo productos con stock disponible.
+    - **campos**: columnas a devolver separadas por coma (ej. `id,nombre,stock`).
+    - **rapido**: serializa las filas directamente a JSON, sin validarlas con `ProductoOut`.
     """
-    stmt = select(models.Producto)
+    # Si el catálogo no cambió, responde 304 o la página ya serializada sin ir a la base.
+    cacheada = catalogo_productos.respuesta_cacheada(request)
+    if cacheada is not None:
+        return cacheada
+    version = catalogo_productos.version
+
+    columnas = columnas_proyectadas(dict(models.Producto.__table__.c), campos)
+    stmt = select(*columnas).order_by(models.Producto.id).limit(limite + 1)
+
+    if nombre:
+        stmt = stmt.where(models.Producto.nombre.startswith(nombre, autoescape=True))
+    if con_stock:
+        stmt = stmt.where(models.Producto.stock > 0)
+    if cursor:
+        stmt = stmt.where(models.Producto.id > decodificar_cursor(cursor)["id"])
+
     result = await db.execute(stmt)
-    return result.scalars().all()
+    filas, siguiente = recortar_pagina(result.mappings().all(), limite, lambda fila: {"id": fila["id"]})
+    return catalogo_productos.guardar(request, version, filas, siguiente, proyectada=bool(campos), rapido=rapido)
+
+# Autocompletado de productos por nombre y descripción, desde el índice en memoria.
+@router.get("/buscar", response_model=list[schemas.ProductoBusquedaOut])
+async def buscar_productos(
+    q: str = Query(..., min_length=1),
+    limite: int = Query(10, ge=1, le=50),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Busca por prefijo ("cafet" encuentra "Cafetera") y tolera errores de tipeo
+    ("cafetrea"). Devuelve los resultados ordenados por relevancia.
+    """
+    return respuesta_json(filas_a_json(indice_productos.buscar(q, limite)))
 
 @router.get("/{producto_id}", response_model=schemas.ProductoOut)
 async def obtener_producto(
@@ -78,26 +180,24 @@ async def actualizar_producto(
 
     # Confirma la transacción para guardar los cambios.
     await db.commit()
+    catalogo_productos.invalidar() # El listado cacheado ya no es válido.
     # Actualiza el objeto `producto_db` para reflejar los cambios persistidos.
     await db.refresh(producto_db)
+    indice_productos.agregar(producto_db)
+    analitica_ventas.invalidar_costos() # Pudo cambiar el precio de compra.
+    difusor.publicar("productos", "modificacion", schemas.ProductoOut.model_validate(producto_db).model_dump(mode="json"))
     return producto_db
 
 @router.delete("/{producto_id}", status_code=204)
 async def eliminar_producto(
     producto_id: int, 
-    db: AsyncSession = Depends(get_session),
     current_user: models.Usuario = Depends(auth.get_current_user)):
-    # 1. Busca el producto que se va a eliminar.
-    stmt = select(models.Producto).where(models.Producto.id == producto_id)
-    result = await db.execute(stmt)
-    producto_a_eliminar = result.scalars().first()
-
-    # 2. Si no se encuentra, lanza un error 404.
-    if not producto_a_eliminar:
+    # Borra los ítems de factura del producto por lotes y después el producto
+    # (sin db.delete(), que cargaría cada ítem en memoria para la cascada).
+    # También invalida el catálogo cacheado y lo quita del índice de búsqueda.
+    # Solo admin: borra ítems de facturas de cualquier usuario.
+    if current_user.rol != 'admin':
+        raise HTTPException(status_code=403, detail="Solo un administrador puede eliminar productos")
+    progreso = await borrar_productos(AsyncSessionLocal, [producto_id])
+    if progreso.no_encontrados:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    
-    # 3. Usa db.delete() para que SQLAlchemy maneje las cascadas.
-    await db.delete(producto_a_eliminar)
-    
-    # 4. Confirma la transacción.
-    await db.commit()
@@ -0,0 +1,101 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import FileResponse
+from pydantic import ValidationError
+
+from .. import models, schemas
+from .. import auth
+from ..trabajos import cola, TIPOS
+
+router = APIRouter(
+    prefix="/trabajos",
+    tags=["Trabajos"]
+)
+
+
+async def _trabajo_visible(trabajo_id: str, current_user) -> dict:
+    # Un usuario normal solo ve sus propios trabajos; un admin ve todos.
+    trabajo = await cola.obtener(trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if current_user.rol != 'admin' and trabajo["usuario_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="No autorizado para ver este trabajo")
+    return trabajo
+
+# Encola un trabajo pesado (reporte o exportación) y devuelve su ID enseguida.
+@router.post("/", response_model=schemas.TrabajoOut, status_code=202)
+async def crear_trabajo(
+    data: schemas.TrabajoCreate,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Tipos disponibles:
+    - **reporte_ventas_cliente**: `desde`, `hasta`, `top` (como GET /facturas/reporte/ventas-por-cliente).
+    - **exportar_facturas** / **exportar_detalle**: `formato`, `desde`, `hasta`, `creador_id` (como /exportar).
+    - **borrar_productos** / **borrar_clientes**: `ids` (como POST /productos/borrar y /clientes/borrar).
+    """
+    tipo = TIPOS.get(data.tipo)
+    if tipo is None:
+        raise HTTPException(status_code=400, detail=f"Tipo de trabajo desconocido. Opciones: {sorted(TIPOS)}")
+    # Los borrados masivos se llevan el historial de facturas: solo admin, igual que en /productos/borrar.
+    if data.tipo in ("borrar_productos", "borrar_clientes") and current_user.rol != 'admin':
+        raise HTTPException(status_code=403, detail="Solo un administrador puede encolar borrados masivos")
+    try:
+        parametros = tipo.parametros.model_validate(data.parametros)
+    except ValidationError as e:
+        errores = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        raise HTTPException(status_code=422, detail=errores)
+    return await cola.enviar(data.tipo, parametros, data.prioridad, current_user)
+
+# Lista los trabajos más recientes (los propios, o todos si es admin).
+@router.get("/", response_model=list[schemas.TrabajoOut])
+async def listar_trabajos(
+    limite: int = Query(100, ge=1, le=1000),
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    return await cola.listar(None if current_user.rol == 'admin' else current_user.id, limite)
+
+@router.get("/{trabajo_id}", response_model=schemas.TrabajoOut)
+async def estado_trabajo(
+    trabajo_id: str,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    return await _trabajo_visible(trabajo_id, current_user)
+
+# Descarga el resultado de un trabajo terminado (se sirve desde el archivo en disco).
+@router.get("/{trabajo_id}/resultado")
+async def resultado_trabajo(
+    trabajo_id: str,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    trabajo = await _trabajo_visible(trabajo_id, current_user)
+    if trabajo["estado"] != "terminado":
+        raise HTTPException(status_code=409, detail=f"El trabajo está {trabajo['estado']}")
+    ruta = cola.ruta_resultado(trabajo)
+    if not os.path.exists(ruta):
+        raise HTTPException(status_code=410, detail="El resultado ya no está disponible")
+    return FileResponse(
+        ruta,
+        media_type=trabajo["media_type"],
+        filename=f"{trabajo['tipo']}_{trabajo_id}.{trabajo['extension']}"
+    )
+
+# Cancela un trabajo pendiente o en curso.
+@router.delete("/{trabajo_id}", response_model=schemas.TrabajoOut)
+async def cancelar_trabajo(
+    trabajo_id: str,
+    response: Response,
+    current_user: models.Usuario = Depends(auth.get_current_user)
+):
+    """
+    Un trabajo en curso (en este worker o en otro) se detiene en segundo plano:
+    responde 202 con el estado todavía en_curso, y pasa a cancelado en pocos
+    segundos (se consulta en GET /trabajos/{id}).
+    """
+    await _trabajo_visible(trabajo_id, current_user)
+    if not await cola.cancelar(trabajo_id):
+        raise HTTPException(status_code=409, detail="El trabajo ya terminó")
+    trabajo = await cola.obtener(trabajo_id)
+    if trabajo["estado"] == "en_curso":
+        response.status_code = 202
+    return trabajo
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field, Json
+from typing import Any, Literal, Optional
+from datetime import date, datetime
 from decimal import Decimal
 
 # Schemas Pydantic para la validación de datos de Clientes.
@@ -43,6 +43,12 @@ class ProductoOut(ProductoBase):
     class Config:
         from_attributes = True
 
+# Resultado de autocompletado: solo lo necesario para elegir el producto.
+class ProductoBusquedaOut(BaseModel):
+    id: int
+    nombre: str
+    precio_venta: Decimal
+
 # --- Schemas para Facturas ---
 # Schemas Pydantic para la validación de datos de Facturas.
 class FacturaCreate(BaseModel):
@@ -66,7 +72,12 @@ class FacturaOut(BaseModel):
 class DetalleCreate(BaseModel):
     # Schema para agregar un ítem a una factura, requiere producto_id y cantidad.
     producto_id: int
-    cantidad: int
+    cantidad: int = Field(gt=0) # La cantidad debe ser mayor a cero.
+
+class FacturaCompletaCreate(BaseModel):
+    # Schema para crear una factura con todos sus ítems en una sola transacción.
+    cliente_id: int
+    items: list[DetalleCreate]
 
 # Schema para la respuesta de un detalle de factura.
 class DetalleOut(BaseModel):
@@ -89,6 +100,21 @@ class DetalleFacturaItemOut(BaseModel):
     class Config:
         from_attributes = True # Permite leer datos desde objetos
 
+class ClienteResumenOut(BaseModel):
+    id: int
+    nombre: str
+    apellido: str
+    dni: int
+
+# Factura completa: cabecera, cliente, creador, ítems con importe y total.
+class FacturaDetalladaOut(BaseModel):
+    id: int
+    fecha: datetime
+    cliente: Optional[ClienteResumenOut] = None
+    creador_username: Optional[str] = None
+    items: list[DetalleFacturaItemOut]
+    total: Decimal
+
 # --- ¡CLASE FALTANTE CORREGIDA! ---
 # Esta clase faltaba y causaba el error en facturas.py
 class ReporteVentasClienteOut(BaseModel):
@@ -115,6 +141,12 @@ class FacturaConNombresOut(BaseModel):
     class Config:
         from_attributes = True
 
+class ClienteBusquedaOut(BaseModel):
+    id: int
+    nombre: str
+    apellido: str
+    dni: int
+
 # --- Schemas para Usuario ---
 class UsuarioBase(BaseModel):
     username: str
@@ -127,4 +159,72 @@ class UsuarioOut(UsuarioBase):
     rol: str
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# --- Schemas para importaciones masivas ---
+class ErrorFilaOut(BaseModel):
+    fila: int # Número de fila de datos (sin contar la cabecera del CSV).
+    error: str
+
+class ResultadoImportacionOut(BaseModel):
+    procesadas: int
+    guardadas: int
+    cantidad_errores: int
+    errores: list[ErrorFilaOut] # Solo los primeros errores; el total está en cantidad_errores.
+
+# --- Schemas para trabajos en segundo plano ---
+class TrabajoCreate(BaseModel):
+    tipo: str # Ej: "reporte_ventas_cliente", "exportar_facturas", "borrar_productos"
+    parametros: dict[str, Any] = {}
+    prioridad: int = Field(5, ge=0, le=9) # 0 es la más urgente.
+
+class TrabajoOut(BaseModel):
+    id: str
+    tipo: str
+    estado: str # pendiente, en_curso, terminado, fallido, cancelado o vencido
+    prioridad: int
+    creado: datetime
+    iniciado: Optional[datetime] = None
+    terminado: Optional[datetime] = None
+    error: Optional[str] = None
+    progreso: Optional[Json[dict[str, Any]]] = None # Avance informado por el trabajo (ej. borrados).
+
+class ParametrosReporteVentas(BaseModel):
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+    top: Optional[int] = Field(None, ge=1)
+
+class ParametrosExportacion(BaseModel):
+    formato: Literal["csv", "ndjson"] = "csv"
+    desde: Optional[datetime] = None
+    hasta: Optional[datetime] = None
+    creador_id: Optional[int] = None
+
+# --- Schemas para borrados masivos ---
+MAX_IDS_POR_BORRADO = 100_000
+
+class ParametrosBorrado(BaseModel):
+    ids: list[int] = Field(..., min_length=1, max_length=MAX_IDS_POR_BORRADO)
+
+class BorradoCreate(ParametrosBorrado):
+    en_segundo_plano: bool = False # Encola un trabajo y devuelve 202 en lugar de esperar.
+
+class ResultadoBorradoOut(BaseModel):
+    pedidos: int
+    borrados: int
+    items_borrados: int
+    facturas_borradas: int
+    lotes: int
+    no_encontrados: list[int]
+
+# --- Schemas para la analítica de ventas ---
+class VentasAnaliticaOut(BaseModel):
+    periodo: Optional[date] = None # Primer día del período (None si se pidió el total).
+    id: Optional[int] = None # ID del producto, cliente o creador (None si se pidió el total).
+    nombre: Optional[str] = None
+    unidades: int
+    lineas: int # Ítems de factura sumados.
+    ventas: Decimal
+    costo: Decimal # Con el precio de compra actual de cada producto.
+    margen: Decimal
+    margen_pct: Optional[float] = None
@@ -0,0 +1,50 @@
+import os
+from decimal import Decimal
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+# orjson es opcional: si no está instalado se usa el serializador de pydantic-core.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Configuración (variables de entorno) ---
+# JSON_DECIMALES: cómo se escriben los Decimal (precios, importes).
+#   "texto" (por defecto): como string ("12.50"), sin pérdida y igual que los response_model.
+#   "numero": como número JSON (12.5). Más compacto, pero pasa por float.
+JSON_DECIMALES = os.getenv("JSON_DECIMALES", "texto")
+if JSON_DECIMALES not in ("texto", "numero"):
+    raise ValueError("JSON_DECIMALES debe ser 'texto' o 'numero'")
+
+_filas = TypeAdapter(list[dict[str, Any]])
+
+
+def _por_defecto(valor):
+    # orjson no conoce Decimal: lo convierte según la política configurada.
+    if isinstance(valor, Decimal):
+        return float(valor) if JSON_DECIMALES == "numero" else str(valor)
+    # Escalares de numpy (numpy.generic) que se hayan colado en las filas.
+    if hasattr(valor, "item") and type(valor).__module__ == "numpy":
+        return valor.item()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def filas_a_json(filas) -> bytes:
+    """
+    Serializa filas de Core (RowMapping o dict) directamente a bytes JSON, sin
+    crear modelos de Pydantic ni pasar por `jsonable_encoder`.
+    """
+    filas = [dict(f) for f in filas]
+    if orjson is not None:
+        return orjson.dumps(filas, default=_por_defecto)
+    if JSON_DECIMALES == "numero":
+        filas = [{k: float(v) if isinstance(v, Decimal) else v for k, v in f.items()} for f in filas]
+    return _filas.dump_json(filas)
+
+
+def respuesta_json(cuerpo: bytes, headers: dict | None = None) -> Response:
+    """Respuesta con un cuerpo JSON ya serializado."""
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
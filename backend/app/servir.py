@@ -0,0 +1,103 @@
+# Punto de entrada para servir la API con varios procesos (workers de uvicorn).
+#
+# Uso (desde backend/):
+#     python -m app.servir                                  # un worker por núcleo
+#     python -m app.servir --workers 4 --conexiones-totales 40
+#
+# Antes de lanzar los workers, en este proceso:
+# 1. Calcula cuántos workers usar (núcleos disponibles, sin dejar a ninguno con
+#    menos de SERVIR_MIN_CONEXIONES conexiones del presupuesto).
+# 2. Aplica las migraciones (si DB_MIGRAR_AL_INICIAR=1) y crea la tabla de
+#    agregados, una sola vez y no en cada worker.
+# 3. Reinicia el almacén compartido (app/compartido.py).
+# Cada worker recibe WEB_WORKERS y DB_CONEXIONES_TOTALES por el entorno: con eso
+# se reparte el pool de db.py, el pool de Argon2 y activa las cachés compartidas.
+#
+# Los cambios de /cambios también pasan por el almacén: cada worker los lee de ahí
+# y con ellos actualiza sus índices de búsqueda y su copia de la analítica (que
+# siguen siendo de cada worker, como los límites de concurrencia de la admisión).
+import argparse
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# SERVIR_MIN_CONEXIONES: conexiones mínimas por worker; limita la cantidad de workers
+#   cuando el presupuesto DB_CONEXIONES_TOTALES es chico.
+SERVIR_MIN_CONEXIONES = int(os.getenv("SERVIR_MIN_CONEXIONES", "3"))
+
+
+def nucleos_disponibles() -> int:
+    # sched_getaffinity respeta los núcleos asignados al contenedor o proceso.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def calcular_workers(pedidos: int | None, conexiones_totales: int) -> int:
+    workers = pedidos or nucleos_disponibles()
+    if conexiones_totales > 0:
+        workers = min(workers, max(1, conexiones_totales // SERVIR_MIN_CONEXIONES))
+    return max(1, workers)
+
+
+async def preparar() -> None:
+    """Lo que se hace una sola vez por máquina antes de levantar los workers."""
+    from . import agregados, migraciones
+    from .db import engine
+
+    try:
+        if migraciones.DB_MIGRAR_AL_INICIAR:
+            await migraciones.aplicar_migraciones()
+        if await agregados.crear_tabla():
+            await agregados.reconciliar()
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sirve la API con varios workers")
+    parser.add_argument("--host", default=os.getenv("SERVIR_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVIR_PUERTO", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", "0")) or None,
+                        help="Cantidad de workers (por defecto, uno por núcleo)")
+    parser.add_argument("--conexiones-totales", type=int, default=int(os.getenv("DB_CONEXIONES_TOTALES", "0")),
+                        help="Conexiones a la base entre todos los workers (0 = DB_POOL_SIZE/DB_MAX_OVERFLOW por worker)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    workers = calcular_workers(args.workers, args.conexiones_totales)
+    # Se fija antes de importar los módulos de la app, que leen el entorno al importarse.
+    os.environ["WEB_WORKERS"] = str(workers)
+    os.environ["DB_CONEXIONES_TOTALES"] = str(args.conexiones_totales)
+    # Con el puerto, dos instancias en la misma máquina no comparten almacén (app/compartido.py).
+    os.environ["SERVIR_PUERTO"] = str(args.port)
+
+    import uvicorn
+    from .compartido import almacen, COMPARTIDO_ACTIVO
+    from .db import DB_POOL_SIZE, DB_MAX_OVERFLOW
+    from .ciclo_vida import APAGADO_ESPERA_MAXIMA
+
+    asyncio.run(preparar())
+    # Ya se aplicaron acá: los workers no las vuelven a correr a la vez.
+    os.environ["DB_MIGRAR_AL_INICIAR"] = "0"
+    if COMPARTIDO_ACTIVO:
+        almacen.reiniciar()
+        almacen.cerrar()
+
+    logger.info(
+        "Lanzando %d workers en %s:%d; pool por worker %d + %d (hasta %d conexiones en total)",
+        workers, args.host, args.port, DB_POOL_SIZE, DB_MAX_OVERFLOW, workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+    )
+    # Al apagar, uvicorn espera a que se cierren las conexiones antes del lifespan;
+    # con este límite, una conexión que no termina no lo deja colgado.
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level,
+                timeout_graceful_shutdown=APAGADO_ESPERA_MAXIMA)
+
+
+if __name__ == "__main__":
+    main()
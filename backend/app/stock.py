@@ -0,0 +1,174 @@
+import asyncio
+from dataclasses import dataclass, field
+
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+from . import models
+from .db import AsyncSessionLocal
+
+# Códigos de error de MySQL que indican contención: lock wait timeout y deadlock.
+ERRORES_CONTENCION_MYSQL = {1205, 1213}
+
+
+class StockInsuficiente(Exception):
+    """No hay stock suficiente (o el producto no existe) para cubrir la reserva."""
+
+    def __init__(self, producto_id: int, cantidad: int):
+        super().__init__(f"Stock insuficiente para el producto {producto_id} (pedido: {cantidad})")
+        self.producto_id = producto_id
+        self.cantidad = cantidad
+
+
+class ContencionStock(Exception):
+    """La reserva no pudo aplicarse después de agotar los reintentos."""
+
+
+def es_error_de_contencion(error: OperationalError) -> bool:
+    """Indica si el error de la base de datos se debe a bloqueos entre transacciones."""
+    orig = getattr(error, "orig", None)
+    args = getattr(orig, "args", ())
+    if args and args[0] in ERRORES_CONTENCION_MYSQL:
+        return True
+    # SQLite (usado en los benchmarks) reporta la contención como "database is locked".
+    return "database is locked" in str(error)
+
+
+def sentencia_descuento(producto_id: int, cantidad: int):
+    """
+    UPDATE condicional: solo descuenta si queda stock suficiente.
+    El `rowcount` resultante (0 o 1) indica si la reserva se aplicó.
+    """
+    return (
+        update(models.Producto)
+        .where(models.Producto.id == producto_id, models.Producto.stock >= cantidad)
+        .values(stock=models.Producto.stock - cantidad)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def sentencia_reposicion(producto_id: int, cantidad: int):
+    """UPDATE que devuelve al stock una cantidad previamente reservada."""
+    return (
+        update(models.Producto)
+        .where(models.Producto.id == producto_id)
+        .values(stock=models.Producto.stock + cantidad)
+        .execution_options(synchronize_session=False)
+    )
+
+
+@dataclass
+class _Pedido:
+    cantidad: int
+    futuro: asyncio.Future
+
+
+@dataclass
+class _Cola:
+    pedidos: list[_Pedido] = field(default_factory=list)
+    tarea: asyncio.Task | None = None
+
+
+class ReservadorStock:
+    """
+    Aplica los descuentos de stock de forma atómica con un UPDATE condicional.
+
+    Las reservas concurrentes sobre un mismo producto se encolan y se aplican en
+    lotes: primero se intenta descontar el total del lote en una sola sentencia y,
+    si no alcanza el stock, se aplican una por una (en orden de llegada) dentro
+    de la misma transacción. Sin concurrencia cada lote tiene un único pedido.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_lote: int = 100,
+        ventana: float = 0.0,
+        reintentos: int = 3,
+        espera_reintento: float = 0.01,
+    ):
+        self.session_factory = session_factory
+        self.max_lote = max_lote          # Máximo de reservas que se agrupan en un lote.
+        self.ventana = ventana            # Segundos que se espera para juntar más pedidos.
+        self.reintentos = reintentos      # Reintentos ante deadlocks / lock wait timeout.
+        self.espera_reintento = espera_reintento
+        self._colas: dict[int, _Cola] = {}
+
+    async def reservar(self, producto_id: int, cantidad: int) -> None:
+        """Descuenta `cantidad` del stock. Lanza StockInsuficiente o ContencionStock."""
+        if cantidad <= 0:
+            raise ValueError("La cantidad a reservar debe ser mayor a cero")
+
+        futuro = asyncio.get_running_loop().create_future()
+        cola = self._colas.setdefault(producto_id, _Cola())
+        cola.pedidos.append(_Pedido(cantidad, futuro))
+        if cola.tarea is None or cola.tarea.done():
+            cola.tarea = asyncio.create_task(self._procesar(producto_id, cola))
+        await futuro
+
+    async def liberar(self, producto_id: int, cantidad: int) -> None:
+        """Devuelve al stock una reserva que no llegó a usarse (compensación)."""
+        async with self.session_factory() as session:
+            await session.execute(sentencia_reposicion(producto_id, cantidad))
+            await session.commit()
+
+    async def _procesar(self, producto_id: int, cola: _Cola) -> None:
+        # Procesa lotes mientras sigan llegando pedidos para este producto.
+        while cola.pedidos:
+            if self.ventana:
+                await asyncio.sleep(self.ventana)
+            lote = cola.pedidos[:self.max_lote]
+            del cola.pedidos[:self.max_lote]
+            try:
+                resultados = await self._aplicar_con_reintentos(producto_id, lote)
+            except Exception as e:
+                for pedido in lote:
+                    if not pedido.futuro.done():
+                        pedido.futuro.set_exception(e)
+                continue
+            for pedido, aplicado in zip(lote, resultados):
+                if pedido.futuro.done():
+                    continue
+                if aplicado:
+                    pedido.futuro.set_result(None)
+                else:
+                    pedido.futuro.set_exception(StockInsuficiente(producto_id, pedido.cantidad))
+        if self._colas.get(producto_id) is cola:
+            del self._colas[producto_id]
+
+    async def _aplicar_con_reintentos(self, producto_id: int, lote: list[_Pedido]) -> list[bool]:
+        for intento in range(self.reintentos + 1):
+            try:
+                return await self._aplicar_lote(producto_id, lote)
+            except OperationalError as e:
+                if not es_error_de_contencion(e):
+                    raise
+                if intento == self.reintentos:
+                    raise ContencionStock(f"Contención sobre el producto {producto_id}") from e
+                # Backoff exponencial antes de volver a intentar.
+                await asyncio.sleep(self.espera_reintento * (2 ** intento))
+        raise ContencionStock(f"Contención sobre el producto {producto_id}")
+
+    async def _aplicar_lote(self, producto_id: int, lote: list[_Pedido]) -> list[bool]:
+        async with self.session_factory() as session:
+            try:
+                # 1. Intenta descontar el total del lote en una sola sentencia.
+                total = sum(p.cantidad for p in lote)
+                result = await session.execute(sentencia_descuento(producto_id, total))
+                if result.rowcount == 1:
+                    resultados = [True] * len(lote)
+                else:
+                    # 2. No alcanza para todos: aplica cada pedido por separado, en orden.
+                    resultados = []
+                    for pedido in lote:
+                        result = await session.execute(sentencia_descuento(producto_id, pedido.cantidad))
+                        resultados.append(result.rowcount == 1)
+                await session.commit()
+                return resultados
+            except Exception:
+                await session.rollback()
+                raise
+
+
+# Instancia compartida por los routers.
+reservador = ReservadorStock()
@@ -0,0 +1,447 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import aclosing
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel
+
+from . import agregados, borrado, schemas
+from .auth import UsuarioActual
+from .compartido import INSTANCIA, preparar_carpeta
+from .db import AsyncSessionLectura, AsyncSessionLocal
+from .exportar import (
+    generar, TIPOS_CONTENIDO, consulta_facturas, consulta_detalle, COLUMNAS_FACTURAS, COLUMNAS_DETALLE
+)
+from .serializacion import filas_a_json
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# TRABAJOS_WORKERS: trabajos que corren a la vez (y conexiones de lectura que pueden ocupar).
+# TRABAJOS_TIMEOUT: segundos máximos por trabajo; al vencer se cancela y queda "vencido".
+# TRABAJOS_DIR: carpeta local con los resultados y la base SQLite de trabajos; por
+#   defecto una por usuario, base de datos y puerto (como COMPARTIDO_DIR, pero en disco).
+# TRABAJOS_RETENCION: segundos que se conservan los trabajos terminados y sus resultados.
+# TRABAJOS_PURGAR_CADA: segundos entre dos purgas de los trabajos vencidos de retención.
+# TRABAJOS_CANCELACION_CADA: segundos entre dos revisiones de si se pidió cancelar un
+#   trabajo en curso desde otro worker.
+TRABAJOS_WORKERS = int(os.getenv("TRABAJOS_WORKERS", "2"))
+TRABAJOS_TIMEOUT = float(os.getenv("TRABAJOS_TIMEOUT", "600"))
+TRABAJOS_DIR = os.getenv("TRABAJOS_DIR") or os.path.join(tempfile.gettempdir(), f"tp_final_trabajos-{INSTANCIA}")
+TRABAJOS_RETENCION = float(os.getenv("TRABAJOS_RETENCION", str(24 * 3600)))
+TRABAJOS_PURGAR_CADA = float(os.getenv("TRABAJOS_PURGAR_CADA", "600"))
+TRABAJOS_CANCELACION_CADA = float(os.getenv("TRABAJOS_CANCELACION_CADA", "1"))
+
+ESTADOS_FINALES = ("terminado", "fallido", "cancelado", "vencido")
+
+
+def _ahora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class AlmacenTrabajos:
+    """
+    Tabla `trabajos` en un SQLite local (no en MySQL): el estado de la cola no
+    ocupa conexiones del pool de la aplicación y sobrevive a un reinicio.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._conexion: sqlite3.Connection | None = None
+        self._lock = Lock()
+
+    def abrir(self) -> None:
+        self._conexion = sqlite3.connect(self.ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.row_factory = sqlite3.Row
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                parametros TEXT NOT NULL,
+                prioridad INTEGER NOT NULL,
+                estado TEXT NOT NULL,
+                usuario_id INTEGER NOT NULL,
+                usuario TEXT NOT NULL,
+                rol TEXT NOT NULL,
+                creado TEXT NOT NULL,
+                iniciado TEXT,
+                terminado TEXT,
+                error TEXT,
+                media_type TEXT,
+                extension TEXT,
+                progreso TEXT,
+                cancelacion TEXT
+            )
+        """)
+        columnas = {fila[1] for fila in self._conexion.execute("PRAGMA table_info(trabajos)")}
+        if "progreso" not in columnas:
+            # Base creada antes de que existiera el avance de los trabajos.
+            self._conexion.execute("ALTER TABLE trabajos ADD COLUMN progreso TEXT")
+        if "cancelacion" not in columnas:
+            # Base creada antes de que se pudiera cancelar un trabajo desde otro worker.
+            self._conexion.execute("ALTER TABLE trabajos ADD COLUMN cancelacion TEXT")
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS ix_trabajos_estado ON trabajos (estado, prioridad, creado)")
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS ix_trabajos_usuario ON trabajos (usuario_id, creado)")
+
+    def cerrar(self) -> None:
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+    def _ejecutar(self, sql: str, parametros=()) -> tuple[list[dict], int]:
+        with self._lock:
+            cursor = self._conexion.execute(sql, parametros)
+            return [dict(fila) for fila in cursor.fetchall()], cursor.rowcount
+
+    async def ejecutar(self, sql: str, parametros=()) -> list[dict]:
+        # sqlite3 es bloqueante: se ejecuta en un hilo para no frenar el event loop.
+        filas, _ = await asyncio.to_thread(self._ejecutar, sql, parametros)
+        return filas
+
+    async def crear(self, trabajo: dict) -> None:
+        columnas = ", ".join(trabajo)
+        marcas = ", ".join("?" for _ in trabajo)
+        await self.ejecutar(f"INSERT INTO trabajos ({columnas}) VALUES ({marcas})", tuple(trabajo.values()))
+
+    async def actualizar(self, trabajo_id: str, solo_si: str | None = None, **campos) -> bool:
+        """Actualiza los campos; con `solo_si` solo si el trabajo sigue en ese estado."""
+        asignaciones = ", ".join(f"{c} = ?" for c in campos)
+        sql = f"UPDATE trabajos SET {asignaciones} WHERE id = ?"
+        parametros = (*campos.values(), trabajo_id)
+        if solo_si:
+            sql += " AND estado = ?"
+            parametros += (solo_si,)
+        _, modificadas = await asyncio.to_thread(self._ejecutar, sql, parametros)
+        return modificadas > 0
+
+    async def obtener(self, trabajo_id: str) -> dict | None:
+        filas = await self.ejecutar("SELECT * FROM trabajos WHERE id = ?", (trabajo_id,))
+        return filas[0] if filas else None
+
+    async def listar(self, usuario_id: int | None, limite: int) -> list[dict]:
+        if usuario_id is None:
+            return await self.ejecutar("SELECT * FROM trabajos ORDER BY creado DESC LIMIT ?", (limite,))
+        return await self.ejecutar(
+            "SELECT * FROM trabajos WHERE usuario_id = ? ORDER BY creado DESC LIMIT ?", (usuario_id, limite)
+        )
+
+
+@dataclass
+class TipoTrabajo:
+    # Recibe los parámetros validados, el usuario que lo pidió y la ruta donde
+    # escribir el resultado. Devuelve (media_type, extensión) del archivo.
+    funcion: Callable[[BaseModel, UsuarioActual, str], Awaitable[tuple[str, str]]]
+    parametros: type[BaseModel]
+
+
+TIPOS: dict[str, TipoTrabajo] = {}
+
+# ID del trabajo que se está ejecutando (cada trabajo corre en su propia tarea).
+_trabajo_actual: ContextVar[str | None] = ContextVar("trabajo_actual", default=None)
+
+
+def tipo_trabajo(nombre: str, parametros: type[BaseModel]):
+    """Registra una función como tipo de trabajo que se puede encolar."""
+    def registrar(funcion):
+        TIPOS[nombre] = TipoTrabajo(funcion, parametros)
+        return funcion
+    return registrar
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos en segundo plano dentro del mismo proceso.
+
+    - `workers` tareas toman trabajos de una cola de prioridad (0 primero, y
+      dentro de la misma prioridad, por orden de llegada).
+    - Cada trabajo tiene un tiempo máximo (`timeout`) y se puede cancelar.
+    - El resultado se escribe en un archivo en `carpeta`; el estado, en una
+      tabla SQLite local. Al iniciar se vuelven a encolar los trabajos que
+      estaban pendientes o a medio correr cuando se detuvo la aplicación.
+    - Con varios workers web cada uno tiene su cola sobre la misma tabla: un
+      trabajo lo ejecuta el que primero lo pasa de pendiente a en curso. Para
+      cancelar uno que corre en otro worker se marca `cancelacion` en la tabla,
+      y el worker que lo ejecuta lo revisa cada TRABAJOS_CANCELACION_CADA segundos.
+    """
+
+    def __init__(self, carpeta: str, workers: int, timeout: float, retencion: float):
+        self.carpeta = carpeta
+        self.workers = workers
+        self.timeout = timeout
+        self.retencion = retencion
+        self.almacen = AlmacenTrabajos(os.path.join(carpeta, "trabajos.db"))
+        self._cola: asyncio.PriorityQueue | None = None
+        self._secuencia = itertools.count()
+        self._tareas: list[asyncio.Task] = []
+        self._en_curso: dict[str, asyncio.Task] = {}
+        self._cancelados: set[str] = set()
+        self._purga = False  # solo en el worker web que recupera (ver `iniciar`)
+        self._proxima_purga = 0.0
+        self.completados = 0
+        self.fallidos = 0
+
+    def ruta_resultado(self, trabajo: dict) -> str:
+        return os.path.join(self.carpeta, f"{trabajo['id']}.{trabajo['extension']}")
+
+    async def iniciar(self, recuperar: bool = True) -> None:
+        """
+        Con `recuperar` (un solo worker de la máquina), además se retoman los
+        trabajos que quedaron a medio correr y se purgan los viejos, al iniciar
+        y cada TRABAJOS_PURGAR_CADA segundos.
+        """
+        # Solo del usuario que corre la app: los resultados tienen datos de facturas.
+        preparar_carpeta(self.carpeta)
+        await asyncio.to_thread(self.almacen.abrir)
+        self._cola = asyncio.PriorityQueue()
+
+        # 1. Lo que quedó corriendo en el reinicio anterior vuelve a empezar.
+        self._purga = recuperar
+        if recuperar:
+            await self._purgar()
+            self._proxima_purga = time.monotonic() + TRABAJOS_PURGAR_CADA
+            # Salvo los que se pidió cancelar antes de que se detuviera.
+            await self.almacen.ejecutar(
+                "UPDATE trabajos SET estado = 'cancelado', terminado = ? "
+                "WHERE estado = 'en_curso' AND cancelacion IS NOT NULL", (_ahora(),)
+            )
+            await self.almacen.ejecutar(
+                "UPDATE trabajos SET estado = 'pendiente', iniciado = NULL WHERE estado = 'en_curso'"
+            )
+        # 2. Se encolan los pendientes en su orden original.
+        for trabajo in await self.almacen.ejecutar(
+            "SELECT id, prioridad FROM trabajos WHERE estado = 'pendiente' ORDER BY prioridad, creado"
+        ):
+            self._encolar(trabajo["id"], trabajo["prioridad"])
+
+        self._tareas = [asyncio.create_task(self._trabajador()) for _ in range(self.workers)]
+
+    async def detener(self) -> None:
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        await asyncio.to_thread(self.almacen.cerrar)
+
+    def _encolar(self, trabajo_id: str, prioridad: int) -> None:
+        self._cola.put_nowait((prioridad, next(self._secuencia), trabajo_id))
+
+    async def enviar(self, tipo: str, parametros: BaseModel, prioridad: int, usuario: UsuarioActual) -> dict:
+        trabajo = {
+            "id": uuid.uuid4().hex,
+            "tipo": tipo,
+            "parametros": parametros.model_dump_json(),
+            "prioridad": prioridad,
+            "estado": "pendiente",
+            "usuario_id": usuario.id,
+            "usuario": usuario.username,
+            "rol": usuario.rol,
+            "creado": _ahora(),
+        }
+        await self.almacen.crear(trabajo)
+        self._encolar(trabajo["id"], prioridad)
+        return trabajo
+
+    async def obtener(self, trabajo_id: str) -> dict | None:
+        return await self.almacen.obtener(trabajo_id)
+
+    async def listar(self, usuario_id: int | None, limite: int = 100) -> list[dict]:
+        return await self.almacen.listar(usuario_id, limite)
+
+    async def cancelar(self, trabajo_id: str) -> bool:
+        """
+        Cancela un trabajo pendiente o en curso (en este worker o en otro).
+        Devuelve False si ya había terminado.
+        """
+        # Pendiente: se marca y el worker lo saltea cuando lo saque de la cola.
+        if await self.almacen.actualizar(trabajo_id, solo_si="pendiente", estado="cancelado", terminado=_ahora()):
+            return True
+        tarea = self._en_curso.get(trabajo_id)
+        if tarea is not None:
+            self._cancelados.add(trabajo_id)
+            tarea.cancel()
+            return True
+        # En curso en otro worker: se pide en la tabla y ese worker lo cancela al revisarla.
+        return await self.almacen.actualizar(trabajo_id, solo_si="en_curso", cancelacion=_ahora())
+
+    async def _vigilar_cancelacion(self, trabajo_id: str, tarea: asyncio.Task) -> None:
+        """Cancela `tarea` si otro worker pidió cancelar el trabajo."""
+        while not tarea.done():
+            await asyncio.sleep(TRABAJOS_CANCELACION_CADA)
+            try:
+                trabajo = await self.almacen.obtener(trabajo_id)
+            except sqlite3.Error:
+                logger.exception("Error al revisar la cancelación de %s", trabajo_id)
+                continue
+            if trabajo is not None and trabajo["cancelacion"]:
+                self._cancelados.add(trabajo_id)
+                tarea.cancel()
+                return
+
+    async def _trabajador(self) -> None:
+        while True:
+            if self._purga and time.monotonic() >= self._proxima_purga:
+                self._proxima_purga = time.monotonic() + TRABAJOS_PURGAR_CADA
+                try:
+                    await self._purgar()
+                except (sqlite3.Error, OSError):
+                    logger.exception("Error al purgar los trabajos viejos")
+            # Sin trabajos, se despierta igual para la próxima purga.
+            try:
+                _, _, trabajo_id = await asyncio.wait_for(self._cola.get(), TRABAJOS_PURGAR_CADA)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                trabajo = await self.almacen.obtener(trabajo_id)
+                if trabajo is None or trabajo["estado"] != "pendiente":
+                    continue
+                await self._ejecutar(trabajo)
+            except (sqlite3.Error, OSError):
+                # Un error del almacén no debe dejar la cola sin workers.
+                logger.exception("Error de la cola de trabajos con %s", trabajo_id)
+
+    async def _ejecutar(self, trabajo: dict) -> None:
+        trabajo_id = trabajo["id"]
+        tipo = TIPOS.get(trabajo["tipo"])
+        if tipo is None:
+            await self.almacen.actualizar(trabajo_id, estado="fallido", terminado=_ahora(),
+                                          error=f"Tipo de trabajo desconocido: {trabajo['tipo']}")
+            return
+        parametros = tipo.parametros.model_validate_json(trabajo["parametros"])
+        usuario = UsuarioActual(id=trabajo["usuario_id"], username=trabajo["usuario"], rol=trabajo["rol"])
+        # Se escribe en un archivo temporal y se renombra al terminar: nunca se sirve un resultado a medias.
+        parcial = os.path.join(self.carpeta, f"{trabajo_id}.parcial")
+
+        # Solo si sigue pendiente: otro worker pudo tomarlo (o cancelarlo) antes.
+        if not await self.almacen.actualizar(trabajo_id, solo_si="pendiente", estado="en_curso", iniciado=_ahora()):
+            return
+        # La tarea copia el contexto al crearse: `informar_progreso` sabe a qué trabajo escribir.
+        token = _trabajo_actual.set(trabajo_id)
+        tarea = asyncio.create_task(tipo.funcion(parametros, usuario, parcial))
+        _trabajo_actual.reset(token)
+        self._en_curso[trabajo_id] = tarea
+        vigia = asyncio.create_task(self._vigilar_cancelacion(trabajo_id, tarea))
+        try:
+            media_type, extension = await asyncio.wait_for(tarea, self.timeout)
+            os.replace(parcial, os.path.join(self.carpeta, f"{trabajo_id}.{extension}"))
+            await self.almacen.actualizar(trabajo_id, estado="terminado", terminado=_ahora(),
+                                          media_type=media_type, extension=extension)
+            self.completados += 1
+        except asyncio.TimeoutError:
+            await self.almacen.actualizar(trabajo_id, estado="vencido", terminado=_ahora(),
+                                          error=f"Superó el tiempo máximo de {self.timeout:g} s")
+            self.fallidos += 1
+        except asyncio.CancelledError:
+            if trabajo_id not in self._cancelados:
+                # Se está deteniendo la aplicación: queda pendiente para el próximo inicio.
+                await asyncio.shield(self.almacen.actualizar(trabajo_id, estado="pendiente", iniciado=None))
+                raise
+            await self.almacen.actualizar(trabajo_id, estado="cancelado", terminado=_ahora())
+        except Exception as e:
+            logger.exception("Falló el trabajo %s (%s)", trabajo_id, trabajo["tipo"])
+            await self.almacen.actualizar(trabajo_id, estado="fallido", terminado=_ahora(), error=str(e)[:1000])
+            self.fallidos += 1
+        finally:
+            vigia.cancel()
+            self._en_curso.pop(trabajo_id, None)
+            self._cancelados.discard(trabajo_id)
+            if os.path.exists(parcial):
+                os.remove(parcial)
+
+    async def _purgar(self) -> None:
+        """Borra los trabajos terminados hace más de `retencion` segundos y sus archivos."""
+        limite = (datetime.now() - timedelta(seconds=self.retencion)).isoformat(timespec="seconds")
+        marcas = ", ".join("?" for _ in ESTADOS_FINALES)
+        viejos = await self.almacen.ejecutar(
+            f"SELECT id, extension FROM trabajos WHERE estado IN ({marcas}) AND terminado < ?",
+            (*ESTADOS_FINALES, limite)
+        )
+        for trabajo in viejos:
+            if trabajo["extension"] and os.path.exists(self.ruta_resultado(trabajo)):
+                os.remove(self.ruta_resultado(trabajo))
+            await self.almacen.ejecutar("DELETE FROM trabajos WHERE id = ?", (trabajo["id"],))
+
+    def metricas(self) -> dict:
+        return {
+            "workers": self.workers,
+            "en_cola": self._cola.qsize() if self._cola else 0,
+            "en_curso": len(self._en_curso),
+            "completados": self.completados,
+            "fallidos": self.fallidos,
+        }
+
+
+cola = ColaTrabajos(TRABAJOS_DIR, TRABAJOS_WORKERS, TRABAJOS_TIMEOUT, TRABAJOS_RETENCION)
+
+
+async def informar_progreso(progreso: dict) -> None:
+    """Guarda el avance del trabajo en curso (se ve en GET /trabajos/{id})."""
+    trabajo_id = _trabajo_actual.get()
+    if trabajo_id is not None:
+        await cola.almacen.actualizar(trabajo_id, progreso=json.dumps(progreso))
+
+
+# --- Tipos de trabajo ---
+# Los reportes y exportaciones leen con AsyncSessionLectura (la réplica si está
+# configurada; si no, es el mismo pool que AsyncSessionLocal); los borrados masivos
+# escriben con AsyncSessionLocal. Como mucho ocupan TRABAJOS_WORKERS conexiones.
+
+@tipo_trabajo("reporte_ventas_cliente", schemas.ParametrosReporteVentas)
+async def reporte_ventas_cliente(parametros, usuario: UsuarioActual, destino: str):
+    async with AsyncSessionLectura() as db:
+        result = await db.execute(
+            agregados.consulta_ventas_por_cliente(parametros.desde, parametros.hasta, parametros.top)
+        )
+        cuerpo = filas_a_json(result.mappings().all())
+    with open(destino, "wb") as archivo:
+        await asyncio.to_thread(archivo.write, cuerpo)
+    return "application/json", "json"
+
+
+async def _exportar(stmt, columnas: list[str], formato: str, destino: str):
+    with open(destino, "w", encoding="utf-8", newline="") as archivo:
+        # aclosing: si el trabajo se cancela, el generador cierra su sesión enseguida.
+        async with aclosing(generar(formato, AsyncSessionLectura, stmt, columnas)) as trozos:
+            async for trozo in trozos:
+                await asyncio.to_thread(archivo.write, trozo)
+    return TIPOS_CONTENIDO[formato], formato
+
+
+@tipo_trabajo("exportar_facturas", schemas.ParametrosExportacion)
+async def exportar_facturas(parametros, usuario: UsuarioActual, destino: str):
+    stmt = consulta_facturas(usuario, parametros.desde, parametros.hasta, parametros.creador_id)
+    return await _exportar(stmt, COLUMNAS_FACTURAS, parametros.formato, destino)
+
+
+@tipo_trabajo("exportar_detalle", schemas.ParametrosExportacion)
+async def exportar_detalle(parametros, usuario: UsuarioActual, destino: str):
+    stmt = consulta_detalle(usuario, parametros.desde, parametros.hasta, parametros.creador_id)
+    return await _exportar(stmt, COLUMNAS_DETALLE, parametros.formato, destino)
+
+
+async def _borrar(funcion, parametros, destino: str):
+    progreso = await funcion(AsyncSessionLocal, parametros.ids, informar_progreso)
+    with open(destino, "wb") as archivo:
+        await asyncio.to_thread(archivo.write, json.dumps(progreso.como_dict()).encode())
+    return "application/json", "json"
+
+
+@tipo_trabajo("borrar_productos", schemas.ParametrosBorrado)
+async def borrar_productos(parametros, usuario: UsuarioActual, destino: str):
+    return await _borrar(borrado.borrar_productos, parametros, destino)
+
+
+@tipo_trabajo("borrar_clientes", schemas.ParametrosBorrado)
+async def borrar_clientes(parametros, usuario: UsuarioActual, destino: str):
+    return await _borrar(borrado.borrar_clientes, parametros, destino)
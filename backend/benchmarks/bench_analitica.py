@@ -0,0 +1,135 @@
+# Benchmark de la analítica de ventas (app/analitica.py).
+#
+# 1. Agregación: arma en memoria `--detalles` ítems sintéticos (sin base) y mide
+#    cada combinación de dimensión y período, sin caché.
+# 2. Base: siembra una SQLite con `--facturas` facturas y mide la carga completa
+#    (filas/s), un refresco incremental con facturas nuevas y la misma consulta
+#    hecha con GROUP BY en SQL contra la copia columnar.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_analitica --detalles 10000000 --facturas 200000
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import select, insert, func
+
+from app import analitica, models
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+d, f = models.Detalle, models.Factura
+
+
+def sinteticas(filas: int, productos: int, clientes: int, dias: int, semilla: int) -> tuple[dict, np.ndarray]:
+    rnd = np.random.default_rng(semilla)
+    columnas = {
+        "factura_id": np.arange(filas, dtype="int64") // 5 + 1,
+        "dia": (19723 + np.sort(rnd.integers(0, dias, filas))).astype("int32"),
+        "cliente": rnd.integers(1, clientes + 1, filas, dtype="int32"),
+        "creador": rnd.integers(1, 11, filas, dtype="int32"),
+        "producto": rnd.integers(1, productos + 1, filas, dtype="int32"),
+        "cantidad": rnd.integers(1, 6, filas, dtype="int32"),
+        "importe": rnd.integers(5000, 45000, filas, dtype="int64"),
+    }
+    costos = rnd.integers(100, 5000, productos + 1).astype("float64")
+    return columnas, costos
+
+
+def medir_agregacion(args) -> None:
+    inicio = time.perf_counter()
+    columnas, costos = sinteticas(args.detalles, args.productos, args.clientes, args.dias, args.semilla)
+    memoria = sum(a.nbytes for a in columnas.values()) / 2**20
+    print(json.dumps({"detalles": args.detalles, "generacion_s": round(time.perf_counter() - inicio, 2),
+                      "memoria_mb": round(memoria, 1)}))
+    for por in analitica.DIMENSIONES:
+        for periodo in analitica.PERIODOS:
+            tiempos, grupos = [], 0
+            for _ in range(args.repeticiones):
+                t = time.perf_counter()
+                grupos = len(analitica.agrupar(columnas, costos, por, periodo, top=args.top))
+                tiempos.append((time.perf_counter() - t) * 1000)
+            print(json.dumps({"por": por, "periodo": periodo, "grupos": grupos,
+                              "p50_ms": round(statistics.median(tiempos), 1)}))
+
+
+async def cronometrar(corrutina) -> tuple[float, object]:
+    inicio = time.perf_counter()
+    resultado = await corrutina
+    return round((time.perf_counter() - inicio) * 1000, 1), resultado
+
+
+async def medir_base(args) -> None:
+    ruta = ruta_temporal()
+    engine, session_factory = await crear_base(ruta)
+    try:
+        await sembrar(engine, clientes=args.clientes, productos=args.productos, facturas=args.facturas,
+                      items_por_factura=5)
+        ventas = analitica.VentasColumnares()
+
+        # 1. Carga completa desde la base.
+        ms, _ = await cronometrar(ventas.cargar(session_factory))
+        filas = ventas.metricas()["filas"]
+        print(json.dumps({"carga_completa_ms": ms, "filas": filas,
+                          "filas_por_segundo": round(filas / ms * 1000), **ventas.metricas()}))
+
+        # 2. Refresco incremental con facturas nuevas.
+        async with engine.begin() as conn:
+            fecha = datetime(2024, 1, 1) + timedelta(minutes=(args.facturas + 1) * 7)
+            nuevas = range(args.facturas + 1, args.facturas + args.nuevas + 1)
+            await conn.execute(insert(f), [{"id": i, "cliente_id": 1, "fecha": fecha, "creado_por_usuario_id": 1}
+                                           for i in nuevas])
+            await conn.execute(insert(d), [{"factura_id": i, "producto_id": 1, "cantidad": 1,
+                                            "precio": Decimal("10.00"), "created": fecha} for i in nuevas])
+        ms, _ = await cronometrar(ventas.refrescar(session_factory))
+        print(json.dumps({"refresco_incremental_ms": ms, "facturas_nuevas": args.nuevas,
+                          "filas": ventas.metricas()["filas"]}))
+
+        # 3. La misma consulta con GROUP BY en SQL y en memoria.
+        dia = func.date(f.fecha)
+        consultas = {
+            ("producto", "total"): select(d.producto_id, func.sum(d.cantidad), func.count(),
+                                          func.sum(d.cantidad * d.precio)).join(f).group_by(d.producto_id),
+            ("total", "dia"): select(dia, func.sum(d.cantidad), func.count(),
+                                     func.sum(d.cantidad * d.precio)).join(f).group_by(dia),
+            ("cliente", "total"): select(f.cliente_id, func.sum(d.cantidad), func.count(),
+                                         func.sum(d.cantidad * d.precio)).join(f).group_by(f.cliente_id),
+        }
+        for (por, periodo), stmt in consultas.items():
+            async with session_factory() as db:
+                sql_ms, _ = await cronometrar(db.execute(stmt))
+            inicio = time.perf_counter()
+            analitica.agrupar(ventas._columnas, ventas._costos, por, periodo)
+            memoria_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            print(json.dumps({"por": por, "periodo": periodo, "sql_ms": sql_ms, "columnar_ms": memoria_ms,
+                              "aceleracion": round(sql_ms / memoria_ms, 1) if memoria_ms else None}))
+    finally:
+        await engine.dispose()
+        os.remove(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la analítica de ventas vectorizada")
+    parser.add_argument("--detalles", type=int, default=10_000_000, help="Ítems sintéticos para la agregación")
+    parser.add_argument("--facturas", type=int, default=200_000, help="Facturas sembradas (5 ítems c/u); 0 = sin base")
+    parser.add_argument("--nuevas", type=int, default=1000, help="Facturas nuevas para el refresco incremental")
+    parser.add_argument("--productos", type=int, default=5000)
+    parser.add_argument("--clientes", type=int, default=20_000)
+    parser.add_argument("--dias", type=int, default=730)
+    parser.add_argument("--top", type=int, default=None)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    medir_agregacion(args)
+    if args.facturas:
+        asyncio.run(medir_base(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Benchmark del arranque de la aplicación (app/ciclo_vida.py).
+#
+# Siembra una base SQLite y levanta la app en procesos nuevos (la configuración se
+# lee al importar), una vez sin calentamiento (ARRANQUE_CALENTAR=0) y otra con él.
+# En cada caso mide el tiempo de importación, el del arranque del lifespan y la
+# latencia de la PRIMERA petición a cada ruta contra la mediana de las siguientes:
+# es el pico que ven los usuarios en un reinicio escalonado.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_arranque --facturas 20000
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+USUARIO = "usuario1"
+PASSWORD = "bench123"
+RUTAS = ["/productos/", "/clientes/", "/facturas/", "/facturas/1/completa", "/productos/buscar?q=prod"]
+
+
+async def medir_proceso(repeticiones: int) -> dict:
+    """Corre dentro del proceso hijo: importa la app, la arranca y mide las peticiones."""
+    inicio = time.perf_counter()
+    import httpx
+    from app.main import app
+    from app import ciclo_vida
+    importacion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        arranque = time.perf_counter() - inicio
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            token = (await cliente.post("/token", data={"username": USUARIO, "password": PASSWORD})).json()
+            auth = {"Authorization": f"Bearer {token['access_token']}"}
+            rutas = {}
+            for ruta in RUTAS:
+                tiempos = []
+                for _ in range(repeticiones + 1):
+                    t = time.perf_counter()
+                    respuesta = await cliente.get(ruta, headers=auth)
+                    tiempos.append((time.perf_counter() - t) * 1000)
+                    respuesta.raise_for_status()
+                rutas[ruta] = {
+                    "primera_ms": round(tiempos[0], 2),
+                    "mediana_ms": round(statistics.median(tiempos[1:]), 2),
+                }
+        pasos = dict(ciclo_vida.estado.pasos_ms)
+    return {
+        "importacion_ms": round(importacion * 1000, 1),
+        "arranque_ms": round(arranque * 1000, 1),
+        "pasos_ms": pasos,
+        "rutas": rutas,
+    }
+
+
+def correr_hijo(ruta: str, calentar: bool, repeticiones: int) -> dict:
+    entorno = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{ruta}?timeout=30",
+        "AGREGADOS_RECONCILIAR_CADA": "0",
+        "ARRANQUE_CALENTAR": "1" if calentar else "0",
+    }
+    salida = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_arranque", "--hijo", "--repeticiones", str(repeticiones)],
+        env=entorno, capture_output=True, text=True, check=True
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+async def preparar(args, ruta: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{ruta}?timeout=30"
+    from app import agregados
+    from app.auth import get_password_hash
+
+    engine, session_factory = await crear_base(ruta)
+    await sembrar(engine, clientes=args.clientes, productos=args.productos, facturas=args.facturas,
+                  items_por_factura=5, hashed_password=get_password_hash(PASSWORD))
+    await agregados.reconciliar(session_factory)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del arranque y el calentamiento")
+    parser.add_argument("--clientes", type=int, default=2000)
+    parser.add_argument("--productos", type=int, default=2000)
+    parser.add_argument("--facturas", type=int, default=20_000)
+    parser.add_argument("--repeticiones", type=int, default=20, help="Peticiones por ruta después de la primera")
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        print(json.dumps(asyncio.run(medir_proceso(args.repeticiones))))
+        return
+
+    ruta = ruta_temporal()
+    try:
+        asyncio.run(preparar(args, ruta))
+        for calentar in (False, True):
+            resultado = correr_hijo(ruta, calentar, args.repeticiones)
+            print(json.dumps({"calentamiento": calentar, **resultado}))
+    finally:
+        os.remove(ruta)
+
+
+if __name__ == "__main__":
+    main()
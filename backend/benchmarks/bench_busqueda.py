@@ -0,0 +1,99 @@
+# Benchmark del índice de autocompletado (app/busqueda.py).
+#
+# Arma un índice de `--productos` productos sintéticos (sin base de datos) y mide
+# el tiempo de construcción y las latencias p50/p99 de búsquedas por prefijo,
+# de varias palabras y con errores de tipeo, además de altas y bajas incrementales.
+# Antes verifica el orden de los ejemplos de TIPEO_ESPERADO (exit 1 si falla).
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_busqueda --productos 100000
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from app.busqueda import IndiceBusqueda
+
+MARCAS = ["Arcor", "Bagley", "Quilmes", "Serenísima", "Molinos", "Ledesma", "Knorr", "Terrabusi", "Cachafaz"]
+TIPOS = ["galletitas", "yerba", "azúcar", "leche", "cafetera", "harina", "aceite", "fideos", "mermelada",
+         "gaseosa", "cerveza", "detergente", "jabón", "arroz", "alfajor", "té", "queso", "manteca"]
+VARIANTES = ["clásica", "light", "integral", "sin tacc", "familiar", "x500g", "x1kg", "dulce", "suave", "premium"]
+
+BUSQUEDAS = {
+    "prefijo": ["caf", "yer", "gal", "ali", "que", "mer"],
+    "varias_palabras": ["yerba suave", "leche light", "galletitas arcor", "alfajor cachafaz premium"],
+    "error_tipeo": ["cafetrea", "mermleada", "detergnte", "galetitas"],
+    "sin_resultados": ["zzzz", "qwerty"],
+}
+
+# Búsqueda con error de tipeo -> (productos del índice, nombre que tiene que salir primero).
+TIPEO_ESPERADO = {
+    "cafetrea": (["Café molido", "Cafetera italiana"], "Cafetera italiana"),
+    "mermleada": (["Manteca", "Mermelada de durazno"], "Mermelada de durazno"),
+}
+
+
+def verificar_tipeo() -> bool:
+    correcto = True
+    for busqueda, (nombres, esperado) in TIPEO_ESPERADO.items():
+        indice = IndiceBusqueda("productos", campos={"nombre": 2}, salida=("id", "nombre"))
+        indice.reconstruir([{"id": i, "nombre": nombre} for i, nombre in enumerate(nombres, 1)])
+        resultado = [fila["nombre"] for fila in indice.buscar(busqueda, 10)]
+        ok = bool(resultado) and resultado[0] == esperado
+        correcto &= ok
+        print(json.dumps({"verificacion": busqueda, "resultado": resultado, "ok": ok}, ensure_ascii=False))
+    return correcto
+
+
+def producto(rnd: random.Random, i: int) -> dict:
+    nombre = f"{rnd.choice(TIPOS)} {rnd.choice(MARCAS)} {rnd.choice(VARIANTES)} {i}"
+    return {"id": i, "nombre": nombre, "descripcion": f"{rnd.choice(TIPOS)} {rnd.choice(VARIANTES)}",
+            "precio_venta": rnd.randint(100, 9000)}
+
+
+def latencias(funcion, argumentos: list, repeticiones: int) -> dict:
+    tiempos = []
+    for _ in range(repeticiones):
+        for argumento in argumentos:
+            inicio = time.perf_counter()
+            funcion(argumento)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "operaciones": len(tiempos),
+        "p50_ms": round(statistics.median(tiempos), 4),
+        "p99_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.99))], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del índice de búsqueda")
+    parser.add_argument("--productos", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    if not verificar_tipeo():
+        sys.exit(1)
+
+    rnd = random.Random(args.semilla)
+    filas = [producto(rnd, i) for i in range(1, args.productos + 1)]
+    indice = IndiceBusqueda("productos", campos={"nombre": 2, "descripcion": 1},
+                            salida=("id", "nombre", "precio_venta"))
+    inicio = time.perf_counter()
+    indice.reconstruir(filas)
+    print(json.dumps({"construccion_s": round(time.perf_counter() - inicio, 2), **indice.metricas()}))
+
+    for nombre, busquedas in BUSQUEDAS.items():
+        resultado = latencias(lambda q: indice.buscar(q, 10), busquedas, args.repeticiones)
+        print(json.dumps({"busqueda": nombre, **resultado}))
+
+    nuevos = [producto(rnd, args.productos + i) for i in range(1, 1001)]
+    print(json.dumps({"operacion": "agregar", **latencias(indice.agregar, nuevos, 1)}))
+    print(json.dumps({"operacion": "quitar", **latencias(indice.quitar, [f["id"] for f in nuevos], 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Benchmark de memoria y throughput de la exportación en streaming (app/exportar.py).
+#
+# Siembra una base SQLite con `--filas` ítems de detalle y compara la exportación
+# en streaming (CSV y NDJSON) contra materializar todo con `.all()`, midiendo el
+# pico de memoria con tracemalloc.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_export --filas 1000000
+import argparse
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+
+from sqlalchemy import select
+
+from app import models
+from app.exportar import generar
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+d = models.Detalle
+COLUMNAS = ["factura_id", "producto_id", "cantidad", "precio", "importe"]
+
+
+def consulta():
+    return select(
+        d.factura_id, d.producto_id, d.cantidad, d.precio, (d.cantidad * d.precio).label("importe")
+    ).order_by(d.factura_id, d.producto_id)
+
+
+async def medir(nombre: str, corrutina) -> dict:
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    filas, bytes_ = await corrutina
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "modo": nombre,
+        "filas": filas,
+        "mb_generados": round(bytes_ / 1e6, 1),
+        "segundos": round(duracion, 2),
+        "filas_por_segundo": round(filas / duracion),
+        "pico_memoria_mb": round(pico / 1e6, 1),
+    }
+
+
+async def streaming(formato: str, session_factory):
+    filas = bytes_ = 0
+    async for trozo in generar(formato, session_factory, consulta(), COLUMNAS):
+        bytes_ += len(trozo)
+        filas += trozo.count("\n")
+    if formato == "csv":
+        filas -= 1  # Cabecera
+    return filas, bytes_
+
+
+async def materializado(session_factory):
+    # Lo que hacía GET /facturas/: traer todo y serializar un único JSON.
+    async with session_factory() as db:
+        result = await db.execute(consulta())
+        filas = [dict(f) for f in result.mappings().all()]
+    cuerpo = json.dumps(filas, default=str)
+    return len(filas), len(cuerpo)
+
+
+async def correr(args):
+    ruta = ruta_temporal()
+    engine, session_factory = await crear_base(ruta)
+    facturas = args.filas // args.items
+    await sembrar(engine, clientes=1000, productos=max(args.items, 500), facturas=facturas,
+                  items_por_factura=args.items)
+    try:
+        print(json.dumps(await medir("streaming_csv", streaming("csv", session_factory))))
+        print(json.dumps(await medir("streaming_ndjson", streaming("ndjson", session_factory))))
+        if not args.sin_materializar:
+            print(json.dumps(await medir("materializado_json", materializado(session_factory))))
+    finally:
+        await engine.dispose()
+        os.remove(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de exportación en streaming")
+    parser.add_argument("--filas", type=int, default=1_000_000, help="Ítems de detalle a generar")
+    parser.add_argument("--items", type=int, default=10, help="Ítems por factura")
+    parser.add_argument("--sin-materializar", action="store_true", help="Omite la comparación con .all()")
+    asyncio.run(correr(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Benchmark del impacto de Argon2 sobre el resto de los endpoints.
+#
+# Levanta una app FastAPI mínima con un endpoint "ping" (sin auth) y dos variantes
+# de login: una que verifica Argon2 dentro del event loop (como antes) y otra que
+# usa el pool de app/hashing.py. Mientras corre una tormenta de logins mide la
+# latencia p50/p95/p99 del ping.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_hash --logins 200 --pings 2000
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.hashing import ph, PoolHash
+
+HASH = ph.hash("admin123")
+
+
+def crear_app(pool: PoolHash) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/login-bloqueante")
+    async def login_bloqueante():
+        ph.verify(HASH, "admin123")
+        return {"ok": True}
+
+    @app.post("/login-pool")
+    async def login_pool():
+        await pool.verificar(HASH, "admin123")
+        return {"ok": True}
+
+    return app
+
+
+def percentil(valores: list[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def escenario(ruta_login: str, args, pool: PoolHash) -> dict:
+    app = crear_app(pool)
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+        latencias: list[float] = []
+
+        async def pings():
+            for _ in range(args.pings):
+                inicio = time.perf_counter()
+                await cliente.get("/ping")
+                latencias.append((time.perf_counter() - inicio) * 1000)
+
+        async def logins():
+            await asyncio.gather(*(cliente.post(ruta_login) for _ in range(args.logins)))
+
+        inicio = time.perf_counter()
+        await asyncio.gather(pings(), logins())
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "login": ruta_login,
+        "segundos": round(duracion, 3),
+        "ping_p50_ms": round(statistics.median(latencias), 3),
+        "ping_p95_ms": round(percentil(latencias, 0.95), 3),
+        "ping_p99_ms": round(percentil(latencias, 0.99), 3),
+        "pool": pool.metricas(),
+    }
+
+
+async def correr(args):
+    for tipo in ("thread", "process") if args.procesos else ("thread",):
+        for ruta in ("/login-bloqueante", "/login-pool"):
+            pool = PoolHash(ejecutor=tipo, workers=args.workers, max_concurrencia=args.workers)
+            try:
+                print(json.dumps(await escenario(ruta, args, pool)))
+            finally:
+                pool.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de endpoints no-auth durante logins")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--pings", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--procesos", action="store_true", help="Incluye también el ProcessPoolExecutor")
+    asyncio.run(correr(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
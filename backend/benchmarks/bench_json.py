@@ -0,0 +1,96 @@
+# Benchmark de serialización de listados grandes (app/serializacion.py).
+#
+# Siembra una base SQLite con productos y compara, para cada tamaño pedido,
+# tres formas de convertir un listado en el cuerpo JSON de la respuesta:
+#   orm:       entidades ORM -> ProductoOut (from_attributes) -> jsonable_encoder -> json
+#   validado:  filas de Core -> TypeAdapter(list[ProductoOut]) validate + dump_json
+#   rapido:    filas de Core -> filas_a_json (orjson o pydantic-core, sin validar)
+# Mide por separado el tiempo de la consulta y el de la serialización.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_json --filas 10000 100000
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app import models, schemas
+from app.serializacion import filas_a_json, orjson, JSON_DECIMALES
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+p = models.Producto
+_productos = TypeAdapter(list[schemas.ProductoOut])
+
+
+def serializar_orm(entidades) -> bytes:
+    modelos = [schemas.ProductoOut.model_validate(e) for e in entidades]
+    return json.dumps(jsonable_encoder(modelos)).encode()
+
+
+def serializar_validado(filas) -> bytes:
+    return _productos.dump_json(_productos.validate_python([dict(f) for f in filas]))
+
+
+async def medir(nombre: str, session_factory, limite: int, repeticiones: int) -> dict:
+    consulta_s = serializacion_s = 0.0
+    tamanio = 0
+    for _ in range(repeticiones):
+        async with session_factory() as db:
+            inicio = time.perf_counter()
+            if nombre == "orm":
+                filas = (await db.execute(select(p).order_by(p.id).limit(limite))).scalars().all()
+            else:
+                filas = (await db.execute(select(*p.__table__.c).order_by(p.id).limit(limite))).mappings().all()
+            medio = time.perf_counter()
+            if nombre == "orm":
+                cuerpo = serializar_orm(filas)
+            elif nombre == "validado":
+                cuerpo = serializar_validado(filas)
+            else:
+                cuerpo = filas_a_json(filas)
+            fin = time.perf_counter()
+        consulta_s += medio - inicio
+        serializacion_s += fin - medio
+        tamanio = len(cuerpo)
+    return {
+        "modo": nombre,
+        "filas": limite,
+        "consulta_ms": round(consulta_s / repeticiones * 1000, 1),
+        "serializacion_ms": round(serializacion_s / repeticiones * 1000, 1),
+        "total_ms": round((consulta_s + serializacion_s) / repeticiones * 1000, 1),
+        "kb": round(tamanio / 1024),
+    }
+
+
+async def correr(args):
+    ruta = ruta_temporal()
+    engine, session_factory = await crear_base(ruta)
+    await sembrar(engine, clientes=1, productos=max(args.filas), facturas=0, items_por_factura=1)
+    print(json.dumps({"orjson": orjson is not None, "decimales": JSON_DECIMALES}))
+    try:
+        for limite in args.filas:
+            resultados = [await medir(modo, session_factory, limite, args.repeticiones)
+                          for modo in ("orm", "validado", "rapido")]
+            base = resultados[0]["total_ms"]
+            for r in resultados:
+                r["aceleracion"] = round(base / r["total_ms"], 2) if r["total_ms"] else None
+                print(json.dumps(r))
+    finally:
+        await engine.dispose()
+        os.remove(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización JSON de listados")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    asyncio.run(correr(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
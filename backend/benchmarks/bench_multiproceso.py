@@ -0,0 +1,190 @@
+# Benchmark de escalado con varios workers (app/servir.py).
+#
+# Siembra una base SQLite y, para cada cantidad de workers (1, 2, 4, ... hasta
+# los núcleos), levanta la API con `python -m app.servir` en un puerto local y
+# la carga por HTTP durante `--segundos` por escenario desde `--procesos-carga`
+# procesos cliente (un solo cliente no alcanza a saturar varios workers). Mide
+# peticiones por segundo y latencia p50/p95, y la aceleración contra 1 worker.
+#
+# SQLite serializa las escrituras: `crear_factura` solo es representativo con
+# --database-url apuntando a un MySQL (la base tiene que estar sembrada).
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_multiproceso --facturas 20000 --segundos 10
+#     python -m benchmarks.bench_multiproceso --workers 1 2 4 8 --escenarios listar_productos
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+USUARIO = "usuario1"
+PASSWORD = "bench123"
+ESCENARIOS = ("listar_productos", "listar_clientes", "listar_facturas", "factura_completa", "crear_factura")
+
+
+def _peticion(cliente, escenario: str, auth: dict, rnd: random.Random, args):
+    if escenario == "listar_productos":
+        return cliente.get("/productos/", headers=auth)
+    if escenario == "listar_clientes":
+        return cliente.get("/clientes/", headers=auth)
+    if escenario == "listar_facturas":
+        return cliente.get("/facturas/", headers=auth)
+    if escenario == "factura_completa":
+        return cliente.get(f"/facturas/{rnd.randint(1, args.facturas)}/completa", headers=auth)
+    return cliente.post("/facturas/completa", headers=auth, json={
+        "cliente_id": rnd.randint(1, args.clientes),
+        "items": [{"producto_id": pid, "cantidad": 1} for pid in rnd.sample(range(1, args.productos + 1), 3)],
+    })
+
+
+async def _cargar(url: str, token: str, escenario: str, args, semilla: int) -> tuple[list[float], int]:
+    """Corre en cada proceso de carga: `args.concurrencia` clientes hasta que vence el tiempo."""
+    import httpx
+    rnd = random.Random(semilla)
+    auth = {"Authorization": f"Bearer {token}"}
+    latencias, errores = [], 0
+    fin = time.perf_counter() + args.segundos
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limites) as cliente:
+        async def trabajador():
+            nonlocal errores
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                respuesta = await _peticion(cliente, escenario, auth, rnd, args)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                if respuesta.status_code >= 400:
+                    errores += 1
+        await asyncio.gather(*(trabajador() for _ in range(args.concurrencia)))
+    return latencias, errores
+
+
+def _proceso_carga(parametros) -> tuple[list[float], int]:
+    return asyncio.run(_cargar(*parametros))
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar_listo(url: str, proceso: subprocess.Popen, timeout: float = 120) -> None:
+    import httpx
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {proceso.returncode}")
+        try:
+            if httpx.get(f"{url}/listo", timeout=2).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("El servidor no estuvo listo a tiempo")
+
+
+def medir_workers(workers: int, database_url: str, args) -> list[dict]:
+    import httpx
+    puerto = _puerto_libre()
+    url = f"http://127.0.0.1:{puerto}"
+    carpeta = tempfile.mkdtemp(prefix="bench_multiproceso_")
+    entorno = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "AGREGADOS_RECONCILIAR_CADA": "0",
+        # Se mide el throughput del servidor, no el límite de tasa.
+        "ADMISION_ACTIVA": "0",
+        "COMPARTIDO_DIR": os.path.join(carpeta, "compartido"),
+        "TRABAJOS_DIR": os.path.join(carpeta, "trabajos"),
+    }
+    comando = [sys.executable, "-m", "app.servir", "--workers", str(workers), "--port", str(puerto),
+               "--conexiones-totales", str(args.conexiones_totales), "--log-level", "warning"]
+    servidor = subprocess.Popen(comando, env=entorno)
+    resultados = []
+    try:
+        _esperar_listo(url, servidor)
+        token = httpx.post(f"{url}/token", data={"username": USUARIO, "password": PASSWORD}).json()["access_token"]
+        with multiprocessing.Pool(args.procesos_carga) as pool:
+            for escenario in args.escenarios:
+                partes = pool.map(_proceso_carga, [
+                    (url, token, escenario, args, args.semilla + i) for i in range(args.procesos_carga)
+                ])
+                latencias = [l for parte, _ in partes for l in parte]
+                errores = sum(e for _, e in partes)
+                ordenadas = sorted(latencias)
+                resultados.append({
+                    "workers": workers,
+                    "escenario": escenario,
+                    "peticiones": len(latencias),
+                    "errores": errores,
+                    "peticiones_por_segundo": round(len(latencias) / args.segundos, 1),
+                    "p50_ms": round(statistics.median(latencias), 2) if latencias else None,
+                    "p95_ms": round(ordenadas[int(len(ordenadas) * 0.95)], 2) if latencias else None,
+                })
+                print(json.dumps(resultados[-1]), file=sys.stderr)
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=60)
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+
+async def preparar(args, ruta: str) -> None:
+    from app.hashing import ph
+
+    engine, _ = await crear_base(ruta)
+    await sembrar(engine, clientes=args.clientes, productos=args.productos, facturas=args.facturas,
+                  items_por_factura=5, hashed_password=ph.hash(PASSWORD))
+    await engine.dispose()
+
+
+def main():
+    nucleos = os.cpu_count() or 1
+    potencias = [n for n in (1, 2, 4, 8, 16, 32, 64) if n < nucleos] + [nucleos]
+    parser = argparse.ArgumentParser(description="Benchmark de escalado de 1 a N workers")
+    parser.add_argument("--workers", type=int, nargs="*", default=potencias)
+    parser.add_argument("--escenarios", nargs="*", default=list(ESCENARIOS[:-1]), choices=ESCENARIOS)
+    parser.add_argument("--clientes", type=int, default=2000)
+    parser.add_argument("--productos", type=int, default=2000)
+    parser.add_argument("--facturas", type=int, default=20_000)
+    parser.add_argument("--segundos", type=float, default=10, help="Duración de cada escenario")
+    parser.add_argument("--concurrencia", type=int, default=16, help="Clientes por proceso de carga")
+    parser.add_argument("--procesos-carga", type=int, default=max(2, nucleos // 2))
+    parser.add_argument("--conexiones-totales", type=int, default=0, help="DB_CONEXIONES_TOTALES del servidor")
+    parser.add_argument("--database-url", help="Base ya sembrada (si no, una SQLite temporal)")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    ruta = None
+    database_url = args.database_url
+    if database_url is None:
+        ruta = ruta_temporal()
+        asyncio.run(preparar(args, ruta))
+        database_url = f"sqlite+aiosqlite:///{ruta}?timeout=30"
+    try:
+        resultados = [r for workers in args.workers for r in medir_workers(workers, database_url, args)]
+    finally:
+        if ruta:
+            os.remove(ruta)
+
+    # Aceleración de cada escenario contra la corrida con menos workers.
+    base = {}
+    for r in resultados:
+        base.setdefault(r["escenario"], r["peticiones_por_segundo"])
+        r["aceleracion"] = round(r["peticiones_por_segundo"] / base[r["escenario"]], 2) if base[r["escenario"]] else None
+    print(json.dumps({"nucleos": nucleos, "resultados": resultados}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Benchmark de estrés del reservador de stock (app/stock.py).
+#
+# Lanza cientos de clientes asyncio concurrentes que reservan stock de unos pocos
+# productos "calientes" contra una base SQLite local (aiosqlite) y verifica que el
+# stock nunca quede negativo ni se pierdan descuentos.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.bench_stock --clientes 500 --productos 3 --stock 1000
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.stock import ReservadorStock, StockInsuficiente, ContencionStock
+
+
+async def preparar_base(url: str, productos: int, stock_inicial: int):
+    engine = create_async_engine(url, connect_args={"timeout": 30})
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.drop_all)
+        await conn.run_sync(models.Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as session:
+        session.add_all([
+            models.Producto(
+                id=i + 1,
+                nombre=f"Producto {i + 1}",
+                descripcion="Producto de prueba",
+                stock=stock_inicial,
+                precio_compra=Decimal("1.00"),
+                precio_venta=Decimal("2.00"),
+            )
+            for i in range(productos)
+        ])
+        await session.commit()
+    return engine, session_factory
+
+
+async def correr(args, max_lote: int) -> dict:
+    fd, ruta = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine, session_factory = await preparar_base(f"sqlite+aiosqlite:///{ruta}", args.productos, args.stock)
+    reservador = ReservadorStock(session_factory=session_factory, max_lote=max_lote, ventana=args.ventana)
+
+    aplicadas = {i + 1: 0 for i in range(args.productos)}
+    rechazadas = 0
+    contenciones = 0
+    rnd = random.Random(args.semilla)
+
+    async def cliente():
+        nonlocal rechazadas, contenciones
+        for _ in range(args.pedidos):
+            producto_id = rnd.randint(1, args.productos)
+            cantidad = rnd.randint(1, 3)
+            try:
+                await reservador.reservar(producto_id, cantidad)
+                aplicadas[producto_id] += cantidad
+            except StockInsuficiente:
+                rechazadas += 1
+            except ContencionStock:
+                contenciones += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(args.clientes)))
+    duracion = time.perf_counter() - inicio
+
+    # Verificación: el stock final debe ser exactamente el inicial menos lo reservado.
+    async with session_factory() as session:
+        result = await session.execute(select(models.Producto.id, models.Producto.stock))
+        finales = dict(result.all())
+    await engine.dispose()
+    os.remove(ruta)
+
+    for producto_id, stock_final in finales.items():
+        assert stock_final >= 0, f"Stock negativo en el producto {producto_id}: {stock_final}"
+        assert args.stock - stock_final == aplicadas[producto_id], f"Descuentos perdidos en el producto {producto_id}"
+
+    total = args.clientes * args.pedidos
+    return {
+        "max_lote": max_lote,
+        "pedidos": total,
+        "aplicados": total - rechazadas - contenciones,
+        "rechazados": rechazadas,
+        "contenciones": contenciones,
+        "segundos": round(duracion, 3),
+        "pedidos_por_segundo": round(total / duracion, 1),
+        "stock_final": finales,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de estrés del reservador de stock")
+    parser.add_argument("--clientes", type=int, default=500)
+    parser.add_argument("--pedidos", type=int, default=4, help="Pedidos por cliente")
+    parser.add_argument("--productos", type=int, default=3)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--ventana", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    # Compara el modo sin lotes (un UPDATE por pedido) contra el modo con lotes.
+    for max_lote in (1, 100):
+        print(asyncio.run(correr(args, max_lote)))
+
+
+if __name__ == "__main__":
+    main()
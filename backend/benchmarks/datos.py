@@ -0,0 +1,72 @@
+# Generación de datos sintéticos para los benchmarks (SQLite local vía aiosqlite).
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+
+TANDA_INSERT = 10_000
+
+
+def ruta_temporal() -> str:
+    fd, ruta = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    return ruta
+
+
+async def crear_base(ruta: str):
+    """Crea un motor SQLite sobre `ruta` con todas las tablas vacías."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{ruta}", connect_args={"timeout": 30})
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.drop_all)
+        await conn.run_sync(models.Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    return engine, session_factory
+
+
+async def _insertar(conn, tabla, filas):
+    for i in range(0, len(filas), TANDA_INSERT):
+        await conn.execute(insert(tabla), filas[i:i + TANDA_INSERT])
+
+
+async def sembrar(engine, clientes: int, productos: int, facturas: int, items_por_factura: int,
+                  usuarios: int = 1, semilla: int = 42, hashed_password: str = "x") -> None:
+    """Inserta clientes, productos, usuarios, facturas y detalle sintéticos."""
+    rnd = random.Random(semilla)
+    inicio = datetime(2024, 1, 1)
+    items_por_factura = min(items_por_factura, productos)
+    async with engine.begin() as conn:
+        await _insertar(conn, models.Usuario.__table__, [
+            {"id": i + 1, "username": f"usuario{i + 1}", "hashed_password": hashed_password,
+             "rol": "admin" if i == 0 else "usuario"}
+            for i in range(usuarios)
+        ])
+        await _insertar(conn, models.Cliente.__table__, [
+            {"id": i + 1, "dni": 20_000_000 + i, "nombre": f"Nombre{i}", "apellido": f"Apellido{i}",
+             "direccion": f"Calle {i}", "telefono": f"11{i:08d}"}
+            for i in range(clientes)
+        ])
+        await _insertar(conn, models.Producto.__table__, [
+            {"id": i + 1, "nombre": f"Producto {i}", "descripcion": f"Descripción del producto {i}",
+             "stock": 1_000_000, "precio_compra": Decimal(rnd.randint(100, 5000)) / 100,
+             "precio_venta": Decimal(rnd.randint(5000, 9000)) / 100}
+            for i in range(productos)
+        ])
+        # Facturas y detalle se generan por tandas para no acumular todo en memoria.
+        for base in range(0, facturas, TANDA_INSERT):
+            cabeceras, items = [], []
+            for fid in range(base + 1, min(base + TANDA_INSERT, facturas) + 1):
+                fecha = inicio + timedelta(minutes=fid * 7)
+                cabeceras.append({"id": fid, "cliente_id": rnd.randint(1, clientes), "fecha": fecha,
+                                  "creado_por_usuario_id": rnd.randint(1, usuarios)})
+                for pid in rnd.sample(range(1, productos + 1), items_por_factura):
+                    items.append({"factura_id": fid, "producto_id": pid, "cantidad": rnd.randint(1, 5),
+                                  "precio": Decimal(rnd.randint(5000, 9000)) / 100, "created": fecha})
+            await _insertar(conn, models.Factura.__table__, cabeceras)
+            await _insertar(conn, models.Detalle.__table__, items)
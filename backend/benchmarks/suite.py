@@ -0,0 +1,191 @@
+# Suite de benchmarks de la API completa (app.main:app) contra una base SQLite sembrada.
+#
+# Levanta la app en el mismo proceso (httpx + ASGITransport, con el arranque y
+# apagado del lifespan), genera datos sintéticos a la escala pedida y corre cada
+# escenario midiendo throughput y latencias p50/p95/p99. El resultado se guarda
+# en JSON para poder comparar entre commits.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.suite --facturas 20000 --salida resultados.json
+#     python -m benchmarks.suite --comparar resultados_base.json --tolerancia 0.15
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+USUARIO = "usuario1"
+PASSWORD = "bench123"
+
+
+def percentil(valores: list[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+async def correr_escenario(nombre: str, peticion, cantidad: int, concurrencia: int) -> dict:
+    """Ejecuta `cantidad` veces la corrutina `peticion(i)` con `concurrencia` en paralelo."""
+    latencias: list[float] = []
+    errores = 0
+    siguiente = iter(range(cantidad))
+
+    async def trabajador():
+        nonlocal errores
+        for i in siguiente:
+            inicio = time.perf_counter()
+            respuesta = await peticion(i)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            if respuesta.status_code >= 400:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    return {
+        "escenario": nombre,
+        "peticiones": cantidad,
+        "errores": errores,
+        "segundos": round(duracion, 3),
+        "peticiones_por_segundo": round(cantidad / duracion, 1),
+        "p50_ms": round(statistics.median(latencias), 3),
+        "p95_ms": round(percentil(latencias, 0.95), 3),
+        "p99_ms": round(percentil(latencias, 0.99), 3),
+    }
+
+
+async def correr(args) -> dict:
+    ruta = ruta_temporal()
+    # La app lee DATABASE_URL al importarse, por eso se define antes de importarla.
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{ruta}?timeout=30"
+    os.environ.setdefault("AGREGADOS_RECONCILIAR_CADA", "0")
+    # Se mide la app, no el límite de tasa por usuario (app/admision.py).
+    os.environ.setdefault("ADMISION_ACTIVA", "0")
+    import httpx
+    from app.main import app
+    from app import agregados
+    from app.auth import get_password_hash
+
+    engine, session_factory = await crear_base(ruta)
+    await sembrar(engine, clientes=args.clientes, productos=args.productos, facturas=args.facturas,
+                  items_por_factura=args.items, usuarios=args.usuarios,
+                  hashed_password=get_password_hash(PASSWORD))
+    await agregados.reconciliar(session_factory)
+    await engine.dispose()
+
+    rnd = random.Random(args.semilla)
+    resultados = []
+    try:
+        async with app.router.lifespan_context(app):
+            transporte = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60) as cliente:
+                token = (await cliente.post("/token", data={"username": USUARIO, "password": PASSWORD})).json()
+                auth = {"Authorization": f"Bearer {token['access_token']}"}
+
+                escenarios = {
+                    "login": (lambda i: cliente.post(
+                        "/token", data={"username": USUARIO, "password": PASSWORD}), args.peticiones // 10),
+                    "listar_productos": (lambda i: cliente.get("/productos/", headers=auth), args.peticiones),
+                    "listar_clientes": (lambda i: cliente.get("/clientes/", headers=auth), args.peticiones),
+                    "listar_facturas": (lambda i: cliente.get("/facturas/", headers=auth), args.peticiones),
+                    "crear_factura": (lambda i: cliente.post("/facturas/completa", headers=auth, json={
+                        "cliente_id": rnd.randint(1, args.clientes),
+                        "items": [{"producto_id": pid, "cantidad": 1}
+                                  for pid in rnd.sample(range(1, args.productos + 1), args.items)],
+                    }), args.peticiones // 2),
+                    "detalle_factura": (lambda i: cliente.get(
+                        f"/facturas/{rnd.randint(1, args.facturas)}/detalle", headers=auth), args.peticiones),
+                    "factura_completa": (lambda i: cliente.get(
+                        f"/facturas/{rnd.randint(1, args.facturas)}/completa", headers=auth), args.peticiones),
+                    "reporte_ventas": (lambda i: cliente.get(
+                        "/facturas/reporte/ventas-por-cliente", headers=auth), args.peticiones // 10),
+                }
+                for nombre, (peticion, cantidad) in escenarios.items():
+                    if args.escenarios and nombre not in args.escenarios:
+                        continue
+                    resultado = await correr_escenario(nombre, peticion, max(cantidad, 1), args.concurrencia)
+                    print(json.dumps(resultado), file=sys.stderr)
+                    resultados.append(resultado)
+    finally:
+        os.remove(ruta)
+
+    return {
+        "commit": _commit_actual(),
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "escala": {"clientes": args.clientes, "productos": args.productos, "facturas": args.facturas,
+                   "items_por_factura": args.items},
+        "concurrencia": args.concurrencia,
+        "resultados": resultados,
+    }
+
+
+def _commit_actual() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> list[str]:
+    """
+    Devuelve los escenarios cuyo p95 o throughput empeoraron más que la tolerancia,
+    o cuya tasa de errores subió (un error más rápido no es una mejora).
+    """
+    anteriores = {r["escenario"]: r for r in base["resultados"]}
+    regresiones = []
+    for r in actual["resultados"]:
+        previo = anteriores.get(r["escenario"])
+        if previo is None:
+            continue
+        if r["p95_ms"] > previo["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{r['escenario']}: p95 {previo['p95_ms']} -> {r['p95_ms']} ms")
+        if r["peticiones_por_segundo"] < previo["peticiones_por_segundo"] * (1 - tolerancia):
+            regresiones.append(
+                f"{r['escenario']}: {previo['peticiones_por_segundo']} -> {r['peticiones_por_segundo']} req/s")
+        tasa, tasa_previa = r["errores"] / r["peticiones"], previo["errores"] / previo["peticiones"]
+        if tasa > tasa_previa:
+            regresiones.append(
+                f"{r['escenario']}: errores {previo['errores']}/{previo['peticiones']} -> {r['errores']}/{r['peticiones']}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de la API")
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--facturas", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=5, help="Ítems por factura")
+    parser.add_argument("--usuarios", type=int, default=5)
+    parser.add_argument("--peticiones", type=int, default=1000, help="Peticiones por escenario")
+    parser.add_argument("--concurrencia", type=int, default=20)
+    parser.add_argument("--escenarios", nargs="*", help="Solo corre estos escenarios")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    args = parser.parse_args()
+
+    resultado = asyncio.run(correr(args))
+    salida = json.dumps(resultado, indent=2)
+    if args.salida:
+        with open(args.salida, "w") as archivo:
+            archivo.write(salida)
+    else:
+        print(salida)
+
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            regresiones = comparar(resultado, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESIÓN {regresion}", file=sys.stderr)
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
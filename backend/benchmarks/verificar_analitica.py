@@ -0,0 +1,82 @@
+# Verificación de GET /analitica/ventas (app/analitica.py) con orjson.
+#
+# Siembra una base SQLite, recorre todas las combinaciones de `por` y `periodo`
+# (además de `top` y un rango de fechas) y falla (exit 1) si alguna respuesta no
+# es 200 o no es JSON válido. El resultado de `agrupar` sale de arreglos de numpy:
+# si se cuela un escalar de numpy en las filas, orjson no lo serializa y el
+# endpoint responde 500.
+#
+# Uso (desde backend/):
+#     python -m benchmarks.verificar_analitica --facturas 5000
+import argparse
+import asyncio
+import os
+import sys
+
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+PASSWORD = "bench123"
+
+
+async def verificar(args, ruta: str) -> int:
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{ruta}?timeout=30"
+    os.environ.setdefault("AGREGADOS_RECONCILIAR_CADA", "0")
+    # Se mide la app, no el límite de tasa por usuario (app/admision.py).
+    os.environ.setdefault("ADMISION_ACTIVA", "0")
+    import httpx
+    from app.main import app
+    from app import analitica, serializacion
+    from app.auth import get_password_hash
+    if analitica.np is None or serializacion.orjson is None:
+        sys.exit("Hace falta numpy y orjson instalados para esta verificación.")
+
+    engine, _ = await crear_base(ruta)
+    await sembrar(engine, clientes=args.clientes, productos=args.productos, facturas=args.facturas,
+                  items_por_factura=5, usuarios=2, hashed_password=get_password_hash(PASSWORD))
+    await engine.dispose()
+
+    urls = [f"/analitica/ventas?por={por}&periodo={periodo}"
+            for por in analitica.DIMENSIONES for periodo in analitica.PERIODOS]
+    urls += [
+        "/analitica/ventas?por=producto&periodo=mes&top=5",
+        "/analitica/ventas?por=cliente&periodo=dia&desde=2024-01-05&hasta=2024-01-06",
+    ]
+
+    fallas = 0
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://verificar") as cliente:
+            r = await cliente.post("/token", data={"username": "usuario1", "password": PASSWORD})
+            cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+            for url in urls:
+                respuesta = await cliente.get(url, headers=cabeceras)
+                try:
+                    filas = respuesta.json() if respuesta.status_code == 200 else None
+                except ValueError:
+                    filas = None
+                estado = "ok" if filas is not None else "FALLA"
+                fallas += filas is None
+                detalle = f"{len(filas)} filas" if filas is not None else respuesta.text[:120]
+                print(f"[{estado}] {url} -> {respuesta.status_code} ({detalle})")
+    return fallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica que /analitica/ventas responda con orjson")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--productos", type=int, default=100)
+    parser.add_argument("--facturas", type=int, default=5000)
+    args = parser.parse_args()
+
+    ruta = ruta_temporal()
+    try:
+        fallas = asyncio.run(verificar(args, ruta))
+    finally:
+        os.remove(ruta)
+
+    print(f"\n{fallas} consultas con error.")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
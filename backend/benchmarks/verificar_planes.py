@@ -0,0 +1,141 @@
+# Verificación de planes de ejecución de las consultas de los routers.
+#
+# Siembra una base SQLite con el esquema de app/models.py (incluidos sus índices),
+# recorre los endpoints principales capturando cada sentencia SQL que ejecutan y
+# corre EXPLAIN QUERY PLAN sobre cada una. Falla (exit 1) si alguna recorre una
+# tabla completa sin LIMIT y la tabla no está en PERMITIDOS (ni es una lectura simple
+# de una tabla de CARGAS_COMPLETAS).
+#
+# Uso (desde backend/):
+#     python -m benchmarks.verificar_planes --facturas 20000
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+
+from benchmarks.datos import ruta_temporal, crear_base, sembrar
+
+PASSWORD = "bench123"
+
+# Tablas que se pueden recorrer completas, con el motivo.
+PERMITIDOS = {
+    "ventas_diarias_cliente": "reporte sin rango de fechas: es la tabla agregada (clientes × días), no `detalle`",
+}
+# Tablas que se pueden leer completas solo con un SELECT simple (sin WHERE, JOIN ni
+# GROUP BY): así una consulta de los routers que las recorra sigue fallando.
+CARGAS_COMPLETAS = {
+    "productos": "carga del índice de búsqueda al iniciar (app/busqueda.py): lee el catálogo una vez",
+    "clientes": "carga del índice de búsqueda al iniciar (app/busqueda.py): lee el catálogo una vez",
+}
+
+PATRON_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+def _es_recorrido_completo(detalle: str, sentencia: str) -> str | None:
+    """Devuelve la tabla recorrida completa, o None si el paso del plan está bien."""
+    coincidencia = PATRON_SCAN.match(detalle)
+    if not coincidencia or detalle.startswith("SCAN CONSTANT ROW"):
+        return None
+    tabla = coincidencia.group(1)
+    # Un recorrido con LIMIT (paginación por clave) se corta después de pocas filas.
+    if re.search(r"\bLIMIT\b", sentencia, re.IGNORECASE):
+        return None
+    alias = re.search(rf"\b(\w+) AS {tabla}\b", sentencia)
+    tabla = alias.group(1) if alias else tabla
+    if tabla in CARGAS_COMPLETAS and not re.search(r"\b(WHERE|JOIN|GROUP BY)\b", sentencia, re.IGNORECASE):
+        return None
+    return None if tabla in PERMITIDOS else tabla
+
+
+async def capturar_sentencias(args, ruta: str) -> list[tuple[str, tuple]]:
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{ruta}?timeout=30"
+    os.environ.setdefault("AGREGADOS_RECONCILIAR_CADA", "0")
+    # Se mide la app, no el límite de tasa por usuario (app/admision.py).
+    os.environ.setdefault("ADMISION_ACTIVA", "0")
+    import httpx
+    from sqlalchemy import event
+    from app.main import app
+    from app import agregados
+    from app.auth import get_password_hash
+    from app.db import engine as engine_app
+
+    engine, session_factory = await crear_base(ruta)
+    await sembrar(engine, clientes=args.clientes, productos=args.productos, facturas=args.facturas,
+                  items_por_factura=5, usuarios=2, hashed_password=get_password_hash(PASSWORD))
+    await agregados.reconciliar(session_factory)
+    await engine.dispose()
+
+    capturadas: dict[str, tuple] = {}
+
+    @event.listens_for(engine_app.sync_engine, "before_cursor_execute")
+    def _capturar(conn, cursor, statement, parameters, context, executemany):
+        if re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT INTO \w+ \([^)]*\) SELECT)", statement, re.IGNORECASE):
+            capturadas.setdefault(statement, tuple(parameters) if not executemany else tuple(parameters[0]))
+
+    async with app.router.lifespan_context(app):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://verificar") as cliente:
+            async def token(usuario):
+                r = await cliente.post("/token", data={"username": usuario, "password": PASSWORD})
+                return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            admin, normal = await token("usuario1"), await token("usuario2")
+            peticiones = [
+                ("GET", "/clientes/", admin, None),
+                ("GET", "/clientes/?nombre=Nombre1&limite=10", admin, None),
+                ("GET", "/productos/?nombre=Producto&con_stock=true", admin, None),
+                ("GET", "/facturas/", admin, None),
+                ("GET", "/facturas/", normal, None),
+                ("GET", "/facturas/?desde=2024-01-05T00:00:00&hasta=2024-01-06T00:00:00", admin, None),
+                ("GET", "/facturas/?cliente_id=3", admin, None),
+                ("GET", "/facturas/10/detalle", admin, None),
+                ("GET", "/facturas/10/pdf/", admin, None),
+                ("GET", "/facturas/10/completa", admin, None),
+                ("GET", "/facturas/completas?ids=1,2,3,4,5", normal, None),
+                ("GET", "/facturas/reporte/ventas-por-cliente", admin, None),
+                ("GET", "/facturas/reporte/ventas-por-cliente?desde=2024-01-01&hasta=2024-01-31&top=10", admin, None),
+                ("POST", "/facturas/completa", admin,
+                 {"cliente_id": 1, "items": [{"producto_id": 1, "cantidad": 1}, {"producto_id": 2, "cantidad": 2}]}),
+                ("POST", "/facturas/10/items", admin, {"producto_id": args.productos, "cantidad": 1}),
+            ]
+            for metodo, url, cabeceras, cuerpo in peticiones:
+                respuesta = await cliente.request(metodo, url, headers=cabeceras, json=cuerpo)
+                if respuesta.status_code >= 400:
+                    print(f"AVISO {metodo} {url} -> {respuesta.status_code}", file=sys.stderr)
+
+    return list(capturadas.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica que las consultas de los routers usen índices")
+    parser.add_argument("--clientes", type=int, default=2000)
+    parser.add_argument("--productos", type=int, default=500)
+    parser.add_argument("--facturas", type=int, default=20_000)
+    args = parser.parse_args()
+
+    ruta = ruta_temporal()
+    try:
+        sentencias = asyncio.run(capturar_sentencias(args, ruta))
+        conexion = sqlite3.connect(ruta)
+        conexion.execute("ANALYZE")
+        fallas = 0
+        for sentencia, parametros in sentencias:
+            plan = [fila[3] for fila in conexion.execute(f"EXPLAIN QUERY PLAN {sentencia}", parametros)]
+            tablas = [t for t in (_es_recorrido_completo(paso, sentencia) for paso in plan) if t]
+            estado = "FALLA" if tablas else "ok"
+            fallas += bool(tablas)
+            print(f"[{estado}] {' '.join(sentencia.split())[:160]}")
+            for paso in plan:
+                print(f"        {paso}")
+        conexion.close()
+    finally:
+        os.remove(ruta)
+
+    print(f"\n{len(sentencias)} sentencias verificadas, {fallas} con recorridos completos.")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
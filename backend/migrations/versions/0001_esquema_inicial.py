@@ -0,0 +1,74 @@
+"""Esquema inicial (el que hasta ahora se creaba a mano).
+
+En una base existente no hace falta aplicarla: alcanza con
+`alembic stamp 0001_esquema_inicial`.
+
+Revision ID: 0001_esquema_inicial
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_esquema_inicial"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "usuarios",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("username", sa.String(45), nullable=False, unique=True),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("rol", sa.String(10), nullable=False),
+    )
+    op.create_table(
+        "clientes",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("dni", sa.Integer, nullable=False, unique=True),
+        sa.Column("nombre", sa.String(45), nullable=False),
+        sa.Column("apellido", sa.String(45), nullable=False),
+        sa.Column("direccion", sa.String(60)),
+        sa.Column("telefono", sa.String(20)),
+    )
+    op.create_table(
+        "productos",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("nombre", sa.String(60), nullable=False, unique=True),
+        sa.Column("descripcion", sa.String(100), nullable=False),
+        sa.Column("stock", sa.Integer, nullable=False),
+        sa.Column("precio_compra", sa.Numeric(11, 2), nullable=False),
+        sa.Column("precio_venta", sa.Numeric(11, 2), nullable=False),
+    )
+    op.create_table(
+        "factura",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("cliente_id", sa.Integer, sa.ForeignKey("clientes.id"), nullable=False),
+        sa.Column("fecha", sa.DateTime, nullable=False),
+        sa.Column("creado_por_usuario_id", sa.Integer, sa.ForeignKey("usuarios.id"), nullable=True),
+    )
+    op.create_table(
+        "detalle",
+        sa.Column("factura_id", sa.Integer, sa.ForeignKey("factura.id"), primary_key=True),
+        sa.Column("producto_id", sa.Integer, sa.ForeignKey("productos.id"), primary_key=True),
+        sa.Column("cantidad", sa.Integer, nullable=False),
+        sa.Column("precio", sa.Numeric(11, 2), nullable=False),
+        sa.Column("created", sa.DateTime, nullable=False),
+    )
+    op.create_table(
+        "ventas_diarias_cliente",
+        sa.Column("cliente_id", sa.Integer, sa.ForeignKey("clientes.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("dia", sa.Date, primary_key=True),
+        sa.Column("total", sa.Numeric(14, 2), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ventas_diarias_cliente")
+    op.drop_table("detalle")
+    op.drop_table("factura")
+    op.drop_table("productos")
+    op.drop_table("clientes")
+    op.drop_table("usuarios")
@@ -0,0 +1,39 @@
+"""Índices secundarios para los patrones de consulta de los routers.
+
+Revision ID: 0002_indices_consultas
+Revises: 0001_esquema_inicial
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_indices_consultas"
+down_revision = "0001_esquema_inicial"
+branch_labels = None
+depends_on = None
+
+# (nombre, tabla, columnas). Deben coincidir con los `__table_args__` de app/models.py.
+INDICES = [
+    ("ix_factura_usuario_fecha", "factura", ["creado_por_usuario_id", "fecha"]),
+    ("ix_factura_fecha_id", "factura", ["fecha", "id"]),
+    ("ix_factura_cliente_id", "factura", ["cliente_id"]),
+    ("ix_detalle_producto_id", "detalle", ["producto_id"]),
+    ("ix_clientes_nombre", "clientes", ["nombre"]),
+    ("ix_clientes_apellido", "clientes", ["apellido"]),
+    ("ix_ventas_diarias_dia", "ventas_diarias_cliente", ["dia"]),
+]
+
+
+def upgrade() -> None:
+    # Si la app arrancó antes de migrar, agregados.crear_tabla() ya creó
+    # ventas_diarias_cliente con su índice: los que ya existen se saltean.
+    inspector = sa.inspect(op.get_bind())
+    for nombre, tabla, columnas in INDICES:
+        if any(indice["name"] == nombre for indice in inspector.get_indexes(tabla)):
+            continue
+        op.create_index(nombre, tabla, columnas)
+
+
+def downgrade() -> None:
+    for nombre, tabla, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla)
@@ -0,0 +1,90 @@
+// Suscripcion al flujo de cambios del backend (GET /cambios, Server-Sent Events).
+// Se usa fetch en lugar de EventSource porque EventSource no puede mandar el token.
+const API_URL = 'http://127.0.0.1:8000';
+
+// aplica un cambio a una lista de filas con `id` (alta, modificacion o baja)
+export function aplicarCambio(filas, cambio) {
+  const { accion, datos } = cambio;
+  if (accion === 'baja') {
+    const ids = new Set(datos.ids);
+    return filas.filter(fila => !ids.has(fila.id));
+  }
+  if (accion === 'alta' || accion === 'modificacion') {
+    // el alta propia ya esta en la lista (se agrego con la respuesta del POST)
+    const existe = filas.some(fila => fila.id === datos.id);
+    return existe
+      ? filas.map(fila => (fila.id === datos.id ? { ...fila, ...datos } : fila))
+      : [...filas, datos];
+  }
+  if (accion === 'stock') {
+    const cambios = new Map(datos.items.map(item => [item.id, item.cambio]));
+    return filas.map(fila => (cambios.has(fila.id) ? { ...fila, stock: fila.stock + cambios.get(fila.id) } : fila));
+  }
+  return filas;
+}
+
+// abre la conexion y llama a `alCambiar(cambio)` por cada evento, o a `alReiniciar()`
+// cuando hay que volver a pedir los listados. Se reconecta sola desde el ultimo id
+// (`<epoca>-<seq>`, se guarda tal cual: si el servidor se reinicio responde `reiniciar`).
+// Devuelve una funcion que corta la suscripcion.
+export function suscribirCambios(recursos, alCambiar, alReiniciar) {
+  const controlador = new AbortController();
+  let ultimoId = null;
+
+  const procesar = (bloque) => {
+    let evento = 'message';
+    let datos = '';
+    for (const linea of bloque.split('\n')) {
+      if (linea.startsWith('event: ')) evento = linea.slice(7);
+      else if (linea.startsWith('data: ')) datos += linea.slice(6);
+      else if (linea.startsWith('id: ')) ultimoId = linea.slice(4);
+    }
+    if (evento === 'cambio') {
+      const cambio = JSON.parse(datos);
+      if (cambio.accion === 'recarga') alReiniciar(cambio.recurso);
+      else alCambiar(cambio);
+    } else if (evento === 'reiniciar') {
+      alReiniciar(null);
+    }
+  };
+
+  const conectar = async () => {
+    while (!controlador.signal.aborted) {
+      let cortada = true;
+      try {
+        const token = localStorage.getItem('authToken');
+        const parametros = new URLSearchParams({ recursos: recursos.join(',') });
+        if (ultimoId !== null) parametros.set('desde', ultimoId);
+        const respuesta = await fetch(`${API_URL}/cambios/?${parametros}`, {
+          headers: { Authorization: `Bearer ${token}` },
+          signal: controlador.signal,
+        });
+        if (!respuesta.ok) throw new Error(`HTTP ${respuesta.status}`);
+
+        const lector = respuesta.body.pipeThrough(new TextDecoderStream()).getReader();
+        let pendiente = '';
+        for (;;) {
+          const { value, done } = await lector.read();
+          // el servidor corta cada tanto la conexion: se reconecta enseguida desde `ultimoId`
+          if (done) { cortada = false; break; }
+          pendiente += value;
+          // los mensajes SSE terminan con una linea en blanco
+          let fin;
+          while ((fin = pendiente.indexOf('\n\n')) >= 0) {
+            procesar(pendiente.slice(0, fin));
+            pendiente = pendiente.slice(fin + 2);
+          }
+        }
+      } catch (err) {
+        if (controlador.signal.aborted) return;
+        console.warn('Se cortó el flujo de cambios, reintentando:', err.message);
+        cortada = true;
+      }
+      // tras un error espera un poco antes de reconectar (el servidor sugiere 3 segundos)
+      if (cortada) await new Promise(resolver => setTimeout(resolver, 3000));
+    }
+  };
+
+  conectar();
+  return () => controlador.abort();
+}
@@ -1,5 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios'; 
+import { aplicarCambio, suscribirCambios } from '../cambios';
+import { traerTodasLasPaginas } from '../paginacion';
 
 const API_URL = 'http://127.0.0.1:8000';
 
@@ -29,8 +31,7 @@ function PaginaCliente() {
     try {
       const token = localStorage.getItem('authToken');
       const authHeaders = { headers: { Authorization: `Bearer ${token}` } };
-      const response = await axios.get(`${API_URL}/clientes/`, authHeaders);
-      setClientes(response.data);
+      setClientes(await traerTodasLasPaginas(`${API_URL}/clientes/`, authHeaders));
     } catch (err) {
       setError('Error al cargar los clientes: ' + err.message);
     }
@@ -38,6 +39,12 @@ function PaginaCliente() {
 
   useEffect(() => {
     fetchClientes();
+    // altas, modificaciones y bajas de otros usuarios llegan por el flujo de cambios
+    return suscribirCambios(
+      ['clientes'],
+      (cambio) => setClientes(actuales => aplicarCambio(actuales, cambio)),
+      () => fetchClientes()
+    );
   }, []);
 
   // --- 4. FUNCIÓN 'handleChange' (sin cambios) ---
@@ -1,5 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
+import { aplicarCambio, suscribirCambios } from '../cambios';
+import { traerTodasLasPaginas } from '../paginacion';
 
 const API_URL = 'http://127.0.0.1:8000';
 
@@ -8,6 +10,9 @@ function PaginaFacturas() {
   const [clientes, setClientes] = useState([]);
   const [productos, setProductos] = useState([]);
   const [listaFacturas, setListaFacturas] = useState([]);
+  // clave de idempotencia de la factura que se esta enviando: si la peticion se corta
+  // y se reintenta, el backend devuelve la misma factura en vez de crear otra
+  const idempotencyKey = useRef(null);
   
   // estados para manejar el formulario de nueva factura
   const [selectedClientId, setSelectedClientId] = useState('');
@@ -35,15 +40,10 @@ function PaginaFacturas() {
         }
         const authHeaders = { headers: { Authorization: `Bearer ${token}` } };
 
-        // pide los clientes, productos y facturas al backend
-        const clientesRes = await axios.get(`${API_URL}/clientes/`, authHeaders);
-        setClientes(clientesRes.data);
-        
-        const productosRes = await axios.get(`${API_URL}/productos/`, authHeaders);
-        setProductos(productosRes.data);
-
-        const facturasRes = await axios.get(`${API_URL}/facturas/`, authHeaders);
-        setListaFacturas(facturasRes.data);
+        // pide los clientes, productos y facturas al backend (todas las paginas)
+        setClientes(await traerTodasLasPaginas(`${API_URL}/clientes/`, authHeaders));
+        setProductos(await traerTodasLasPaginas(`${API_URL}/productos/`, authHeaders));
+        setListaFacturas(await traerTodasLasPaginas(`${API_URL}/facturas/`, authHeaders));
         
       } catch (err) {
         const errorMsg = err.response ? err.response.data.detail : err.message;
@@ -51,8 +51,36 @@ function PaginaFacturas() {
       }
     };
     loadInitialData();
+
+    // en vez de recargar la pagina, se aplican los cambios que manda el backend:
+    // facturas nuevas, stock descontado, clientes y productos de otros usuarios
+    const alCambiar = (cambio) => {
+      if (cambio.recurso === 'clientes') {
+        setClientes(actuales => aplicarCambio(actuales, cambio));
+      } else if (cambio.recurso === 'productos') {
+        setProductos(actuales => aplicarCambio(actuales, cambio));
+      } else if (cambio.accion === 'alta') {
+        // la lista va de la mas nueva a la mas vieja
+        setListaFacturas(actuales => (
+          actuales.some(f => f.id === cambio.datos.id) ? actuales : [cambio.datos, ...actuales]
+        ));
+      } else if (cambio.accion === 'baja') {
+        // modificacion (un item agregado) no cambia nada de lo que muestra la lista
+        setListaFacturas(actuales => aplicarCambio(actuales, cambio));
+      }
+    };
+    return suscribirCambios(['clientes', 'productos', 'facturas'], alCambiar, () => loadInitialData());
   }, []);
 
+  // las facturas que llegan por el flujo traen el cliente_id: el nombre sale de la lista de clientes
+  const nombreCliente = (factura) => {
+    if (factura.cliente_nombre !== undefined) {
+      return `${factura.cliente_nombre} ${factura.cliente_apellido}`;
+    }
+    const cliente = clientes.find(c => c.id === factura.cliente_id);
+    return cliente ? `${cliente.nombre} ${cliente.apellido}` : `Cliente #${factura.cliente_id}`;
+  };
+
   // funcion para agregar un producto al carrito de la factura
   const handleAddItemToCart = () => {
     const productoId = parseInt(currentItemId);
@@ -111,34 +139,40 @@ function PaginaFacturas() {
       }
       const authHeaders = { headers: { Authorization: `Bearer ${token}` } };
 
-      // primero, crea la factura para obtener un id
-      const facturaData = { cliente_id: parseInt(selectedClientId) };
-      const facturaRes = await axios.post(`${API_URL}/facturas/`, facturaData, authHeaders);
-      
+      // crea la factura con todos los productos del carrito en una sola peticion
+      const facturaData = {
+        cliente_id: parseInt(selectedClientId),
+        items: cart.map(item => ({
+          producto_id: item.producto_id,
+          cantidad: item.cantidad,
+        })),
+      };
+      if (!idempotencyKey.current) {
+        idempotencyKey.current = crypto.randomUUID();
+      }
+      const facturaRes = await axios.post(`${API_URL}/facturas/completa`, facturaData, {
+        headers: { ...authHeaders.headers, 'Idempotency-Key': idempotencyKey.current },
+      });
+      idempotencyKey.current = null;
+
       const newFacturaId = facturaRes.data.factura_id;
       if (!newFacturaId) {
         throw new Error('No se pudo obtener el ID de la nueva factura.');
       }
 
-      // despues, agrega cada producto del carrito a esa factura (FastAPI maneja bien sin / aquí)
-      await Promise.all(
-        cart.map(item =>
-          axios.post(`${API_URL}/facturas/${newFacturaId}/items`, {
-            producto_id: item.producto_id,
-            cantidad: item.cantidad,
-          }, authHeaders),
-        ),
-      );
-
       // si todo sale bien, muestra un mensaje y limpia el formulario
       setSuccessMessage(`¡Factura #${newFacturaId} creada con éxito!`);
       setLoading(false);
       setCart([]);
       setSelectedClientId('');
-      window.location.reload();
+      // la factura nueva y el stock descontado llegan por el flujo de cambios
 
     } catch (err) {
       setLoading(false);
+      // si el backend respondio, la operacion ya termino: el proximo envio es una factura nueva
+      if (err.response) {
+        idempotencyKey.current = null;
+      }
       const errorMessage = err.response ? JSON.stringify(err.response.data.detail) : err.message;
       setError('Error al crear la factura: ' + errorMessage);
     }
@@ -340,7 +374,7 @@ function PaginaFacturas() {
                   hour: '2-digit', minute: '2-digit', second: '2-digit'
                 })}
               </td>
-              <td>{factura.cliente_nombre} {factura.cliente_apellido}</td>
+              <td>{nombreCliente(factura)}</td>
               <td>{factura.creador_username}</td>
               <td style={{ textAlign: 'center' }}>
                 <button onClick={() => handleViewDetails(factura.id)} className="btn btn-primary" style={{marginRight: '5px'}}>Ver Detalle</button>
@@ -1,5 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios'; 
+import { aplicarCambio, suscribirCambios } from '../cambios';
+import { traerTodasLasPaginas } from '../paginacion';
 
 const API_URL = 'http://127.0.0.1:8000';
 
@@ -29,8 +31,7 @@ function PaginaProductos() {
       const token = localStorage.getItem('authToken');
       const authHeaders = { headers: { Authorization: `Bearer ${token}` } };
       
-      const response = await axios.get(`${API_URL}/productos/`, authHeaders);
-      setProductos(response.data);
+      setProductos(await traerTodasLasPaginas(`${API_URL}/productos/`, authHeaders));
     } catch (err) {
       setError('Error al cargar los productos: ' + err.message);
     }
@@ -38,6 +39,13 @@ function PaginaProductos() {
 
   useEffect(() => {
     fetchProductos();
+    // los cambios de otros usuarios (y el stock que descuentan las facturas) llegan
+    // por el flujo de cambios: no hace falta volver a pedir la tabla entera
+    return suscribirCambios(
+      ['productos'],
+      (cambio) => setProductos(actuales => aplicarCambio(actuales, cambio)),
+      () => fetchProductos()
+    );
   }, []);
 
   // --- 2. FUNCIÓN 'handleChange' (Maneja cambios en el formulario) ---
@@ -0,0 +1,21 @@
+// Los listados del backend (/clientes, /productos, /facturas) vienen paginados:
+// cada respuesta trae en la cabecera X-Siguiente-Cursor el cursor de la pagina
+// siguiente (vacia si no hay mas).
+import axios from 'axios';
+
+// el maximo que acepta el backend (LIMITE_MAXIMO en app/paginacion.py)
+const LIMITE_PAGINA = 1000;
+
+// pide todas las paginas de un listado y devuelve las filas juntas
+export async function traerTodasLasPaginas(url, config = {}) {
+  const filas = [];
+  let cursor = '';
+  do {
+    const params = { ...config.params, limite: LIMITE_PAGINA };
+    if (cursor) params.cursor = cursor;
+    const respuesta = await axios.get(url, { ...config, params });
+    filas.push(...respuesta.data);
+    cursor = respuesta.headers['x-siguiente-cursor'];
+  } while (cursor);
+  return filas;
+}